@@ -0,0 +1,154 @@
+"""Response cache.
+
+In-memory cache of data objects along with the HTTP validators (ETag,
+Last-Modified) and freshness lifetime (Cache-Control max-age) of the response
+they were built from. Stale entries are revalidated with a conditional request
+and reused when the server answers 304 Not Modified.
+"""
+import re
+import threading
+import time
+
+from collections import OrderedDict as odict
+
+
+_MAX_AGE = re.compile(r'(?:^|,)\s*(?:s-)?max-age\s*=\s*"?(\d+)"?', re.I)
+
+
+def cache_control(headers):
+    """Return the freshness lifetime from the Cache-Control header.
+
+    Args:
+      - headers: response headers.
+
+    Returns:
+      A tuple (cacheable, max_age). max_age is the number of seconds the
+      response stays fresh, corrected for its Age, or None when the response
+      does not specify it.
+    """
+    value = headers.get('Cache-Control') or ''
+    directives = [d.strip().lower() for d in value.split(',')]
+    if 'no-store' in directives:
+        return False, None
+    if 'no-cache' in directives:
+        return True, 0
+    match = _MAX_AGE.search(value)
+    if not match:
+        return True, None
+    try:
+        age = int(headers.get('Age') or 0)
+    except ValueError:
+        age = 0
+    return True, max(0, int(match.group(1)) - age)
+
+
+class CacheEntry(object):
+    """Cached data object with the validators of its response.
+
+    - value: the cached data object.
+    - etag: value of the ETag response header, if any.
+    - last_modified: value of the Last-Modified response header, if any.
+    - expires: UNIX time at which the entry becomes stale.
+    """
+    __slots__ = ('value', 'etag', 'last_modified', 'expires')
+
+    def __init__(self, value, etag=None, last_modified=None, expires=0):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    @property
+    def fresh(self):
+        """Return True when the entry can be used without revalidation."""
+        return time.time() < self.expires
+
+    @property
+    def validators(self):
+        """Return the headers of a conditional request revalidating this
+        entry."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache(object):
+    """Thread-safe LRU cache of data objects and their validators.
+
+    Args:
+      - ttl: freshness lifetime in seconds of responses without a
+        Cache-Control max-age (default: 0, always revalidate).
+      - maxsize: maximum number of entries (unbounded if None).
+    """
+    def __init__(self, ttl=0, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = odict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the entry for key or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = self._entries.pop(key)
+            return entry
+
+    def update(self, key, value, headers):
+        """Store a data object with the validators of its response.
+
+        Args:
+          - key: cache key.
+          - value: data object built from the response.
+          - headers: response headers.
+
+        Returns:
+          The new entry, or None when the response may not be stored.
+        """
+        cacheable, max_age = cache_control(headers)
+        if not cacheable:
+            self.remove(key)
+            return None
+        entry = CacheEntry(value, headers.get('ETag'),
+                           headers.get('Last-Modified'),
+                           time.time() + self._max_age(max_age))
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while self.maxsize is not None and \
+                    len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def revalidated(self, entry, headers):
+        """Extend the lifetime of an entry after a 304 Not Modified response.
+
+        Args:
+          - entry: the revalidated entry.
+          - headers: headers of the 304 response.
+        """
+        _, max_age = cache_control(headers)
+        entry.etag = headers.get('ETag') or entry.etag
+        entry.last_modified = headers.get('Last-Modified') or \
+            entry.last_modified
+        entry.expires = time.time() + self._max_age(max_age)
+
+    def remove(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _max_age(self, max_age):
+        return self.ttl if max_age is None else max_age
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
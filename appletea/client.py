@@ -0,0 +1,160 @@
+"""Client utilities.
+
+Shared client helpers for the appletea REST clients.
+"""
+import json
+
+from appletea import deadline as deadlines
+from appletea import transport as transports
+from appletea.exceptions import DeadlineExceeded
+
+
+def _json_loads(content):
+    if isinstance(content, bytes) and not isinstance(content, str):
+        content = content.decode('utf-8')
+    return json.loads(content)
+
+
+def _orjson_loads():
+    import orjson
+    return orjson.loads
+
+
+def _simdjson_loads():
+    import simdjson
+    return simdjson.loads
+
+
+# JSON decoders in order of preference. Each entry returns a function decoding
+# a JSON document from raw response bytes or raises ImportError.
+DECODERS = [
+    ('orjson', _orjson_loads),
+    ('simdjson', _simdjson_loads),
+    ('json', lambda: _json_loads),
+]
+
+_loads = None
+decoder = None
+
+
+def set_decoder(name=None):
+    """Select the JSON decoder used for API responses.
+
+    Args:
+      - name: one of 'orjson', 'simdjson' or 'json' (the standard library
+        decoder), or None to pick the fastest decoder that is installed.
+
+    Raises:
+      A ValueError if the decoder is unknown, an ImportError if it is not
+      installed.
+    """
+    global _loads, decoder
+    names = [n for n, _ in DECODERS]
+    if name is not None and name not in names:
+        raise ValueError('Unknown JSON decoder "%s", expected one of: %s' %
+                         (name, ', '.join(names)))
+    for n, factory in DECODERS:
+        if name in (None, n):
+            try:
+                _loads = factory()
+            except ImportError:
+                if name is not None:
+                    raise
+                continue
+            decoder = n
+            return
+
+
+def loads(content):
+    """Decode a JSON document.
+
+    Args:
+      - content: JSON document as bytes (or text).
+
+    Returns:
+      The decoded document.
+
+    Raises:
+      A ValueError when the document is not valid JSON.
+    """
+    return _loads(content)
+
+
+def decode(response):
+    """Decode the JSON body of a response straight from its raw bytes.
+
+    Args:
+      - response: a requests.Response object.
+
+    Returns:
+      The decoded JSON body.
+    """
+    return _loads(response.content)
+
+
+def cache_key(url, params=None):
+    """Return the cache key of a GET request."""
+    return (url, tuple(sorted((params or {}).items())))
+
+
+def get(url, parse, params=None, cache=None, timeout=5, transport=None,
+        key=None, deadline=None):
+    """Send a GET request and return the data object built from its response.
+
+    With a cache, fresh entries are returned without request, stale entries
+    are revalidated with a conditional request (If-None-Match and
+    If-Modified-Since) and reused when the server answers 304 Not Modified.
+
+    Args:
+      - url: request URL.
+      - parse: function building the data object from the response.
+      - params: query parameters.
+      - cache: an optional appletea.cache.ResponseCache.
+      - timeout: connect and read timeout in seconds.
+      - transport: an appletea.transport transport (requests if None).
+      - key: cache key of the request (see cache_key if None).
+      - deadline: an appletea.deadline.Deadline bounding the request (the
+        current deadline if None). The timeout is reduced to the time left.
+
+    Returns:
+      The data object.
+
+    Raises:
+      A requests.HTTPError when a bad request is made (a 4xx client error
+      or 5xx server error response), a DeadlineExceeded when the deadline
+      passes before the response is received.
+    """
+    entry = None
+    if cache is not None:
+        if key is None:
+            key = cache_key(url, params)
+        entry = cache.get(key)
+        if entry is not None and entry.fresh:
+            return entry.value
+
+    if deadline is None:
+        deadline = deadlines.current()
+    if deadline is not None:
+        timeout = deadline.timeout(timeout)
+
+    transport = transport or transports.DEFAULT
+    headers = entry.validators if entry is not None else None
+    try:
+        response = transport.get(url, params=params, headers=headers,
+                                 timeout=timeout)
+    except Exception:
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceeded('Deadline exceeded requesting %s' % url)
+        raise
+    if headers and response.status_code == 304:
+        cache.revalidated(entry, response.headers)
+        return entry.value
+    response.raise_for_status()
+
+    value = parse(response)
+    if cache is not None:
+        cache.update(key, value, response.headers)
+    return value
+
+
+set_decoder()
@@ -0,0 +1,185 @@
+"""Deadlines.
+
+A deadline bounds the total time of a call made of several requests, e.g.
+get_ipinfo followed by get_forecast and the blocks the forecast fetches when
+read. The timeout of every request is derived from the time left, and a
+deadline can be cancelled to abandon the outstanding work.
+"""
+import threading
+import time
+
+from appletea.exceptions import DeadlineExceeded
+from appletea.utils import UnicodeMixin
+
+try:
+    _clock = time.monotonic
+except AttributeError:  # Python 2
+    _clock = time.time
+
+
+_local = threading.local()
+
+
+class Deadline(UnicodeMixin):
+    """Deadline object.
+
+    A deadline is passed to the entry points of appletea (get_forecast,
+    get_ipinfo, get_events, get_weather ...) or made current for the calls of
+    a thread with a with statement, which also covers the blocks a forecast
+    fetches when read:
+
+      with Deadline(2.0) as deadline:
+          info = get_ipinfo(ip)
+          forecast = get_forecast(key, *info.coordinates)
+          hourly = forecast.hourly
+
+    Requests are sent with the smaller of their usual timeout and the time
+    left, and are not sent at all once the deadline has passed or was
+    cancelled: a DeadlineExceeded is raised instead. Cached responses that
+    are still fresh are returned regardless.
+
+    Args:
+      - timeout: number of seconds from now until the deadline (no deadline
+        if None, the calls can still be cancelled).
+      - parent: optional deadline this deadline does not outlive; cancelling
+        the parent cancels this deadline.
+      - clock: function returning the current time in seconds.
+    """
+    def __init__(self, timeout=None, parent=None, clock=_clock):
+        self._clock = clock
+        self.expires = None if timeout is None else clock() + timeout
+        if parent is not None and parent.expires is not None and \
+                (self.expires is None or parent.expires < self.expires):
+            self.expires = parent.expires
+        self._cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+        if parent is not None:
+            parent.add_callback(self.cancel)
+
+    @property
+    def cancelled(self):
+        """Return True when the deadline was cancelled."""
+        return self._cancelled
+
+    @property
+    def expired(self):
+        """Return True when the deadline has passed or was cancelled."""
+        return self.remaining() == 0
+
+    def remaining(self):
+        """Return the number of seconds left, or None without deadline."""
+        if self._cancelled:
+            return 0
+        if self.expires is None:
+            return None
+        return max(0, self.expires - self._clock())
+
+    def timeout(self, default=None):
+        """Return the timeout of a request.
+
+        Args:
+          - default: usual timeout of the request in seconds (None for no
+            timeout).
+
+        Returns:
+          The smaller of default and the number of seconds left.
+
+        Raises:
+          A DeadlineExceeded when the deadline has passed or was cancelled.
+        """
+        remaining = self.check()
+        if remaining is None:
+            return default
+        if default is None:
+            return remaining
+        return min(default, remaining)
+
+    def check(self):
+        """Return the number of seconds left (see remaining).
+
+        Raises:
+          A DeadlineExceeded when the deadline has passed or was cancelled.
+        """
+        remaining = self.remaining()
+        if remaining == 0:
+            raise DeadlineExceeded('Cancelled' if self._cancelled else
+                                   'Deadline exceeded')
+        return remaining
+
+    def child(self, timeout=None):
+        """Return a deadline for part of a call.
+
+        Args:
+          - timeout: number of seconds from now until the deadline of the
+            part, which is never later than this deadline.
+
+        Returns:
+          A Deadline object, cancelled along with this deadline.
+        """
+        return Deadline(timeout, parent=self, clock=self._clock)
+
+    def cancel(self):
+        """Cancel the calls bound by this deadline and its children."""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        """Register a function called without arguments on cancellation
+        (immediately if the deadline was cancelled already)."""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def __enter__(self):
+        _stack().append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _stack().remove(self)
+
+    def __unicode__(self):
+        remaining = self.remaining()
+        if remaining is None:
+            return '<Deadline instance without deadline>'
+        return '<Deadline instance: %.3f s remaining>' % remaining
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current():
+    """Return the current deadline of the thread, or None."""
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def timeout(default, deadline=None):
+    """Return the timeout of a request.
+
+    Args:
+      - default: usual timeout of the request in seconds.
+      - deadline: deadline of the request (the current deadline if None).
+
+    Returns:
+      The timeout in seconds, default without deadline.
+
+    Raises:
+      A DeadlineExceeded when the deadline has passed or was cancelled.
+    """
+    if deadline is None:
+        deadline = current()
+    if deadline is None:
+        return default
+    return deadline.timeout(default)
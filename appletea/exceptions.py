@@ -7,3 +7,18 @@ Exception classes for appletea.
 class HTTPError(Exception):
     """Raised when HTTP request fails."""
     pass
+
+
+class SerializationError(Exception):
+    """Raised when a serialized object cannot be read."""
+    pass
+
+
+class RateLimitError(Exception):
+    """Raised when a request exceeds the rate limit."""
+    pass
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call runs out of time or is cancelled."""
+    pass
@@ -9,7 +9,13 @@ returning (where available):
 
 More information: https://developer.forecast.io
 """
-from appletea.forecastio.api import get_forecast
+from appletea.forecastio.alerts import AlertStore
+from appletea.forecastio.api import get_forecast, stream_forecast
+from appletea.forecastio.backfill import Backfill
+from appletea.forecastio.export import ForecastExporter
+from appletea.forecastio.grid import ForecastGrid
+from appletea.forecastio.scheduler import PrefetchScheduler
 
 
-__all__ = ['get_forecast']
+__all__ = ['get_forecast', 'stream_forecast', 'AlertStore', 'Backfill',
+           'ForecastExporter', 'ForecastGrid', 'PrefetchScheduler']
@@ -0,0 +1,186 @@
+"""Alert store.
+
+Deduplicates the severe weather alerts of many forecasts across locations and
+polls, and reports which alerts were added or removed between polls.
+"""
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+from appletea.forecastio.models import Alert
+from appletea.utils import UnicodeMixin
+
+
+AlertChanges = collections.namedtuple('AlertChanges', ['added', 'removed'])
+
+
+def alert_key(json):
+    """Return the key identifying an alert.
+
+    Args:
+      - json: alert object of a forecast response.
+
+    Returns:
+      The uri of the alert, or a (title, expires) tuple if it has none.
+    """
+    return json.get('uri') or (json.get('title'), json.get('expires'))
+
+
+class AlertStore(UnicodeMixin):
+    """Alert store object.
+
+    An alert store holds one Alert object per distinct alert, however many
+    locations and polls report it, together with the locations reporting it:
+
+      store = AlertStore()
+      for forecast in forecasts:
+          store.update(forecast)
+      changes = store.poll()
+      for alert in changes.added:
+          notify(alert, store.locations(alert))
+
+    An alert is removed from the store when it expires, or when no location
+    reports it anymore (e.g. when it is cancelled). An alert whose content
+    changes is reported as removed and added again.
+
+    Args:
+      - clock: function returning the current UNIX time.
+    """
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._alerts = {}
+        self._locations = {}
+        self._sites = {}
+        self._expiry = []
+        self._seq = itertools.count()
+        self._added = collections.OrderedDict()
+        self._removed = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, forecast):
+        """Update the alerts of the location of a forecast.
+
+        Args:
+          - forecast: Forecast object.
+        """
+        alerts = [alert.json for alert in forecast.alerts]
+        location = (forecast.json.get('latitude'),
+                    forecast.json.get('longitude'))
+        self.report(location, alerts)
+
+    def report(self, location, alerts):
+        """Replace the alerts reported for a location.
+
+        Args:
+          - location: hashable location, e.g. a (latitude, longitude) tuple.
+          - alerts: list of alert objects of a forecast response.
+        """
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            keys = set()
+            for json in alerts:
+                expires = json.get('expires')
+                if expires is not None and expires <= now:
+                    continue
+                key = alert_key(json)
+                keys.add(key)
+                alert = self._alerts.get(key)
+                if alert is not None and alert.json == json:
+                    continue
+                if alert is not None:
+                    self._mark(self._added, self._removed, key, alert)
+                alert = self._alerts[key] = Alert(json)
+                if expires is not None:
+                    heapq.heappush(self._expiry,
+                                   (expires, next(self._seq), key))
+                self._mark(self._removed, self._added, key, alert)
+
+            old = self._sites.get(location, set())
+            for key in keys - old:
+                self._locations.setdefault(key, set()).add(location)
+            for key in old - keys:
+                self._locations[key].discard(location)
+                if not self._locations[key]:
+                    self._remove(key)
+            if keys:
+                self._sites[location] = keys
+            else:
+                self._sites.pop(location, None)
+
+    def poll(self):
+        """Return the alerts added and removed since the last poll.
+
+        Returns:
+          An AlertChanges (added, removed) tuple of lists of Alert objects.
+        """
+        with self._lock:
+            self._evict(self._clock())
+            changes = AlertChanges(list(self._added.values()),
+                                   list(self._removed.values()))
+            self._added.clear()
+            self._removed.clear()
+        return changes
+
+    def alerts(self, location):
+        """Return the alerts reported for a location.
+
+        Returns:
+          A list of Alert objects.
+        """
+        with self._lock:
+            self._evict(self._clock())
+            return [self._alerts[key] for key in self._sites.get(location, ())]
+
+    def locations(self, alert):
+        """Return the locations reporting an alert.
+
+        Args:
+          - alert: Alert object or alert key.
+
+        Returns:
+          A set of locations.
+        """
+        key = alert_key(alert.json) if isinstance(alert, Alert) else alert
+        with self._lock:
+            return set(self._locations.get(key, ()))
+
+    def __contains__(self, key):
+        return key in self._alerts
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._alerts.values()))
+
+    def __len__(self):
+        return len(self._alerts)
+
+    def __unicode__(self):
+        return '<AlertStore instance with %d alerts>' % len(self)
+
+    def _mark(self, undo, changes, key, alert):
+        # Record a change, cancelling out the opposite change of the same
+        # alert since the last poll.
+        other = undo.get(key)
+        if other is not None and other.json == alert.json:
+            del undo[key]
+        else:
+            changes[key] = alert
+
+    def _remove(self, key):
+        alert = self._alerts.pop(key)
+        for location in self._locations.pop(key, ()):
+            keys = self._sites[location]
+            keys.discard(key)
+            if not keys:
+                del self._sites[location]
+        self._mark(self._added, self._removed, key, alert)
+
+    def _evict(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, _, key = heapq.heappop(self._expiry)
+            alert = self._alerts.get(key)
+            if alert is not None and alert.json.get('expires') == expires:
+                self._remove(key)
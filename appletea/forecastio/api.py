@@ -2,18 +2,39 @@
 
 A REST client library for forecast.io APIs.
 """
-import requests
+import calendar
+import datetime
 
 from collections import OrderedDict as odict
-from appletea.forecastio.models import Forecast
+from appletea import client
+from appletea import deadline as deadlines
+from appletea.forecastio import profiles, stream
+from appletea.forecastio import units as conversions
+from appletea.forecastio.models import Forecast, ProfiledForecast
 
 
-def get_forecast(key, latitude, longitude, **kwargs):
+BASE_URL = 'https://api.forecast.io/forecast'
+
+# Number of bytes read from the socket at a time by stream_forecast.
+CHUNK_SIZE = 4096
+
+# Default transport sending the requests of calls without transport (see
+# appletea.transport), requests (HTTP/1.1) if None. Set to an HTTP2Transport
+# to multiplex concurrent requests over one HTTP/2 connection.
+TRANSPORT = None
+
+
+def get_forecast(key, latitude, longitude, cache=None, profile=None,
+                 deadline=None, time=None, transport=None, **kwargs):
     """Return weather forecast for a given location.
 
     Return a weather forecast object for a given location. The key should be
     your Dark Sky API key, latitude and longitude should be the geographic
-    coordinates of a location in decimal degrees. Additional arguments can be:
+    coordinates of a location in decimal degrees. With a time, the observed
+    or forecast conditions of the day of that time at the location are
+    returned instead (a Time Machine request), e.g. the hourly and daily
+    data of the local day for time=datetime.date(2015, 6, 1). Additional
+    arguments can be:
 
       - units=[setting]: return the API response in units rather than the
         default Imperial units. Following settings are possible: 'us', 'si',
@@ -30,6 +51,26 @@ def get_forecast(key, latitude, longitude, **kwargs):
       - key: Dark Sky API key.
       - latitude: geographic latitude coordinates in decimal degrees.
       - longitude: geographic longitude coordinated in decimal degrees.
+      - cache: an optional appletea.cache.ResponseCache. Cached forecasts are
+        reused while fresh and revalidated with a conditional request once
+        stale. Forecasts in the unit systems 'us', 'si', 'ca' and 'uk2' share
+        one cache entry, a cached forecast is converted to the requested
+        units (see Forecast.convert): numbers are converted, text such as
+        summaries stays in the units of the cached response.
+      - profile: name of a block usage profile, or True to use the calling
+        line as profile. Once the profile has observed which blocks are read,
+        the other blocks are excluded from the request (unless exclude is
+        given). See appletea.forecastio.profiles.
+      - deadline: an optional appletea.deadline.Deadline bounding the request.
+        Blocks fetched when read are bounded by the current deadline of the
+        reading thread.
+      - time: an optional time in the past or future, as UNIX time, as an
+        aware datetime, or as a naive datetime, date or string
+        ([YYYY]-[MM]-[DD]T[HH]:[MM]:[SS]) in the local time of the location
+        (midnight for a date).
+      - transport: transport sending the request (see appletea.transport),
+        TRANSPORT if None. Blocks fetched when read are sent by it and
+        cached in cache as well.
       - kwargs: additional arguments passed as params to requests.get.
 
     Returns:
@@ -37,13 +78,108 @@ def get_forecast(key, latitude, longitude, **kwargs):
 
     Raises:
       A request.HTTPError when a bad request is made (a 4xx client error
-      or 5xx server error response).
+      or 5xx server error response), a DeadlineExceeded when the deadline
+      passes first.
+    """
+    if profile is True:
+        profile = profiles.call_site()
+    if profile is not None and 'exclude' not in kwargs:
+        exclude = profiles.default.exclude(profile)
+        if exclude:
+            kwargs['exclude'] = exclude
+
+    url = _url(key, latitude, longitude, time)
+    transport = transport or TRANSPORT
+
+    def parse(response):
+        return Forecast(client.decode(response), response, cache=cache,
+                        transport=transport)
+
+    cache_key, shared = _cache_key(url, kwargs)
+    forecast = client.get(url, parse, params=odict(kwargs), cache=cache,
+                          transport=transport, key=cache_key,
+                          deadline=deadline)
+    if cache is not None and shared and forecast.units is not None:
+        forecast = forecast.convert(kwargs.get('units', 'us'))
+    if profile is not None:
+        forecast = ProfiledForecast(forecast,
+                                    profiles.default.recorder(profile))
+    return forecast
+
+
+def stream_forecast(key, latitude, longitude, deadline=None, time=None,
+                    transport=None, **kwargs):
+    """Return the weather forecast for a given location as it is received.
+
+    The response is parsed as its bytes arrive, and the current conditions,
+    the data points and the alerts are returned one by one, so that the
+    current conditions can be used before the rest of a large forecast (e.g.
+    extend=hourly) is downloaded. Only the part of the response not yet
+    parsed is held in memory:
+
+      for name, value in stream_forecast(key, latitude, longitude,
+                                         extend='hourly'):
+          if name == 'currently':
+              render(value)
+
+    Responses are not cached. See get_forecast for the arguments. With a
+    deadline (or current deadline), a DeadlineExceeded is raised once it
+    passes, after the items received so far.
+
+    Returns:
+      A generator of (name, value) items in the order of the response, e.g.
+      ('currently', ForecastioDataPoint) or ('hourly', ForecastioDataPoint).
+      See appletea.forecastio.stream.ForecastParser for all items.
+
+    Raises:
+      A request.HTTPError when a bad request is made (a 4xx client error
+      or 5xx server error response), a ValueError when the response is not
+      a valid forecast.
     """
-    response = requests.get('https://api.forecast.io/forecast/%s/%s,%s' %
-                            (key, latitude, longitude), timeout=5,
-                            params=odict(kwargs))
-    response.raise_for_status()
+    if deadline is None:
+        deadline = deadlines.current()
+    url = _url(key, latitude, longitude, time)
+    transport = transport or TRANSPORT or client.transports.DEFAULT
+    response = transport.get(url, params=odict(kwargs), stream=True,
+                             timeout=deadlines.timeout(5, deadline))
+    try:
+        response.raise_for_status()
+        chunks = response.iter_content(CHUNK_SIZE)
+        if deadline is not None:
+            chunks = _bounded(chunks, deadline)
+        for item in stream.parse(chunks):
+            yield item
+    finally:
+        response.close()
+
+
+def _cache_key(url, params):
+    # Return the cache key of a forecast request, and whether its entry is
+    # shared by the unit systems (converted to the requested units).
+    if params.get('units', 'us') in conversions.SYSTEMS and \
+            'flags' not in params.get('exclude', ''):
+        return client.cache_key(url, dict(
+            (k, v) for k, v in params.items() if k != 'units')), True
+    return client.cache_key(url, params), False
+
+
+def _url(key, latitude, longitude, time=None):
+    url = '%s/%s/%s,%s' % (BASE_URL, key, latitude, longitude)
+    if time is None:
+        return url
+    if isinstance(time, datetime.datetime):
+        if time.tzinfo is not None:
+            time = calendar.timegm(time.utctimetuple())
+        else:
+            time = time.replace(microsecond=0).isoformat()
+    elif isinstance(time, datetime.date):
+        time = '%sT00:00:00' % time.isoformat()
+    elif isinstance(time, (int, float)):
+        time = int(time)
+    return '%s,%s' % (url, time)
 
-    json = response.json()
 
-    return Forecast(json, response)
+def _bounded(chunks, deadline):
+    for chunk in chunks:
+        deadline.check()
+        yield chunk
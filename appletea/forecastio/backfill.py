@@ -0,0 +1,311 @@
+"""Historical backfill.
+
+Fetches the Time Machine forecasts of many sites over a range of days into a
+columnar export (see appletea.forecastio.export), one request per site and
+day:
+
+  backfill = Backfill(key, 'archive/hourly', sites,
+                      datetime.date(2014, 1, 1), datetime.date(2016, 1, 1),
+                      concurrency=8, rate=1000 / 86400.0, units='si')
+  result = backfill.run(limit=1000)
+
+Progress is checkpointed next to the export every time a part file is
+written. An interrupted backfill resumes where it stopped: days already in
+the export are not fetched again, and a part file the backfill was writing
+when it stopped is removed by the next run (its days are fetched again).
+Other files of the export are never removed.
+"""
+import collections
+import datetime
+import itertools
+import json
+import os
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from appletea.exceptions import RateLimitError
+from appletea.forecastio import api, export
+from appletea.utils import UnicodeMixin
+
+
+Job = collections.namedtuple('Job', ['latitude', 'longitude', 'day'])
+BackfillResult = collections.namedtuple('BackfillResult',
+                                        ['done', 'failed', 'remaining'])
+
+# Name of the checkpoint file in the export directory.
+CHECKPOINT = 'checkpoint.jsonl'
+
+_BLOCKS = ('currently', 'minutely', 'hourly', 'daily', 'alerts', 'flags')
+
+# Statuses of errors that fail every following request as well.
+_FATAL = frozenset([401, 403, 429])
+
+
+def _fatal(error):
+    if isinstance(error, RateLimitError):
+        return True
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) in _FATAL
+
+
+class Backfill(UnicodeMixin):
+    """Backfill object.
+
+    Plans one job per site and day, from start up to (not including) end,
+    and fetches the forecast of each job (get_forecast with the day as time)
+    into an export of one data block. Days are fetched in order, all sites of
+    a day before the next day.
+
+    Failed jobs are reported by run and fetched again by the next run. An
+    invalid key or an exhausted quota (401, 403 and 429 responses, or a
+    RateLimitError) stops the run.
+
+    A backfill only appends to an export it started (one with a checkpoint
+    or without part files).
+
+    Args:
+      - key: Dark Sky API key.
+      - path: directory of the export (see ForecastExporter).
+      - sites: iterable of (latitude, longitude) tuples.
+      - start: first day, a datetime.date.
+      - end: day after the last day, a datetime.date.
+      - block: data block to export.
+      - fields: data point properties to export (see ForecastExporter).
+      - format: format of the export (see ForecastExporter).
+      - concurrency: maximum number of simultaneous requests.
+      - rate: maximum number of requests per second (unlimited if None), e.g.
+        1000 / 86400.0 for a quota of 1000 requests a day.
+      - chunk_size: number of rows per part file, and so between checkpoints.
+      - clock: function returning the current time in seconds.
+      - sleep: function waiting a number of seconds.
+      - kwargs: additional arguments passed to get_forecast, e.g. units.
+        Unless given, exclude excludes all blocks but the exported one.
+
+    Raises:
+      A ValueError when block is unknown, or when the export holds part files
+      but no checkpoint.
+    """
+    def __init__(self, key, path, sites, start, end, block='hourly',
+                 fields=None, format=None, concurrency=4, rate=None,
+                 chunk_size=65536, clock=time.time, sleep=time.sleep,
+                 **kwargs):
+        if block not in export.FIELDS:
+            raise ValueError('Unknown data block "%s", expected one of: %s' %
+                             (block, ', '.join(sorted(export.FIELDS))))
+        self.key = key
+        self.path = path
+        self.sites = [tuple(site) for site in sites]
+        self.start = start
+        self.end = end
+        self.block = block
+        self.fields = fields
+        self.format = format
+        self.concurrency = concurrency
+        self.rate = rate
+        self.chunk_size = chunk_size
+        kwargs.setdefault('exclude', ','.join(b for b in _BLOCKS
+                                              if b != block))
+        self.kwargs = kwargs
+        self._clock = clock
+        self._sleep = sleep
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        self._done = self._load()[0]
+
+    def jobs(self):
+        """Return a generator of all jobs (Job tuples) in order."""
+        day = self.start
+        while day < self.end:
+            for latitude, longitude in self.sites:
+                yield Job(latitude, longitude, day)
+            day += datetime.timedelta(days=1)
+
+    def pending(self):
+        """Return a generator of the jobs not yet in the export."""
+        for job in self.jobs():
+            if (job.latitude, job.longitude,
+                    job.day.isoformat()) not in self._done:
+                yield job
+
+    def run(self, limit=None):
+        """Fetch pending jobs into the export.
+
+        Args:
+          - limit: maximum number of jobs to fetch (all pending jobs if
+            None), e.g. the requests left in the quota of the day.
+
+        Returns:
+          A BackfillResult (done, failed, remaining) tuple: the number of
+          jobs fetched, a list of (job, exception) tuples of the failed jobs
+          and the number of jobs left.
+
+        Raises:
+          The error of a request that fails every following request as well
+          (see above), once the jobs fetched so far are checkpointed.
+        """
+        jobs = self.pending()
+        if limit is not None:
+            jobs = itertools.islice(jobs, limit)
+        self._recover()
+        exporter = export.ForecastExporter(
+            self.path, block=self.block, fields=self.fields,
+            format=self.format, chunk_size=None)
+        tasks = queue.Queue(self.concurrency * 2)
+        results = queue.Queue()
+        stopped = threading.Event()
+
+        def feed():
+            for job in itertools.chain(jobs, [None] * self.concurrency):
+                while True:
+                    if stopped.is_set():
+                        return
+                    try:
+                        tasks.put(job, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+
+        def work():
+            while not stopped.is_set():
+                try:
+                    job = tasks.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if job is None:
+                    break
+                try:
+                    self._pace()
+                    forecast = api.get_forecast(
+                        self.key, job.latitude, job.longitude, time=job.day,
+                        **self.kwargs)
+                except Exception as e:
+                    if _fatal(e):
+                        stopped.set()
+                    results.put((job, None, e))
+                else:
+                    results.put((job, forecast, None))
+            results.put(None)
+
+        threads = [threading.Thread(target=feed)] + [
+            threading.Thread(target=work) for _ in range(self.concurrency)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        count, rows, done, failed, fatal = 0, 0, [], [], None
+        running = self.concurrency
+        try:
+            while running:
+                result = results.get()
+                if result is None:
+                    running -= 1
+                    continue
+                job, forecast, error = result
+                if error is not None:
+                    failed.append((job, error))
+                    if fatal is None and _fatal(error):
+                        fatal = error
+                    continue
+                rows += exporter.write(forecast, job.latitude, job.longitude)
+                done.append(job)
+                count += 1
+                if rows >= self.chunk_size:
+                    self._flush(exporter, done, rows)
+                    rows = 0
+        finally:
+            stopped.set()
+            self._flush(exporter, done, rows)
+        if fatal is not None:
+            raise fatal
+        return BackfillResult(count, failed, sum(1 for _ in self.pending()))
+
+    def _pace(self):
+        # Wait for the next request slot allowed by the rate.
+        if self.rate is None:
+            return
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            self._sleep(slot - now)
+
+    def _load(self):
+        # Return the jobs recorded in the checkpoint, the part files started
+        # but not recorded, and the length of the complete lines of the
+        # checkpoint.
+        path = os.path.join(self.path, CHECKPOINT)
+        if not os.path.exists(path):
+            if export._parts(self.path):
+                raise ValueError('Export %s holds part files but no %s' %
+                                 (self.path, CHECKPOINT))
+            return set(), [], 0
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        # Ignore a line cut short by a crash.
+        end = data.rfind(b'\n') + 1
+        done, started = set(), collections.OrderedDict()
+        for line in data[:end].decode('utf-8').splitlines():
+            entry = json.loads(line)
+            if 'started' in entry:
+                started[entry['started']] = True
+            elif 'removed' in entry:
+                started.pop(entry['removed'], None)
+            else:
+                started.pop(entry['part'], None)
+                for latitude, longitude, day in entry['jobs']:
+                    done.add((latitude, longitude, day))
+        return done, list(started), end
+
+    def _recover(self):
+        # Remove the part files started but not recorded in the checkpoint,
+        # and the line of the checkpoint cut short by a crash.
+        _, started, end = self._load()
+        path = os.path.join(self.path, CHECKPOINT)
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            with open(path, 'rb+') as fp:
+                fp.truncate(end)
+        for name in started:
+            for p in (name, export._TEMP % name):
+                p = os.path.join(self.path, p)
+                if os.path.exists(p):
+                    os.remove(p)
+            self._append({'removed': name})
+
+    def _flush(self, exporter, jobs, rows):
+        # Write the buffered rows of jobs to a part file and record it.
+        part = None
+        if rows:
+            # Recorded first, so that a part file left by a crash is known
+            # to be ours.
+            self._append({'started': exporter.next_part})
+            part = exporter.flush()
+        self._checkpoint(part, jobs)
+
+    def _checkpoint(self, part, jobs):
+        # Record the jobs whose rows were written to part (None if they had
+        # none left to write).
+        if not jobs and part is None:
+            return
+        self._append({'part': part, 'jobs': [
+            [job.latitude, job.longitude, job.day.isoformat()]
+            for job in jobs]})
+        for job in jobs:
+            self._done.add((job.latitude, job.longitude, job.day.isoformat()))
+        del jobs[:]
+
+    def _append(self, entry):
+        with open(os.path.join(self.path, CHECKPOINT), 'ab') as fp:
+            fp.write(json.dumps(entry, separators=(',', ':')).encode('utf-8'))
+            fp.write(b'\n')
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def __unicode__(self):
+        return '<Backfill instance: %d sites from %s to %s>' % (
+            len(self.sites), self.start, self.end)
@@ -0,0 +1,385 @@
+"""Columnar export.
+
+Streams the data points of forecasts into columnar files, for archiving and
+analysis, and reads them back as NumPy arrays. Parquet files are written when
+pyarrow is installed, NumPy .npz files otherwise.
+
+An export is a directory of part files holding one row per data point, with
+the location of its forecast:
+
+  with ForecastExporter('archive/hourly') as exporter:
+      for forecast in forecasts:
+          exporter.write(forecast)
+
+  columns = read_columns('archive/hourly', ['latitude', 'time',
+                                            'temperature'])
+
+Rows are buffered up to chunk_size and then written to a new part file, so
+memory use does not grow with the size of the export. An exporter opened on
+an existing export appends part files to it. A part file only appears under
+its final name once complete, so exports can be read while being written.
+"""
+import array
+import collections
+import os
+import re
+
+from appletea.forecastio import resample as resampling
+from appletea.forecastio.models import Forecast, ForecastioDataBlock
+from appletea.utils import UnicodeMixin
+
+
+FORMATS = ('parquet', 'npz')
+
+# Data point properties holding text; all others are numbers.
+TEXT_FIELDS = frozenset(['summary', 'icon', 'precipType'])
+
+_POINT_FIELDS = (
+    'summary', 'icon', 'precipType', 'precipIntensity',
+    'precipIntensityError', 'precipProbability', 'precipAccumulation',
+    'temperature', 'apparentTemperature', 'dewPoint', 'humidity', 'pressure',
+    'windSpeed', 'windGust', 'windBearing', 'cloudCover', 'uvIndex',
+    'visibility', 'ozone', 'nearestStormDistance', 'nearestStormBearing',
+)
+
+_DAILY_FIELDS = (
+    'summary', 'icon', 'precipType', 'sunriseTime', 'sunsetTime',
+    'moonPhase', 'precipIntensity', 'precipIntensityMax',
+    'precipIntensityMaxTime', 'precipProbability', 'precipAccumulation',
+    'temperatureMin', 'temperatureMinTime', 'temperatureMax',
+    'temperatureMaxTime', 'apparentTemperatureMin',
+    'apparentTemperatureMinTime', 'apparentTemperatureMax',
+    'apparentTemperatureMaxTime', 'dewPoint', 'humidity', 'pressure',
+    'windSpeed', 'windGust', 'windBearing', 'cloudCover', 'uvIndex',
+    'visibility', 'ozone',
+)
+
+# Data point properties exported by default for every data block.
+FIELDS = {
+    'currently': _POINT_FIELDS,
+    'minutely': _POINT_FIELDS,
+    'hourly': _POINT_FIELDS,
+    'daily': _DAILY_FIELDS,
+}
+
+# Columns preceding the data point properties in every export.
+_KEYS = ('latitude', 'longitude', 'time')
+
+_PART = re.compile(r'^part-(\d+)\.(parquet|npz)$')
+# Name of a part file while it is written.
+_TEMP = '.%s.tmp'
+_TEXT = (str, type(u''))
+# Suffix of the tables of distinct values of text columns in .npz files.
+_TABLE = '.values'
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet export requires pyarrow, '
+                          'install it with: pip install pyarrow')
+    return pyarrow
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('Columnar export requires pyarrow or numpy, '
+                          'install one with: pip install pyarrow')
+    return numpy
+
+
+def _default_format():
+    try:
+        _pyarrow()
+    except ImportError:
+        _numpy()
+        return 'npz'
+    return 'parquet'
+
+
+def _parts(path):
+    # Return the (index, format, name) of the part files of an export.
+    if not os.path.isdir(path):
+        return []
+    parts = []
+    for name in os.listdir(path):
+        match = _PART.match(name)
+        if match:
+            parts.append((int(match.group(1)), match.group(2), name))
+    return sorted(parts)
+
+
+def _format(parts):
+    formats = set(f for _, f, _ in parts)
+    if len(formats) > 1:
+        raise ValueError('Export mixes formats: %s' %
+                         ', '.join(sorted(formats)))
+    return formats.pop() if formats else None
+
+
+class ForecastExporter(UnicodeMixin):
+    """Forecast exporter object.
+
+    Writes one data block of every forecast to an export (see above). Each
+    row holds the latitude and longitude of the forecast, the time of the
+    data point (an integer) and the fields of the data point. Missing
+    numbers are NaN and missing text is an empty string. Data points without
+    a time are skipped.
+
+    Args:
+      - path: directory of the export, created if missing.
+      - block: data block to export ('currently', 'minutely', 'hourly' or
+        'daily').
+      - fields: data point properties to export (see FIELDS for the
+        default).
+      - format: 'parquet' or 'npz'. Defaults to the format of the existing
+        export, or to Parquet when pyarrow is installed.
+      - chunk_size: number of rows per part file, or None to write part
+        files on flush only.
+
+    Raises:
+      A ValueError when block or format is unknown, or when format differs
+      from the format of the existing export. An ImportError when the library
+      needed for the format is not installed.
+    """
+    def __init__(self, path, block='hourly', fields=None, format=None,
+                 chunk_size=65536):
+        if block not in FIELDS:
+            raise ValueError('Unknown data block "%s", expected one of: %s' %
+                             (block, ', '.join(sorted(FIELDS))))
+        parts = _parts(path)
+        existing = _format(parts)
+        if format is None:
+            format = existing or _default_format()
+        if format not in FORMATS:
+            raise ValueError('Unknown format "%s", expected one of: %s' %
+                             (format, ', '.join(FORMATS)))
+        if existing not in (None, format):
+            raise ValueError('Export %s holds %s files' % (path, existing))
+        if format == 'parquet':
+            _pyarrow()
+        else:
+            _numpy()
+
+        self.path = path
+        self.block = block
+        self.format = format
+        self.chunk_size = chunk_size
+        self.fields = _KEYS + tuple(
+            f for f in (fields or FIELDS[block]) if f not in _KEYS)
+        self.rows = 0
+        self.parts = []
+        self._index = parts[-1][0] + 1 if parts else 0
+        self._clear()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def write(self, data, latitude=None, longitude=None):
+        """Add the data points of a forecast to the export.
+
+        Args:
+          - data: a Forecast, or a ForecastioDataBlock of the exported block.
+            Missing blocks of a forecast are not fetched.
+          - latitude: latitude of the data points (defaults to the latitude
+            of the forecast).
+          - longitude: longitude of the data points (defaults to the
+            longitude of the forecast).
+
+        Returns:
+          The number of rows added.
+
+        Raises:
+          A TypeError when data is neither a Forecast nor a data block. A
+          ValueError when the location of the data points is unknown.
+        """
+        if isinstance(data, ForecastioDataBlock):
+            points = [p.d for p in data.data]
+        elif isinstance(data, Forecast):
+            json = data.json
+            if latitude is None:
+                latitude = json.get('latitude')
+            if longitude is None:
+                longitude = json.get('longitude')
+            block = json.get(self.block)
+            if not isinstance(block, dict):
+                points = []
+            elif self.block == 'currently':
+                points = [block]
+            else:
+                points = block.get('data', [])
+        else:
+            raise TypeError('Expected a Forecast or ForecastioDataBlock')
+        if latitude is None or longitude is None:
+            raise ValueError('Data points without location')
+
+        points = [p for p in points if _number(p.get('time'))]
+        n = len(points)
+        columns = self._columns
+        columns['latitude'].extend(array.array('d', [latitude]) * n)
+        columns['longitude'].extend(array.array('d', [longitude]) * n)
+        columns['time'].extend(int(p['time']) for p in points)
+        for name in self.fields[len(_KEYS):]:
+            if name in TEXT_FIELDS:
+                columns[name].extend(
+                    v if isinstance(v, _TEXT) else u''
+                    for v in (p.get(name) for p in points))
+            else:
+                columns[name].extend(resampling.column(points, name))
+        self._size += n
+        if self.chunk_size is not None and self._size >= self.chunk_size:
+            self.flush()
+        return n
+
+    @property
+    def next_part(self):
+        """Return the name of the part file written by the next flush."""
+        return 'part-%05d.%s' % (self._index, self.format)
+
+    def flush(self):
+        """Write the buffered rows to a new part file.
+
+        Returns:
+          The name of the part file, or None without buffered rows. The
+          names of the part files written by an exporter are also kept in
+          parts.
+        """
+        if not self._size:
+            return None
+        name = self.next_part
+        temp = os.path.join(self.path, _TEMP % name)
+        try:
+            if self.format == 'parquet':
+                self._write_parquet(temp)
+            else:
+                self._write_npz(temp)
+            os.rename(temp, os.path.join(self.path, name))
+        except Exception:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        self._index += 1
+        self.rows += self._size
+        self.parts.append(name)
+        self._clear()
+        return name
+
+    def close(self):
+        """Write the buffered rows."""
+        self.flush()
+
+    def _clear(self):
+        self._size = 0
+        self._columns = {}
+        for name in self.fields:
+            if name in TEXT_FIELDS:
+                self._columns[name] = []
+            else:
+                self._columns[name] = array.array(
+                    'q' if name == 'time' else 'd')
+
+    def _write_parquet(self, path):
+        pyarrow = _pyarrow()
+        arrays = []
+        for name in self.fields:
+            values = self._columns[name]
+            if name in TEXT_FIELDS:
+                arrays.append(pyarrow.array(values, type=pyarrow.string()))
+            else:
+                kind = pyarrow.int64() if name == 'time' else \
+                    pyarrow.float64()
+                arrays.append(pyarrow.Array.from_buffers(
+                    kind, len(values), [None, pyarrow.py_buffer(values)]))
+        table = pyarrow.Table.from_arrays(arrays, names=list(self.fields))
+        pyarrow.parquet.write_table(table, path)
+
+    def _write_npz(self, path):
+        numpy = _numpy()
+        arrays = collections.OrderedDict()
+        for name in self.fields:
+            values = self._columns[name]
+            if name in TEXT_FIELDS:
+                # Stored as indices into the table of distinct values.
+                table, codes = numpy.unique(
+                    numpy.array(values, dtype=numpy.str_),
+                    return_inverse=True)
+                arrays[name] = codes.astype(numpy.int32)
+                arrays[name + _TABLE] = table
+            else:
+                arrays[name] = numpy.frombuffer(
+                    values, numpy.int64 if name == 'time' else numpy.float64)
+        with open(path, 'wb') as f:
+            numpy.savez(f, **arrays)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __unicode__(self):
+        return '<ForecastExporter instance: %s %s (%s)>' % (
+            self.path, self.block, self.format)
+
+
+def read_columns(path, fields=None):
+    """Read an export.
+
+    Args:
+      - path: directory of the export.
+      - fields: columns to read (all columns if None).
+
+    Returns:
+      An ordered dict mapping column names to NumPy arrays of all rows, in
+      the order they were written. Empty if the export holds no rows.
+
+    Raises:
+      A ValueError when the export mixes formats. A KeyError when a field is
+      not in the export.
+    """
+    parts = _parts(path)
+    format = _format(parts)
+    columns = collections.OrderedDict()
+    if format is None:
+        return columns
+    paths = [os.path.join(path, name) for _, _, name in parts]
+
+    if format == 'parquet':
+        pyarrow = _pyarrow()
+        tables = []
+        for p in paths:
+            names = pyarrow.parquet.read_schema(p).names
+            missing = [f for f in fields or () if f not in names]
+            if missing:
+                raise KeyError('Fields not in export: %s' %
+                               ', '.join(missing))
+            tables.append(pyarrow.parquet.read_table(p, columns=fields))
+        table = pyarrow.concat_tables(tables)
+        for name in table.column_names:
+            columns[name] = table.column(name).to_numpy()
+        return columns
+
+    numpy = _numpy()
+    chunks = collections.OrderedDict()
+    for p in paths:
+        with numpy.load(p) as data:
+            names = [f for f in data.files if not f.endswith(_TABLE)]
+            missing = [f for f in fields or () if f not in names]
+            if missing:
+                raise KeyError('Fields not in export: %s' %
+                               ', '.join(missing))
+            for name in fields or names:
+                values = data[name]
+                if name + _TABLE in data.files:
+                    values = data[name + _TABLE][values]
+                chunks.setdefault(name, []).append(values)
+    for name, arrays in chunks.items():
+        columns[name] = numpy.concatenate(arrays)
+    return columns
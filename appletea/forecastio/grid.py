@@ -0,0 +1,312 @@
+"""Forecast grid.
+
+Spatial and temporal interpolation over the forecasts of many locations.
+"""
+import array
+import bisect
+import heapq
+import math
+
+from appletea.forecastio.resample import column
+from appletea.utils import UnicodeMixin
+
+
+_NAN = float('nan')
+
+# Grids of at most this many locations are searched without the index.
+_SCAN = 32
+
+
+class ForecastGrid(UnicodeMixin):
+    """Forecast grid object.
+
+    A forecast grid holds a data block of many forecasts (e.g. one per cell of
+    a lattice of coordinates) in packed arrays, and answers point queries by
+    interpolating between them in space and time without further requests:
+
+      grid = ForecastGrid(forecasts, ['temperature', 'precipIntensity'])
+      grid.value('temperature', 51.05, 3.72, 1461866400)
+
+    Locations are indexed by hashing them into square cells, so nearest
+    neighbour queries only visit the cells around the query point. Values are
+    interpolated linearly in time between the data points that bracket the
+    query time.
+
+    Two spatial interpolation methods are available:
+
+    - 'idw': inverse distance weighting of the k nearest locations. Works for
+      any set of locations.
+    - 'bilinear': bilinear interpolation between the four surrounding
+      locations. Requires the locations to form a complete lattice (every
+      latitude combined with every longitude).
+
+    Args:
+      - forecasts: iterable of Forecast objects.
+      - fields: data point properties to hold, e.g. ['temperature'].
+      - block: data block to hold: 'minutely', 'hourly' or 'daily'.
+      - cell: size of the index cells in degrees (derived from the density
+        of the locations if None).
+    """
+    def __init__(self, forecasts, fields, block='hourly', cell=None):
+        self.block = block
+        self.fields = list(fields)
+        self.latitudes = array.array('d')
+        self.longitudes = array.array('d')
+
+        blocks = []
+        times = set()
+        for forecast in forecasts:
+            self.latitudes.append(float(forecast.json['latitude']))
+            self.longitudes.append(float(forecast.json['longitude']))
+            points = [p for p in (forecast.json.get(block) or {}).get(
+                'data', []) if 'time' in p]
+            blocks.append(points)
+            times.update(p['time'] for p in points)
+        if not blocks:
+            raise ValueError('A forecast grid needs at least one forecast')
+
+        self.times = array.array('d', sorted(times))
+        slot = dict((t, i) for i, t in enumerate(self.times))
+        n = len(self.times)
+        self._values = {}
+        for field in self.fields:
+            values = array.array('d', [_NAN]) * (len(blocks) * n)
+            for s, points in enumerate(blocks):
+                base = s * n
+                for p, v in zip(points, column(points, field)):
+                    values[base + slot[p['time']]] = v
+            self._values[field] = values
+
+        self.cell = cell or self._cell_size()
+        self._cells = {}
+        for s in range(len(self)):
+            key = self._key(self.latitudes[s], self.longitudes[s])
+            self._cells.setdefault(key, []).append(s)
+        rows = [i for i, _ in self._cells]
+        cols = [j for _, j in self._cells]
+        self._bounds = min(rows), max(rows), min(cols), max(cols)
+        self._lattice = self._build_lattice()
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def __unicode__(self):
+        return '<ForecastGrid instance: %d locations with %d %s data ' \
+               'points>' % (len(self), len(self.times), self.block)
+
+    def nearest(self, latitude, longitude, k=1):
+        """Return the k locations nearest to a point.
+
+        Args:
+          - latitude: geographic latitude coordinates in decimal degrees.
+          - longitude: geographic longitude coordinated in decimal degrees.
+          - k: number of locations.
+
+        Returns:
+          A list of (distance, index) tuples sorted by distance, where distance
+          is in degrees of latitude and index the position of the forecast in
+          the grid.
+
+        Raises:
+          A ValueError when k is less than 1.
+        """
+        if k < 1:
+            raise ValueError('k must be at least 1')
+        k = min(k, len(self))
+        scale = math.cos(math.radians(latitude))
+        ci, cj = self._key(latitude, longitude)
+        # Rings closer than the cells holding locations are empty.
+        ring = self._min_ring(ci, cj)
+        imin, imax, jmin, jmax = self._bounds
+        if len(self) <= _SCAN or ring > max(imax - imin, jmax - jmin):
+            # Small grids, and points far outside the grid, for which the
+            # rings would visit more cells than there are locations.
+            return sorted(heapq.nsmallest(
+                k, ((self._distance(latitude, longitude, scale, s), s)
+                    for s in range(len(self)))))
+        best = []
+        max_ring = self._max_ring(ci, cj)
+        while ring <= max_ring:
+            for key in self._ring(ci, cj, ring):
+                for s in self._cells.get(key, ()):
+                    d = self._distance(latitude, longitude, scale, s)
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, s))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, s))
+            # Locations outside the ring are at least this far away.
+            if len(best) == k and \
+                    -best[0][0] <= ring * self.cell * min(1.0, scale):
+                break
+            ring += 1
+        return sorted((-d, s) for d, s in best)
+
+    def value(self, field, latitude, longitude, time, method='idw', k=4,
+              power=2):
+        """Return the interpolated value of a property at a point.
+
+        Args:
+          - field: data point property, one of the grid fields.
+          - latitude: geographic latitude coordinates in decimal degrees.
+          - longitude: geographic longitude coordinated in decimal degrees.
+          - time: UNIX time.
+          - method: 'idw' or 'bilinear'.
+          - k: number of neighbours for inverse distance weighting.
+          - power: power of the inverse distance weights.
+
+        Returns:
+          The interpolated value, or NaN when the time is outside the grid,
+          the point outside the lattice (bilinear) or no value is known.
+
+        Raises:
+          A ValueError for unknown fields or methods, or for bilinear
+          interpolation when the locations do not form a lattice.
+        """
+        values = self._field(field)
+        times = self._time_weights(time)
+        if times is None:
+            return _NAN
+        if method == 'idw':
+            return self._idw(values, times, latitude, longitude, k, power)
+        if method == 'bilinear':
+            return self._bilinear(values, times, latitude, longitude)
+        raise ValueError('Unknown interpolation method "%s"' % method)
+
+    def values(self, field, points, method='idw', **kwargs):
+        """Return interpolated values for many points.
+
+        Args:
+          - field: data point property, one of the grid fields.
+          - points: iterable of (latitude, longitude, time) tuples.
+          - method, kwargs: see value.
+
+        Returns:
+          An array.array of floats.
+        """
+        return array.array('d', [
+            self.value(field, lat, lon, t, method, **kwargs)
+            for lat, lon, t in points])
+
+    def _field(self, field):
+        try:
+            return self._values[field]
+        except KeyError:
+            raise ValueError('Property "%s" is not held by this grid' % field)
+
+    def _at(self, values, s, times):
+        i0, i1, w = times
+        base = s * len(self.times)
+        v0 = values[base + i0]
+        if w == 0:
+            return v0
+        return v0 + (values[base + i1] - v0) * w
+
+    def _time_weights(self, time):
+        times = self.times
+        if not times or time < times[0] or time > times[-1]:
+            return None
+        i1 = bisect.bisect_left(times, time)
+        if times[i1] == time:
+            return i1, i1, 0
+        i0 = i1 - 1
+        return i0, i1, (time - times[i0]) / (times[i1] - times[i0])
+
+    def _idw(self, values, times, latitude, longitude, k, power):
+        total = weights = 0.0
+        for d, s in self.nearest(latitude, longitude, k):
+            v = self._at(values, s, times)
+            if v != v:
+                continue
+            if d == 0:
+                return v
+            w = d ** -power
+            total += w * v
+            weights += w
+        return total / weights if weights else _NAN
+
+    def _bilinear(self, values, times, latitude, longitude):
+        if self._lattice is None:
+            raise ValueError('Bilinear interpolation requires the locations '
+                             'to form a lattice')
+        lats, lons, sites = self._lattice
+        i, u = _bracket(lats, latitude)
+        j, v = _bracket(lons, longitude)
+        if i is None or j is None:
+            return _NAN
+        corners = [(sites[i, j], (1 - u) * (1 - v)),
+                   (sites[i + 1, j], u * (1 - v)),
+                   (sites[i, j + 1], (1 - u) * v),
+                   (sites[i + 1, j + 1], u * v)]
+        return math.fsum(w * self._at(values, s, times)
+                         for s, w in corners if w)
+
+    def _distance(self, latitude, longitude, scale, s):
+        dy = latitude - self.latitudes[s]
+        dx = (longitude - self.longitudes[s]) * scale
+        return math.sqrt(dx * dx + dy * dy)
+
+    def _key(self, latitude, longitude):
+        return (int(math.floor(latitude / self.cell)),
+                int(math.floor(longitude / self.cell)))
+
+    def _ring(self, ci, cj, ring):
+        # Return the keys of the cells of a ring within the bounds of the
+        # cells holding locations.
+        imin, imax, jmin, jmax = self._bounds
+        if ring == 0:
+            return [(ci, cj)]
+        keys = []
+        columns = range(max(cj - ring, jmin), min(cj + ring, jmax) + 1)
+        for i in (ci - ring, ci + ring):
+            if imin <= i <= imax:
+                keys.extend((i, j) for j in columns)
+        rows = range(max(ci - ring + 1, imin), min(ci + ring - 1, imax) + 1)
+        for j in (cj - ring, cj + ring):
+            if jmin <= j <= jmax:
+                keys.extend((i, j) for i in rows)
+        return keys
+
+    def _min_ring(self, ci, cj):
+        imin, imax, jmin, jmax = self._bounds
+        return max(0, imin - ci, ci - imax, jmin - cj, cj - jmax)
+
+    def _max_ring(self, ci, cj):
+        imin, imax, jmin, jmax = self._bounds
+        return max(abs(imin - ci), abs(imax - ci), abs(jmin - cj),
+                   abs(jmax - cj))
+
+    def _cell_size(self):
+        # About one location per cell on average, over the extent of the
+        # locations along the axes they spread over.
+        height = max(self.latitudes) - min(self.latitudes)
+        width = max(self.longitudes) - min(self.longitudes)
+        if height > 0 and width > 0:
+            return math.sqrt(height * width / len(self))
+        if height > 0 or width > 0:
+            return max(height, width) / len(self)
+        return 1.0
+
+    def _build_lattice(self):
+        lats = sorted(set(self.latitudes))
+        lons = sorted(set(self.longitudes))
+        if len(lats) < 2 or len(lons) < 2 or \
+                len(lats) * len(lons) != len(self):
+            return None
+        lat_index = dict((lat, i) for i, lat in enumerate(lats))
+        lon_index = dict((lon, j) for j, lon in enumerate(lons))
+        sites = {}
+        for s in range(len(self)):
+            sites[lat_index[self.latitudes[s]],
+                  lon_index[self.longitudes[s]]] = s
+        if len(sites) != len(self):
+            return None
+        return lats, lons, sites
+
+
+def _bracket(axis, x):
+    # Return the index of the axis interval holding x and the position of x
+    # within it (0 to 1), or (None, None) when x is outside the axis.
+    if x < axis[0] or x > axis[-1]:
+        return None, None
+    i = min(bisect.bisect_right(axis, x) - 1, len(axis) - 2)
+    return i, (x - axis[i]) / (axis[i + 1] - axis[i])
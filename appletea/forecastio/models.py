@@ -3,11 +3,25 @@
 Data object model for Forecast API responses.
 """
 import datetime
-import requests
+import threading
 
+from collections import OrderedDict as odict
+
+try:
+    from urllib.parse import parse_qsl
+except ImportError:  # Python 2
+    from urlparse import parse_qsl
+
+from appletea import client, serialization
+from appletea.exceptions import DeadlineExceeded
+from appletea.forecastio import resample as resampling
+from appletea.forecastio import units as conversions
 from appletea.utils import UnicodeMixin
 
 
+BLOCKS = ['minutely', 'hourly', 'daily']
+
+
 class Forecast(UnicodeMixin):
     """Forecast data object.
 
@@ -19,10 +33,71 @@ class Forecast(UnicodeMixin):
 
     Flags is an object containing miscellaneous metadata concerning this
     request.
+
+    Blocks missing from the response (e.g. excluded from the request) are
+    fetched when first read, within the current deadline of the reading
+    thread (see appletea.deadline), if any: a DeadlineExceeded is raised
+    when it passes first. So are alerts excluded from the request. They are
+    requested with the transport and cached in the cache the forecast was
+    fetched with (see get_forecast).
+
+    A forecast can be converted to the other unit systems locally (see
+    convert), so that one response serves all of them.
+
+    Forecasts can be shared by threads (e.g. through a cache). Every data
+    point and data block is built once and then shared by all readers, and a
+    missing block is fetched once: other threads reading it meanwhile wait
+    for that fetch. The json of the forecast is never modified in place, a
+    fetched block is added to a copy of it.
     """
-    def __init__(self, json, response):
+    def __init__(self, json, response, cache=None, transport=None):
         self.response = response
         self.json = json
+        self.cache = cache
+        self.transport = transport
+        self._response_units = None
+        self._blocks = {}
+        self._converted = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def units(self):
+        """Return the unit system of the forecast data (see
+        appletea.forecastio.units), or None when the response has no flags.
+        """
+        return self.json.get('flags', {}).get('units')
+
+    def convert(self, units):
+        """Return this forecast in another unit system.
+
+        Numeric data point properties and the nearest-station flag are
+        converted; text, such as summaries, is not. Conversions are kept,
+        converting to the same unit system again returns the same forecast.
+        Blocks missing from the converted forecast are fetched in the unit
+        system of this forecast and converted.
+
+        Args:
+          - units: 'us', 'si', 'ca' or 'uk2'.
+
+        Returns:
+          A Forecast object, this forecast if it is in units already.
+
+        Raises:
+          A ValueError when the unit system of this forecast is unknown or
+          units is not a unit system.
+        """
+        if units == self.units:
+            return self
+        forecast = self._converted.get(units)
+        if forecast is None:
+            forecast = Forecast(conversions.convert(self.json, units),
+                                self.response, cache=self.cache,
+                                transport=self.transport)
+            # Blocks are fetched in the units of the response.
+            forecast._response_units = self._response_units or self.units
+            forecast = self._converted.setdefault(units, forecast)
+        return forecast
 
     @property
     def currently(self):
@@ -71,33 +146,160 @@ class Forecast(UnicodeMixin):
         Returns:
           A list of Alert objects.
         """
+        if 'alerts' not in self.json and self._excluded('alerts'):
+            try:
+                self._load('alerts')
+            except DeadlineExceeded:
+                raise
+            except Exception:
+                return []
         alerts = []
         for alertjson in self.json.get('alerts', []):
             alerts.append(Alert(alertjson))
         return alerts
 
-    def _data(self, key):
-        keys = ['minutely', 'currently', 'hourly', 'daily']
-        try:
-            if key not in self.json:
-                keys.remove(key)
-                args = {'exclude': '%s%s' % (','.join(keys), ',alerts,flags')}
-                response = requests.get(
-                    self.response.url.split('&')[0], params=args, timeout=5)
-                response.raise_for_status()
+    def to_bytes(self):
+        """Return a compact binary representation of this forecast.
 
-                json_data = response.json()
-                self.json[key] = json_data[key]
+        The data points of each data block are packed column by column. The
+        response the forecast was fetched with is not included.
 
+        Returns:
+          The serialized forecast as bytes.
+        """
+        body = dict(self.json)
+        for key in BLOCKS:
+            block = body.get(key)
+            if isinstance(block, dict) and 'data' in block:
+                block = dict(block)
+                block['data'] = serialization.pack_columns(block['data'])
+                body[key] = block
+        return serialization.dumps(serialization.FORECAST, body)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Return a forecast from its binary representation.
+
+        Args:
+          - data: serialized forecast as returned by to_bytes.
+
+        Returns:
+          A Forecast object without response.
+
+        Raises:
+          A SerializationError when data is not a serialized forecast.
+        """
+        body = serialization.loads(serialization.FORECAST, data)
+        for key in BLOCKS:
+            block = body.get(key)
+            if isinstance(block, dict) and 'data' in block:
+                block['data'] = serialization.unpack_columns(block['data'])
+        return cls(body, None)
+
+    def _data(self, key):
+        data = self._blocks.get(key)
+        if data is not None:
+            return data
+        try:
+            self._load(key)
             if key == 'currently':
-                return ForecastioDataPoint(self.json[key])
+                data = ForecastioDataPoint(self.json[key])
             else:
-                return ForecastioDataBlock(self.json[key])
+                data = ForecastioDataBlock(self.json[key],
+                                           self.json.get('offset', 0),
+                                           self.units)
+        except DeadlineExceeded:
+            raise
         except:
             if key == 'currently':
                 return ForecastioDataPoint()
             else:
                 return ForecastioDataBlock()
+        # Threads building the same block at once all return the first one.
+        return self._blocks.setdefault(key, data)
+
+    def _load(self, key):
+        if key not in self.json:
+            with self._fetch_lock(key):
+                # Another thread may have fetched the block meanwhile.
+                if key not in self.json:
+                    self._fetch(key)
+
+    def _excluded(self, key):
+        # Return whether a block was excluded from the request.
+        if self.response is None:
+            return False
+        query = self.response.url.partition('?')[2]
+        return any(key in v.split(',') for k, v in parse_qsl(query)
+                   if k == 'exclude')
+
+    def _fetch_lock(self, key):
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _fetch(self, key):
+        keys = [k for k in ('minutely', 'currently', 'hourly', 'daily',
+                            'alerts', 'flags') if k != key]
+        url, _, query = self.response.url.partition('?')
+        args = [(k, v) for k, v in parse_qsl(query) if k != 'exclude']
+        args.append(('exclude', ','.join(keys)))
+        json_data = client.get(url, self._parse, params=odict(args),
+                               cache=self.cache, transport=self.transport).json
+        if self._response_units not in (None, self.units):
+            json_data = conversions.convert(
+                dict(json_data, flags={'units': self._response_units}),
+                self.units)
+        # Responses without alerts have no alerts key.
+        data = json_data.get(key, []) if key == 'alerts' else json_data[key]
+        with self._lock:
+            # Blocks fetched by other threads meanwhile are kept.
+            json = dict(self.json)
+            json[key] = data
+            self.json = json
+
+    def _parse(self, response):
+        return Forecast(client.decode(response), response, cache=self.cache,
+                        transport=self.transport)
+
+
+class ProfiledForecast(Forecast):
+    """Profiled forecast object.
+
+    A view of a forecast recording the blocks read through it in a block
+    usage profile (see appletea.forecastio.profiles). Views of a shared
+    forecast (e.g. from a cache) record to their own profile. Other
+    attributes are those of the forecast.
+
+    Args:
+      - forecast: a Forecast object.
+      - usage: function called with the name of every block read.
+    """
+    def __init__(self, forecast, usage):
+        self.forecast = forecast
+        self.usage = usage
+
+    def __getattr__(self, name):
+        if name == 'forecast':
+            raise AttributeError(name)
+        return getattr(self.forecast, name)
+
+    @property
+    def alerts(self):
+        self.usage('alerts')
+        return self.forecast.alerts
+
+    def convert(self, units):
+        forecast = self.forecast.convert(units)
+        if forecast is self.forecast:
+            return self
+        return ProfiledForecast(forecast, self.usage)
+
+    def _data(self, key):
+        self.usage(key)
+        return self.forecast._data(key)
 
 
 class ForecastioDataBlock(UnicodeMixin):
@@ -109,7 +311,7 @@ class ForecastioDataBlock(UnicodeMixin):
     - summary: human-readable text summary of this data block.
     - icon: machine-readable text summary of this data block (see data point,
       for an enumeration of possible values that this property may take on).
-    - data: list of data point objects (see above), ordered by time, which
+    - data: tuple of data point objects (see above), ordered by time, which
       together describe the weather conditions at the requested location over
       time.
 
@@ -120,14 +322,128 @@ class ForecastioDataBlock(UnicodeMixin):
     points for a time period are known, then the data block will be omitted
     from the response in its entirety. Developers are strongly encouraged,
     therefore, to check for the presence of data before attempting to read it.
+
+    Numeric properties of the data points can be read as packed arrays with
+    column(), and aggregated over time with resample() and rolling(). Blocks
+    of a forecast know their unit system (units) and can be converted to
+    another one with convert().
     """
-    def __init__(self, d=None):
+    def __init__(self, d=None, offset=0, units=None):
         d = d or {}
         self.summary = d.get('summary')
         self.icon = d.get('icon')
+        self.offset = offset
+        self.units = units
+
+        self.data = tuple(ForecastioDataPoint(datapoint)
+                          for datapoint in d.get('data', []))
+        self._columns = {}
+
+    def column(self, name):
+        """Return the values of a data point property as a packed array.
+
+        Only data points with a time are included. Missing and non-numeric
+        values are NaN.
+
+        Args:
+          - name: data point property, e.g. 'temperature' or 'time'.
+
+        Returns:
+          An array.array of floats ordered by time.
+        """
+        values = self._columns.get(name)
+        if values is None:
+            points = [p.d for p in self.data if p.utime is not None]
+            values = self._columns[name] = resampling.column(points, name)
+        return values
+
+    def resample(self, period, origin=0, **how):
+        """Aggregate data point properties over consecutive fixed windows.
+
+        Windows are aligned to the local time zone of the forecast and start at
+        origin seconds after local midnight, e.g. to aggregate per 8-hour shift
+        starting at 06:00:
+
+          block.resample(8 * 3600, origin=6 * 3600, precipIntensity='sum',
+                         windSpeed='max', temperature='mean')
+
+        Missing values are ignored and windows without data points omitted.
+
+        Args:
+          - period: window length in seconds.
+          - origin: start of the first window of a day in seconds after local
+            midnight.
+          - how: aggregation per data point property, one of 'sum', 'mean',
+            'min', 'max', 'count', 'first' or 'last'.
+
+        Returns:
+          A ForecastioDataBlock object with one data point per window, timed
+          at the start of the window.
+        """
+        resampling.check(how)
+        rows = resampling.resample(self.column('time'),
+                                   self._aggregated(how), period, self.offset,
+                                   origin)
+        return self._block(rows)
+
+    def rolling(self, window, **how):
+        """Aggregate data point properties over a trailing time window.
+
+        The window of a data point at time t spans (t - window, t], e.g. the
+        3-hour precipitation total at every hour:
+
+          block.rolling(3 * 3600, precipIntensity='sum')
+
+        Missing values are ignored.
+
+        Args:
+          - window: window length in seconds.
+          - how: aggregation per data point property, one of 'sum', 'mean',
+            'min', 'max' or 'count'.
+
+        Returns:
+          A ForecastioDataBlock object with one data point per data point of
+          this block.
+        """
+        resampling.check(how, resampling.ROLLING_AGGREGATIONS)
+        if window <= 0:
+            raise ValueError('Window must be positive')
+        rows = resampling.rolling(self.column('time'),
+                                  self._aggregated(how), window)
+        return self._block(rows)
+
+    def convert(self, units):
+        """Return this data block in another unit system.
+
+        See Forecast.convert.
 
-        self.data = [ForecastioDataPoint(datapoint)
-                     for datapoint in d.get('data', [])]
+        Args:
+          - units: 'us', 'si', 'ca' or 'uk2'.
+
+        Returns:
+          A ForecastioDataBlock object, this block if it is in units already.
+
+        Raises:
+          A ValueError when the unit system of this block is unknown or units
+          is not a unit system.
+        """
+        if units == self.units:
+            return self
+        conversion = conversions.conversions(self.units, units)
+        points = conversions.convert_points([p.d for p in self.data],
+                                            conversion)
+        return ForecastioDataBlock(
+            {'summary': self.summary, 'icon': self.icon, 'data': points},
+            self.offset, units)
+
+    def _aggregated(self, how):
+        return [(name, agg, self.column(name))
+                for name, agg in sorted(how.items())]
+
+    def _block(self, rows):
+        return ForecastioDataBlock(
+            {'summary': self.summary, 'icon': self.icon, 'data': rows},
+            self.offset, self.units)
 
     def __unicode__(self):
         return ('<ForecastioDataBlock instance: '
@@ -301,8 +617,11 @@ class Alert(UnicodeMixin):
         Returns:
           UNIX time (that is, seconds since midnight GMT on 1 Jan 1970).
         """
-        expires = self.json['expires']
-        return datetime.datetime.utcfromtimestamp(int(expires))
+        expires = self.__dict__.get('_expires')
+        if expires is None:
+            expires = self._expires = datetime.datetime.utcfromtimestamp(
+                int(self.json['expires']))
+        return expires
 
     def __getattr__(self, name):
         try:
@@ -0,0 +1,129 @@
+"""Block usage profiles.
+
+Records which data blocks the forecasts of a call site or named profile are
+actually read from, so that get_forecast can exclude the other blocks from
+subsequent requests.
+"""
+import json
+import os
+import sys
+import threading
+
+
+# Blocks that can be excluded. 'flags' is always requested since it holds
+# the units of the response.
+BLOCKS = ['currently', 'minutely', 'hourly', 'daily', 'alerts']
+
+
+class BlockProfiles(object):
+    """Block usage profiles.
+
+    A profile first observes a number of forecasts fetched with all blocks
+    (the warm-up) and records which blocks are read. Afterwards, forecasts are
+    requested without the blocks the profile never read. When such a block is
+    read after all, the forecast fetches it on access (see Forecast) and the
+    profile requests it again from then on.
+
+    Profiles can be saved to and loaded from a JSON file so that they survive
+    restarts:
+
+      profiles.default = BlockProfiles.load('profiles.json')
+      ...
+      profiles.default.save('profiles.json')
+
+    Args:
+      - warmup: number of forecasts observed before blocks are excluded.
+    """
+    def __init__(self, warmup=3):
+        self.warmup = warmup
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def exclude(self, name):
+        """Return the exclude parameter for the next forecast of a profile.
+
+        Args:
+          - name: profile name.
+
+        Returns:
+          A comma-delimited list of blocks, or None while warming up or when
+          all blocks are read.
+        """
+        with self._lock:
+            profile = self._profile(name)
+            if profile['samples'] < self.warmup:
+                profile['samples'] += 1
+                return None
+            unused = [b for b in BLOCKS if b not in profile['blocks']]
+        return ','.join(unused) or None
+
+    def record(self, name, block):
+        """Record that a block of a forecast of a profile was read."""
+        with self._lock:
+            self._profile(name)['blocks'].add(block)
+
+    def blocks(self, name):
+        """Return the set of blocks read by the forecasts of a profile."""
+        with self._lock:
+            return set(self._profile(name)['blocks'])
+
+    def recorder(self, name):
+        """Return a function recording the blocks read for a profile."""
+        return lambda block: self.record(name, block)
+
+    def save(self, path):
+        """Save the profiles to a JSON file (atomically)."""
+        with self._lock:
+            data = dict((name, {'samples': p['samples'],
+                                'blocks': sorted(p['blocks'])})
+                        for name, p in self._profiles.items())
+        tmp = '%s.tmp' % path
+        with open(tmp, 'w') as fp:
+            json.dump({'warmup': self.warmup, 'profiles': data}, fp,
+                      indent=2, sort_keys=True)
+        getattr(os, 'replace', os.rename)(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Return the profiles saved in a JSON file.
+
+        A missing file yields empty profiles.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as fp:
+            data = json.load(fp)
+        profiles = cls(data.get('warmup', 3))
+        for name, p in data.get('profiles', {}).items():
+            profiles._profiles[name] = {'samples': p['samples'],
+                                        'blocks': set(p['blocks'])}
+        return profiles
+
+    def _profile(self, name):
+        profile = self._profiles.get(name)
+        if profile is None:
+            profile = self._profiles[name] = {'samples': 0, 'blocks': set()}
+        return profile
+
+    def __contains__(self, name):
+        return name in self._profiles
+
+    def __len__(self):
+        return len(self._profiles)
+
+
+def call_site(depth=1):
+    """Return the profile name of a call site.
+
+    Args:
+      - depth: number of frames above the caller of this function.
+
+    Returns:
+      A 'filename:line' string.
+    """
+    frame = sys._getframe(depth + 1)
+    return '%s:%d' % (frame.f_code.co_filename, frame.f_lineno)
+
+
+# Profiles used by get_forecast.
+default = BlockProfiles()
@@ -0,0 +1,216 @@
+"""Temporal resampling.
+
+Resampling and rolling-window aggregation of data block columns. Columns are
+packed arrays of floats ordered by time in which NaN marks a missing value;
+missing values are ignored by all aggregations.
+
+Both aggregate every column over windows of consecutive rows, with NumPy
+(vectorized) when it is installed and in plain Python otherwise. Sums are
+computed per window, rolling windows included, so both give the same results.
+"""
+import array
+import math
+
+
+_NAN = float('nan')
+
+AGGREGATIONS = ['sum', 'mean', 'min', 'max', 'count', 'first', 'last']
+ROLLING_AGGREGATIONS = ['sum', 'mean', 'min', 'max', 'count']
+
+
+def _number(v):
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return v
+    return _NAN
+
+
+def column(rows, name):
+    """Return the values of a key of dicts as a packed array.
+
+    Args:
+      - rows: list of dicts, e.g. data points.
+      - name: key, e.g. 'temperature'.
+
+    Returns:
+      An array.array of floats in which missing and non-numeric values are
+      NaN.
+    """
+    try:
+        return array.array('d', [row.get(name, _NAN) for row in rows])
+    except TypeError:
+        return array.array('d', [_number(row.get(name)) for row in rows])
+
+
+def _aggregate(how, values, i, j):
+    v = [x for x in values[i:j] if x == x]
+    if how == 'count':
+        return len(v)
+    if not v:
+        return None
+    if how == 'sum':
+        return math.fsum(v)
+    if how == 'mean':
+        return math.fsum(v) / len(v)
+    if how == 'min':
+        return min(v)
+    if how == 'max':
+        return max(v)
+    if how == 'first':
+        return v[0]
+    return v[-1]
+
+
+def check(how, allowed=AGGREGATIONS):
+    """Raise a ValueError for unknown aggregations.
+
+    Args:
+      - how: dict mapping column names to aggregation names.
+      - allowed: names of the valid aggregations.
+    """
+    for name, agg in how.items():
+        if agg not in allowed:
+            raise ValueError('Unknown aggregation "%s" for "%s", expected one '
+                             'of: %s' % (agg, name, ', '.join(allowed)))
+
+
+def resample(times, columns, period, offset=0, origin=0):
+    """Aggregate columns over consecutive fixed windows.
+
+    Windows are aligned to local time: with an offset of 2 hours and an origin
+    of 6 hours, 8-hour windows start at 06:00, 14:00 and 22:00 local time.
+    Windows without data points are omitted.
+
+    Args:
+      - times: UNIX times of the rows, in ascending order.
+      - columns: list of (name, aggregation, values) tuples.
+      - period: window length in seconds.
+      - offset: local time zone offset from UTC in hours.
+      - origin: start of the first window of a day in seconds after local
+        midnight.
+
+    Returns:
+      A list of dicts, one per window, with the UNIX time at which the window
+      starts under 'time' and the aggregated values under the column names.
+      Aggregations without values in a window are left out.
+
+    Raises:
+      A ValueError when period is not positive.
+    """
+    if period <= 0:
+        raise ValueError('Period must be positive')
+    shift = int(offset * 3600) - origin
+    numpy = _numpy()
+    if numpy is not None:
+        buckets = (numpy.asarray(times).astype(numpy.int64) + shift) // period
+        starts = numpy.flatnonzero(numpy.concatenate(
+            ([True], buckets[1:] != buckets[:-1])))
+        ends = numpy.append(starts[1:], len(times))
+        times = (buckets[starts] * period - shift).tolist()
+        return _rows(times, columns, starts, ends)
+
+    starts, ends, bucket_times = [], [], []
+    i = 0
+    n = len(times)
+    while i < n:
+        bucket = (int(times[i]) + shift) // period
+        j = i + 1
+        while j < n and (int(times[j]) + shift) // period == bucket:
+            j += 1
+        starts.append(i)
+        ends.append(j)
+        bucket_times.append(bucket * period - shift)
+        i = j
+    return _rows(bucket_times, columns, starts, ends)
+
+
+def rolling(times, columns, window):
+    """Aggregate columns over a trailing time window at every row.
+
+    The window of a row at time t holds the rows with a time in
+    (t - window, t], so gaps in the data shrink the window rather than
+    stretch it.
+
+    Args:
+      - times: UNIX times of the rows, in ascending order.
+      - columns: list of (name, aggregation, values) tuples.
+      - window: window length in seconds.
+
+    Returns:
+      A list of dicts, one per row, with the row time under 'time' and the
+      aggregated values under the column names.
+    """
+    numpy = _numpy()
+    if numpy is not None:
+        t = numpy.asarray(times, dtype=numpy.float64)
+        starts = numpy.searchsorted(t, t - window, side='right')
+        ends = numpy.arange(1, len(t) + 1)
+    else:
+        starts = []
+        start = 0
+        for t in times:
+            while times[start] <= t - window:
+                start += 1
+            starts.append(start)
+        ends = range(1, len(times) + 1)
+    return _rows([int(t) for t in times], columns, starts, ends)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _rows(times, columns, starts, ends):
+    # Return one row per window [start, end) of rows.
+    rows = [{'time': t} for t in times]
+    numpy = _numpy()
+    for name, how, values in columns:
+        if numpy is not None:
+            aggregated = _vectorized(numpy, how, values, starts, ends)
+        else:
+            aggregated = [_aggregate(how, values, i, j)
+                          for i, j in zip(starts, ends)]
+        for row, v in zip(rows, aggregated):
+            if v is not None:
+                row[name] = v
+    return rows
+
+
+def _vectorized(numpy, how, values, starts, ends):
+    # Aggregate values over windows with NumPy: see _aggregate.
+    n = len(starts)
+    if not n:
+        return []
+    v = numpy.asarray(values, dtype=numpy.float64)
+    present = v == v
+    # reduceat over the interleaved bounds reduces every window [start, end)
+    # at the even positions; a padding value makes end == len(v) valid.
+    bounds = numpy.empty(2 * n, dtype=numpy.intp)
+    bounds[0::2] = starts
+    bounds[1::2] = ends
+
+    def reduce(ufunc, a):
+        return ufunc.reduceat(numpy.append(a, a[:1]), bounds)[0::2]
+
+    counts = reduce(numpy.add, present.astype(numpy.int64))
+    if how == 'count':
+        return counts.tolist()
+    if how in ('sum', 'mean'):
+        result = reduce(numpy.add, numpy.where(present, v, 0.0))
+        if how == 'mean':
+            result = result / numpy.maximum(counts, 1)
+    elif how in ('min', 'max'):
+        result = reduce(numpy.fmin if how == 'min' else numpy.fmax, v)
+    else:
+        indices = numpy.flatnonzero(present)
+        if how == 'first':
+            k = numpy.searchsorted(indices, starts)
+        else:
+            k = numpy.searchsorted(indices, ends) - 1
+        k = numpy.clip(k, 0, max(len(indices) - 1, 0))
+        result = v[indices[k]] if len(indices) else numpy.zeros(n)
+    return [r if c else None
+            for r, c in zip(result.tolist(), counts.tolist())]
@@ -0,0 +1,255 @@
+"""Forecast prefetch scheduler.
+
+Keeps the forecasts of a registered set of locations fresh in memory by
+refreshing them in the background ahead of expiry.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from appletea.cache import ResponseCache
+from appletea.forecastio import api
+from appletea.utils import UnicodeMixin
+
+
+_GOLDEN_RATIO = 0.6180339887498949
+
+
+class _Site(object):
+    def __init__(self, latitude, longitude, priority, kwargs, phase):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.priority = priority
+        self.kwargs = kwargs
+        self.phase = phase
+        self.forecast = None
+        self.fetched = None
+        self.error = None
+        self.failures = 0
+        self.version = 0
+        self.removed = False
+
+
+class PrefetchScheduler(UnicodeMixin):
+    """Forecast prefetch scheduler.
+
+    Sites (locations) are registered once and their forecasts are then
+    refreshed by a pool of background threads, so reads are always served from
+    memory:
+
+      scheduler = PrefetchScheduler(key, ttl=600, concurrency=8)
+      scheduler.register(51.036391, 3.699794, priority=1)
+      scheduler.start()
+      ...
+      forecast = scheduler.get(51.036391, 3.699794)
+
+    A site is refreshed once every (1 - lead) * ttl seconds. The first refresh
+    after the initial fetch is spread over the second half of that interval,
+    so that sites registered together do not keep expiring together. When
+    more sites are due than the budget allows, higher priority sites are
+    refreshed first. Failed refreshes are retried with exponential backoff;
+    the last good forecast is kept meanwhile.
+
+    Refreshes revalidate the previous response (see appletea.cache), so an
+    unchanged forecast costs a 304 Not Modified response.
+
+    Args:
+      - key: Dark Sky API key.
+      - ttl: maximum age of a forecast in seconds.
+      - lead: fraction of the ttl by which forecasts are refreshed ahead of
+        expiry.
+      - concurrency: maximum number of simultaneous requests.
+      - rate: maximum number of requests per second (unlimited if None), e.g.
+        1000 / 86400.0 for a quota of 1000 requests a day.
+      - retry: delay in seconds before the first retry of a failed refresh.
+      - clock: function returning the current UNIX time.
+      - kwargs: additional arguments passed to get_forecast for every site.
+    """
+    def __init__(self, key, ttl=600, lead=0.1, concurrency=4, rate=None,
+                 retry=5, clock=time.time, **kwargs):
+        self.key = key
+        self.ttl = ttl
+        self.interval = ttl * (1 - lead)
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retry = retry
+        self.kwargs = kwargs
+        self.cache = ResponseCache(maxsize=None)
+        self._clock = clock
+        self._sites = {}
+        self._due = []
+        self._ready = []
+        self._seq = itertools.count()
+        self._next_slot = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+
+    def register(self, latitude, longitude, priority=0, **kwargs):
+        """Register a site.
+
+        The forecast of a newly registered site is fetched as soon as the
+        budget allows. Registering a site again updates its priority and
+        arguments.
+
+        Args:
+          - latitude: geographic latitude coordinates in decimal degrees.
+          - longitude: geographic longitude coordinated in decimal degrees.
+          - priority: sites with a higher priority are refreshed first.
+          - kwargs: additional arguments passed to get_forecast for this site.
+        """
+        with self._cond:
+            site = self._sites.get((latitude, longitude))
+            if site is not None:
+                site.priority = priority
+                site.kwargs = kwargs
+                return
+            phase = (len(self._sites) * _GOLDEN_RATIO) % 1
+            site = _Site(latitude, longitude, priority, kwargs, phase)
+            self._sites[(latitude, longitude)] = site
+            self._schedule(site, self._clock())
+
+    def unregister(self, latitude, longitude):
+        """Unregister a site and drop its forecast.
+
+        Raises:
+          A KeyError when the site is not registered.
+        """
+        with self._cond:
+            site = self._sites.pop((latitude, longitude))
+            site.removed = True
+            site.version += 1
+        params = self._kwargs(site)
+        url = api._url(self.key, latitude, longitude, params.pop('time', None))
+        for name in ('profile', 'deadline', 'transport'):
+            params.pop(name, None)
+        self.cache.remove(api._cache_key(url, params)[0])
+
+    def get(self, latitude, longitude):
+        """Return the latest forecast of a site.
+
+        Returns:
+          A Forecast object, or None until the first fetch completed.
+
+        Raises:
+          A KeyError when the site is not registered.
+        """
+        return self._sites[(latitude, longitude)].forecast
+
+    def error(self, latitude, longitude):
+        """Return the exception of the last failed refresh of a site, or None
+        when the last refresh succeeded."""
+        return self._sites[(latitude, longitude)].error
+
+    def start(self):
+        """Start the background refresh threads."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        for _ in range(self.concurrency):
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        """Stop the background refresh threads and wait for them to finish."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __contains__(self, location):
+        return location in self._sites
+
+    def __len__(self):
+        return len(self._sites)
+
+    def __unicode__(self):
+        return '<PrefetchScheduler instance with %d sites>' % len(self)
+
+    def _schedule(self, site, due):
+        site.version += 1
+        heapq.heappush(self._due, (due, next(self._seq), site.version, site))
+        self._cond.notify()
+
+    def _take(self):
+        # Return the next site to refresh, blocking until one is due and the
+        # rate allows it, or None when stopped.
+        with self._cond:
+            while self._running:
+                now = self._clock()
+                while self._due and self._due[0][0] <= now:
+                    due, seq, version, site = heapq.heappop(self._due)
+                    if site.version == version and not site.removed:
+                        heapq.heappush(self._ready,
+                                       (-site.priority, due, seq, site))
+                timeout = None
+                if self._ready:
+                    if self.rate is None or now >= self._next_slot:
+                        site = heapq.heappop(self._ready)[-1]
+                        if site.removed:
+                            continue
+                        if self.rate is not None:
+                            self._next_slot = max(now, self._next_slot) + \
+                                1.0 / self.rate
+                        return site
+                    timeout = self._next_slot - now
+                elif self._due:
+                    timeout = self._due[0][0] - now
+                self._cond.wait(timeout)
+            return None
+
+    def _done(self, site, forecast=None, error=None):
+        with self._cond:
+            if site.removed:
+                return
+            now = self._clock()
+            if error is not None:
+                site.error = error
+                site.failures += 1
+                delay = min(self.interval,
+                            self.retry * 2 ** (site.failures - 1))
+            else:
+                if site.fetched is None:
+                    delay = self.interval * (0.5 + 0.5 * site.phase)
+                else:
+                    delay = self.interval
+                site.forecast = forecast
+                site.fetched = now
+                site.error = None
+                site.failures = 0
+            self._schedule(site, now + delay)
+
+    def _kwargs(self, site):
+        kwargs = dict(self.kwargs)
+        kwargs.update(site.kwargs)
+        return kwargs
+
+    def _refresh(self, site):
+        try:
+            forecast = api.get_forecast(self.key, site.latitude,
+                                        site.longitude, cache=self.cache,
+                                        **self._kwargs(site))
+        except Exception as e:
+            self._done(site, error=e)
+        else:
+            self._done(site, forecast)
+
+    def _work(self):
+        while True:
+            site = self._take()
+            if site is None:
+                return
+            self._refresh(site)
@@ -0,0 +1,242 @@
+"""Incremental parser of forecast responses.
+
+Splits a forecast response into its members as its bytes arrive, decoding
+the data points of data blocks and the alerts one by one, so that only the
+part of the response not yet parsed is held in memory.
+"""
+import re
+
+from appletea import client
+from appletea.forecastio.models import Alert, BLOCKS, ForecastioDataPoint
+
+
+_WHITESPACE = re.compile(br'[ \t\r\n]*')
+_STRING = re.compile(br'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_CONTENT = re.compile(br'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+_SCALAR = re.compile(br'[^,}\]\s]*')
+
+_OPEN = {b'{': 'object', b'[': 'array'}
+_CLOSE = {b'}': 'object', b']': 'array'}
+
+# States of the parser.
+_VALUE, _KEY, _COLON, _NEXT, _DONE = range(5)
+
+
+def _split(path):
+    # Return the container type whose members are parsed one by one at path,
+    # or None to decode the value at path whole.
+    if not path:
+        return 'object'
+    if len(path) == 1 and path[0] in BLOCKS:
+        return 'object'
+    if path == ('alerts',) or (len(path) == 2 and path[0] in BLOCKS and
+                               path[1] == 'data'):
+        return 'array'
+    return None
+
+
+def _item(path, value):
+    # Return the (name, object) item of a decoded value.
+    if path == ('currently',):
+        return 'currently', ForecastioDataPoint(value)
+    if path == ('alerts', None):
+        return 'alerts', Alert(value)
+    if len(path) == 3:
+        return path[0], ForecastioDataPoint(value)
+    return '.'.join(path), value
+
+
+class ForecastParser(object):
+    """Incremental forecast parser object.
+
+    Bytes of a forecast response are fed to the parser as they are received,
+    and it returns the items completed so far:
+
+      parser = ForecastParser()
+      for chunk in chunks:
+          for name, value in parser.feed(chunk):
+              ...
+      parser.close()
+
+    Items are (name, value) tuples in the order of the response:
+
+      - ('currently', ForecastioDataPoint) for the current conditions.
+      - ('minutely', ForecastioDataPoint), ('hourly', ...) and ('daily', ...)
+        for every data point of the data blocks.
+      - ('alerts', Alert) for every alert.
+      - ('<block>.<property>', value) for the other properties of the data
+        blocks, e.g. ('hourly.summary', 'Rain throughout the week.').
+      - (property, value) for the other properties of the forecast, e.g.
+        ('offset', 2) or ('flags', {...}).
+    """
+    def __init__(self):
+        self._buf = b''
+        self._pos = 0
+        self._state = _VALUE
+        self._stack = []
+        self._path = ()
+        self._scan = None
+
+    def feed(self, data):
+        """Parse bytes of the response.
+
+        Args:
+          - data: next bytes of the response.
+
+        Returns:
+          A list of the (name, value) items completed by data.
+
+        Raises:
+          A ValueError when the response is not a valid forecast.
+        """
+        self._buf += data
+        items = []
+        while self._step(items):
+            pass
+        # Release the parsed bytes.
+        self._buf = self._buf[self._pos:]
+        if self._scan is not None:
+            self._scan = (self._scan[0] - self._pos, self._scan[1])
+        self._pos = 0
+        return items
+
+    def close(self):
+        """Check that the whole response was parsed.
+
+        Raises:
+          A ValueError when the response is incomplete.
+        """
+        if self._state != _DONE:
+            raise ValueError('Incomplete forecast response')
+
+    def _char(self):
+        # Skip whitespace and return the next character, or None when all
+        # bytes were parsed.
+        self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+        if self._pos == len(self._buf):
+            return None
+        return self._buf[self._pos:self._pos + 1]
+
+    def _error(self):
+        return ValueError('Invalid forecast response at "%s"' %
+                          self._buf[self._pos:self._pos + 20].decode(
+                              'utf-8', 'replace'))
+
+    def _step(self, items):
+        # Parse the next token or value, return False when more bytes are
+        # needed.
+        c = self._char()
+        if c is None:
+            return False
+        state = self._state
+        if state == _DONE or (not self._stack and c != b'{'):
+            raise self._error()
+
+        if state == _KEY:
+            if c == b'}':
+                return self._close(c)
+            end = self._string_end(self._pos + 1) if c == b'"' else -1
+            if end == -1:
+                raise self._error()
+            if end is None:
+                return False
+            key = client.loads(self._buf[self._pos:end])
+            self._path = self._stack[-1][1] + (key,)
+            self._pos = end
+            self._state = _COLON
+        elif state == _COLON:
+            if c != b':':
+                raise self._error()
+            self._pos += 1
+            self._state = _VALUE
+        elif state == _NEXT:
+            if c in _CLOSE:
+                return self._close(c)
+            if c != b',':
+                raise self._error()
+            self._pos += 1
+            self._begin()
+        elif c in _OPEN and _split(self._path) == _OPEN[c]:
+            self._stack.append((_OPEN[c], self._path))
+            self._pos += 1
+            self._state = _KEY if c == b'{' else _VALUE
+            self._path = self._path + (None,)
+        elif c in _CLOSE and self._stack and self._path[-1:] == (None,) and \
+                self._stack[-1][0] == 'array':
+            # An empty array.
+            return self._close(c)
+        else:
+            end = self._value_end()
+            if end is None:
+                return False
+            items.append(_item(self._path,
+                               client.loads(self._buf[self._pos:end])))
+            self._pos = end
+            self._state = _NEXT if self._stack else _DONE
+        return True
+
+    def _begin(self):
+        # Start the next member of the current container.
+        kind, path = self._stack[-1]
+        if kind == 'object':
+            self._state = _KEY
+        else:
+            self._path = path + (None,)
+            self._state = _VALUE
+
+    def _close(self, c):
+        kind, path = self._stack.pop()
+        if _CLOSE[c] != kind:
+            raise self._error()
+        self._pos += 1
+        self._path = path
+        self._state = _NEXT if self._stack else _DONE
+        return True
+
+    def _string_end(self, pos):
+        match = _STRING.match(self._buf, pos)
+        return None if match is None else match.end()
+
+    def _value_end(self):
+        # Return the end of the value at the current position, or None when
+        # it is incomplete. The scan of a container resumes where it stopped
+        # with the previous bytes.
+        buf = self._buf
+        c = buf[self._pos:self._pos + 1]
+        if c == b'"':
+            return self._string_end(self._pos + 1)
+        if c not in _OPEN:
+            end = _SCALAR.match(buf, self._pos).end()
+            return end if end < len(buf) else None
+        pos, depth = self._scan or (self._pos + 1, 1)
+        while True:
+            # Skip to the next bracket or incomplete string.
+            pos = _CONTENT.match(buf, pos).end()
+            c = buf[pos:pos + 1]
+            if not c or c == b'"':
+                self._scan = (pos, depth)
+                return None
+            pos += 1
+            depth += 1 if c in _OPEN else -1
+            if depth == 0:
+                self._scan = None
+                return pos
+
+
+def parse(chunks):
+    """Parse a forecast response incrementally.
+
+    Args:
+      - chunks: iterable of the bytes of the response.
+
+    Returns:
+      A generator of (name, value) items (see ForecastParser).
+
+    Raises:
+      A ValueError when the response is not a valid forecast.
+    """
+    parser = ForecastParser()
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    parser.close()
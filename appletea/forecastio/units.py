@@ -0,0 +1,156 @@
+"""Unit conversion.
+
+Converts forecasts between the unit systems of the Forecast API (see the
+units argument of get_forecast):
+
+- us: Imperial units (degrees Fahrenheit, miles, inches per hour, inches,
+  miles per hour).
+- si: SI units (degrees Celsius, kilometers, millimeters per hour,
+  centimeters, meters per second).
+- ca: SI units, with wind speed in kilometers per hour.
+- uk2: SI units, with distances in miles and wind speed in miles per hour.
+
+Pressure is in millibars or (the same) hectopascals in every system.
+"""
+
+
+SYSTEMS = ('us', 'si', 'ca', 'uk2')
+
+# Data point properties of every quantity.
+FIELDS = {
+    'temperature': ('temperature', 'temperatureMin', 'temperatureMax',
+                    'temperatureHigh', 'temperatureLow',
+                    'apparentTemperature', 'apparentTemperatureMin',
+                    'apparentTemperatureMax', 'apparentTemperatureHigh',
+                    'apparentTemperatureLow', 'dewPoint'),
+    'distance': ('nearestStormDistance', 'visibility'),
+    'intensity': ('precipIntensity', 'precipIntensityMax',
+                  'precipIntensityError'),
+    'accumulation': ('precipAccumulation',),
+    'speed': ('windSpeed', 'windGust'),
+}
+
+# Decimal places of the converted values of every quantity.
+_DIGITS = {'temperature': 2, 'distance': 2, 'intensity': 4,
+           'accumulation': 3, 'speed': 2}
+
+_SI = {'temperature': 'C', 'distance': 'km', 'intensity': 'mm/h',
+       'accumulation': 'cm', 'speed': 'm/s'}
+
+_UNITS = {
+    'us': {'temperature': 'F', 'distance': 'mi', 'intensity': 'in/h',
+           'accumulation': 'in', 'speed': 'mph'},
+    'si': _SI,
+    'ca': dict(_SI, speed='km/h'),
+    'uk2': dict(_SI, distance='mi', speed='mph'),
+}
+
+# (scale, offset) of the conversion of a unit to the SI unit of its quantity.
+_TO_SI = {
+    'C': (1.0, 0.0), 'F': (5 / 9.0, -160 / 9.0),
+    'km': (1.0, 0.0), 'mi': (1.609344, 0.0),
+    'mm/h': (1.0, 0.0), 'in/h': (25.4, 0.0),
+    'cm': (1.0, 0.0), 'in': (2.54, 0.0),
+    'm/s': (1.0, 0.0), 'km/h': (1 / 3.6, 0.0), 'mph': (0.44704, 0.0),
+}
+
+_BLOCKS = ('minutely', 'hourly', 'daily')
+
+# Flags converted like a data point property.
+_FLAGS = {'nearest-station': 'visibility'}
+
+
+def conversions(source, target):
+    """Return the conversions of the data point properties between two unit
+    systems.
+
+    Args:
+      - source: unit system of the values, one of SYSTEMS.
+      - target: unit system to convert to, one of SYSTEMS.
+
+    Returns:
+      A list of (property, scale, offset, digits) tuples, converting a value
+      to round(value * scale + offset, digits). Properties in the same unit in
+      both systems are omitted.
+
+    Raises:
+      A ValueError when a unit system is unknown.
+    """
+    for units in (source, target):
+        if units not in _UNITS:
+            raise ValueError('Unknown unit system "%s", expected one of: %s' %
+                             (units, ', '.join(SYSTEMS)))
+    result = []
+    for quantity, fields in sorted(FIELDS.items()):
+        unit, to = _UNITS[source][quantity], _UNITS[target][quantity]
+        if unit == to:
+            continue
+        # Compose the conversion to SI units with the inverse conversion.
+        a, b = _TO_SI[unit]
+        c, d = _TO_SI[to]
+        scale, offset = a / c, (b - d) / c
+        for field in fields:
+            result.append((field, scale, offset, _DIGITS[quantity]))
+    return result
+
+
+def convert_points(points, conversion):
+    """Return converted copies of data points.
+
+    Every property is converted for all data points at once.
+
+    Args:
+      - points: list of data points as dicts.
+      - conversion: conversions as returned by conversions().
+
+    Returns:
+      A list of new dicts.
+    """
+    points = [dict(p) for p in points]
+    for field, scale, offset, digits in conversion:
+        column = [p for p in points if _number(p.get(field))]
+        for p in column:
+            p[field] = round(p[field] * scale + offset, digits)
+    return points
+
+
+def convert(json, target):
+    """Return a forecast response in another unit system.
+
+    Args:
+      - json: forecast response, whose flags give its unit system.
+      - target: unit system to convert to, one of SYSTEMS.
+
+    Returns:
+      A new forecast response (the original is not modified) with the units
+      of its flags set to target. Numbers are converted, including the
+      nearest-station flag; text, such as summaries, is not.
+
+    Raises:
+      A ValueError when the unit system of the response is missing or a unit
+      system is unknown.
+    """
+    source = json.get('flags', {}).get('units')
+    if source is None:
+        raise ValueError('Forecast without units flag')
+    conversion = conversions(source, target)
+    json = dict(json)
+    if isinstance(json.get('currently'), dict):
+        json['currently'] = convert_points([json['currently']],
+                                           conversion)[0]
+    for key in _BLOCKS:
+        block = json.get(key)
+        if isinstance(block, dict) and 'data' in block:
+            json[key] = dict(block, data=convert_points(block['data'],
+                                                        conversion))
+    flags = dict(json['flags'], units=target)
+    for field, scale, offset, digits in conversion:
+        for flag, like in _FLAGS.items():
+            if like == field and _number(flags.get(flag)):
+                flags[flag] = round(flags[flag] * scale + offset, digits)
+    json['flags'] = flags
+    return json
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -1,7 +1,11 @@
 """
 The Google Calendar API manipulates events and other calendar data.
 """
-from appletea.gcalendar.api import get_events
+from appletea.gcalendar.api import get_events, stop_channel, watch_events
+from appletea.gcalendar.credentials import CredentialManager
+from appletea.gcalendar.store import EventStore
+from appletea.gcalendar.watch import WatchManager
 
 
-__all__ = ['get_events']
+__all__ = ['get_events', 'stop_channel', 'watch_events', 'CredentialManager',
+           'EventStore', 'WatchManager']
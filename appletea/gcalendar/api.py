@@ -1,14 +1,57 @@
 """Client for google calendar APIs.
 
 A REST client library for google calendar APIs.
+
+The Google API client libraries are imported on first use rather than at
+import time, they are slow to import and not needed by the other applets.
 """
-import apiclient as api
-import oauth2client as oauth2
+import uuid
 
+from appletea import client
+from appletea import deadline as deadlines
+from appletea.exceptions import DeadlineExceeded
+from appletea.gcalendar.credentials import credentials_key
 from appletea.gcalendar.models import GCalendarEvents
 
 
-def get_events(credentials, calendarId='primary', **kwargs):
+# Alternative Calendar API endpoint (e.g. a local stand-in server). The
+# endpoint from the discovery document is used when unset.
+API_ENDPOINT = None
+
+
+_json_model = None
+
+
+def _json_model_class():
+    """Return the Calendar API response model class.
+
+    The model decodes responses with the fastest available JSON decoder and
+    keeps the headers of the last response. The class derives from the Google
+    API client JsonModel and is therefore only defined on first use.
+    """
+    global _json_model
+    if _json_model is None:
+        from apiclient.model import JsonModel
+
+        class _JsonModel(JsonModel):
+            headers = {}
+
+            def response(self, resp, content):
+                self.headers = resp
+                return JsonModel.response(self, resp, content)
+
+            def deserialize(self, content):
+                body = client.loads(content)
+                if self._data_wrapper and 'data' in body:
+                    body = body['data']
+                return body
+
+        _json_model = _JsonModel
+    return _json_model
+
+
+def get_events(credentials, calendarId='primary', cache=None, deadline=None,
+               **kwargs):
     """Return google calendar events for on the specified calendar.
 
     Return a google calendar object for given credentials and calendar
@@ -32,7 +75,7 @@ def get_events(credentials, calendarId='primary', **kwargs):
       - maxResults: Maximum number of events returned on one result page
         (default: 250).
       - orderBy: The order of the events returned in the result: "startTime" or
-        "updated" (default: "startTime").
+        "updated" (default: "startTime", unless singleEvents is False).
       - pageToken: Token specifying which result page to return.
       - privateExtendedProperty: Extended properties constraint specified as
         propertyName=value. Matches only private properties.
@@ -43,7 +86,8 @@ def get_events(credentials, calendarId='primary', **kwargs):
       - showHiddenInvitations: Whether to include hidden invitations in the
         result.
       - singleEvents: Whether to only return single one-off events and
-        instances of recurring events (default: False).
+        instances of recurring events (default: False). Recurring events can
+        also be expanded locally with GCalendarEvents.instances.
       - syncToken: Token obtained from the nextSyncToken field.
       - timeMax: Upper bound (exclusive) for an event's start time to
         filter by (RFC3339 timestamp with mandatory offset).
@@ -54,22 +98,175 @@ def get_events(credentials, calendarId='primary', **kwargs):
         filter by.
 
     Args:
-      - credentials: Oauth2.0 crendentials object.
+      - credentials: Oauth2.0 crendentials object, as JSON or as parsed
+        OAuth2Credentials (e.g. from a CredentialManager, which keeps its
+        access token fresh).
       - calendarId: calendar identifier. If you want to access the primary
         calendar of the currently logged in user, use the "primary" keyword
         (=default).
+      - cache: an optional appletea.cache.ResponseCache. Cached events are
+        reused while fresh and revalidated with a conditional request once
+        stale.
+      - deadline: an optional appletea.deadline.Deadline bounding the request
+        (the current deadline if None).
       - kwargs: additional arguments passed as query params to service API.
 
     Returns:
       A google calendar events object with methods for accessing its data.
 
     Raises:
-      An HTTPError when a bad request is made.
+      An HTTPError when a bad request is made, a DeadlineExceeded when the
+      deadline passes first.
     """
-    credentials = oauth2.client.OAuth2Credentials.from_json(credentials)
-    service = api.discovery.build('calendar', 'v3', credentials=credentials)
+    from apiclient.errors import HttpError
+
+    # Ordering by start time is only allowed for single events, and no
+    # ordering at all in incremental syncs.
+    if kwargs.get('singleEvents', True) and 'syncToken' not in kwargs:
+        kwargs.setdefault('orderBy', 'startTime')
+
+    entry = None
+    if cache is not None:
+        key = _cache_key(credentials, calendarId, kwargs)
+        entry = cache.get(key)
+        if entry is not None and entry.fresh:
+            return entry.value
+
+    if deadline is None:
+        deadline = deadlines.current()
+
+    model = _json_model_class()()
+    service = _service(credentials, model, deadline)
+    request = service.events().list(calendarId=calendarId, **kwargs)
+    if entry is not None:
+        request.headers.update(entry.validators)
+    try:
+        result = request.execute()
+    except HttpError as e:
+        if entry is not None and e.resp.status == 304:
+            cache.revalidated(entry, _headers(e.resp))
+            return entry.value
+        raise
+    except Exception:
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceeded('Deadline exceeded requesting events')
+        raise
+
+    events = GCalendarEvents(result)
+    if cache is not None:
+        cache.update(key, events, _headers(model.headers))
+    return events
+
+
+def watch_events(credentials, address, calendarId='primary', id=None,
+                 token=None, ttl=None, deadline=None):
+    """Open a channel notifying changes of the events of a calendar.
+
+    The Calendar API posts a notification to address whenever an event of
+    the calendar changes, until the channel expires or is stopped (see
+    stop_channel). Notifications only tell that something changed; the
+    changes are fetched with get_events and the nextSyncToken of the
+    previous events as syncToken. See appletea.gcalendar.watch.
+
+    Args:
+      - credentials: Oauth2.0 crendentials object, as JSON or as parsed
+        OAuth2Credentials.
+      - address: HTTPS URL receiving the notifications.
+      - calendarId: calendar identifier.
+      - id: channel identifier, unique per channel (a new UUID if None).
+      - token: optional string sent along with every notification, to
+        verify their origin.
+      - ttl: requested lifetime of the channel in seconds (the default of
+        the API if None).
+      - deadline: an optional appletea.deadline.Deadline bounding the request
+        (the current deadline if None).
+
+    Returns:
+      The channel resource as dict, with its id, resourceId and expiration
+      (UNIX time in milliseconds, as string).
+
+    Raises:
+      An HttpError when a bad request is made, e.g. for an address that is
+      not a verified HTTPS URL.
+    """
+    body = {'id': id or str(uuid.uuid4()), 'type': 'web_hook',
+            'address': address}
+    if token is not None:
+        body['token'] = token
+    if ttl is not None:
+        body['params'] = {'ttl': str(int(ttl))}
+    service = _service(credentials, _json_model_class()(),
+                       deadline or deadlines.current())
+    return _execute(service.events().watch(calendarId=calendarId,
+                                           body=body), deadline)
+
+
+def stop_channel(credentials, channel, deadline=None):
+    """Stop a channel opened by watch_events.
+
+    Args:
+      - credentials: Oauth2.0 crendentials object the channel was opened
+        with.
+      - channel: channel resource as returned by watch_events.
+      - deadline: an optional appletea.deadline.Deadline bounding the request
+        (the current deadline if None).
+
+    Raises:
+      An HttpError when a bad request is made, e.g. for an unknown channel.
+    """
+    service = _service(credentials, _json_model_class()(),
+                       deadline or deadlines.current())
+    _execute(service.channels().stop(body={
+        'id': channel['id'], 'resourceId': channel['resourceId']}), deadline)
+
+
+def _service(credentials, model, deadline):
+    from apiclient import discovery
+    from oauth2client.client import OAuth2Credentials
+
+    if not isinstance(credentials, OAuth2Credentials):
+        credentials = OAuth2Credentials.from_json(credentials)
+    if deadline is None:
+        return discovery.build('calendar', 'v3', credentials=credentials,
+                               model=model, client_options=_client_options())
+
+    from apiclient.http import DEFAULT_HTTP_TIMEOUT_SEC, build_http
+
+    http = build_http()
+    http.timeout = deadline.timeout(DEFAULT_HTTP_TIMEOUT_SEC)
+    return discovery.build('calendar', 'v3',
+                           http=credentials.authorize(http), model=model,
+                           client_options=_client_options())
+
+
+def _execute(request, deadline):
+    from apiclient.errors import HttpError
+
+    if deadline is None:
+        deadline = deadlines.current()
+    try:
+        return request.execute()
+    except HttpError:
+        raise
+    except Exception:
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceeded('Deadline exceeded requesting %s' %
+                                   request.uri)
+        raise
+
+
+def _cache_key(credentials, calendarId, kwargs):
+    digest = credentials_key(credentials)
+    return ('gcalendar', digest, calendarId, tuple(sorted(kwargs.items())))
+
+
+def _headers(resp):
+    # httplib2 lower-cases header names.
+    from requests.structures import CaseInsensitiveDict
+    return CaseInsensitiveDict(resp)
 
-    kwargs.setdefault('orderBy', 'startTime')
-    result = service.events().list(calendarId=calendarId, **kwargs).execute()
 
-    return GCalendarEvents(result)
+def _client_options():
+    if API_ENDPOINT:
+        return {'api_endpoint': API_ENDPOINT}
+    return None
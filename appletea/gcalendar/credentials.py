@@ -0,0 +1,278 @@
+"""OAuth 2.0 credential manager.
+
+Parses credentials once and keeps their access tokens fresh, refreshing them
+ahead of expiry in the background.
+
+Like appletea.gcalendar.api, the Google client libraries are imported on
+first use.
+"""
+import calendar
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
+
+from appletea.utils import UnicodeMixin
+
+
+class _Entry(object):
+    def __init__(self, key, credentials):
+        self.key = key
+        self.credentials = credentials
+        self.lock = threading.Lock()
+        self.error = None
+        self.failures = 0
+        self.version = 0
+        self.removed = False
+
+
+def credentials_key(credentials):
+    """Return a key identifying credentials.
+
+    Credentials with a refresh token are identified by their client id and
+    refresh token, so that they keep their key when their access token is
+    refreshed.
+
+    Args:
+      - credentials: OAuth 2.0 credentials as JSON, or an oauth2client
+        OAuth2Credentials object.
+
+    Returns:
+      A hex digest.
+    """
+    if hasattr(credentials, 'refresh_token'):
+        client_id = credentials.client_id
+        refresh_token = credentials.refresh_token
+        if refresh_token is None:
+            credentials = credentials.to_json()
+    else:
+        try:
+            data = json.loads(credentials)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            data = {}
+        client_id = data.get('client_id')
+        refresh_token = data.get('refresh_token')
+    if refresh_token is not None:
+        credentials = '%s:%s' % (client_id, refresh_token)
+    return hashlib.sha1(credentials.encode('utf-8')).hexdigest()
+
+
+class CredentialManager(UnicodeMixin):
+    """Credential manager object.
+
+    A credential manager parses the credentials of every user once, and
+    refreshes their access tokens before they expire, so that requests do not
+    wait for a token refresh:
+
+      manager = CredentialManager(persist=save_credentials)
+      manager.start()
+      ...
+      events = get_events(manager.get(credentials_json))
+
+    Access tokens are refreshed in a background thread from lead seconds
+    before their expiry (or when get finds them about to expire while the
+    manager is not started). A token is refreshed by one thread at a time,
+    other threads needing it wait for that refresh instead of refreshing it
+    again. Failed background refreshes are retried with exponential backoff.
+
+    Args:
+      - lead: number of seconds before expiry at which tokens are refreshed.
+      - retry: delay in seconds before the first retry of a failed refresh.
+      - persist: optional function called with the key (see
+        credentials_key) and the JSON of credentials after every refresh,
+        e.g. to store the new access token.
+      - http: optional function returning the httplib2.Http object used for
+        refreshes.
+      - clock: function returning the current UNIX time.
+    """
+    def __init__(self, lead=300, retry=30, persist=None, http=None,
+                 clock=time.time):
+        self.lead = lead
+        self.retry = retry
+        self.persist = persist
+        self._http = http
+        self._clock = clock
+        self._entries = {}
+        self._due = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def get(self, credentials):
+        """Return parsed credentials with a fresh access token.
+
+        Args:
+          - credentials: OAuth 2.0 credentials as JSON.
+
+        Returns:
+          An oauth2client OAuth2Credentials object.
+
+        Raises:
+          An oauth2client HttpAccessTokenRefreshError when the access token
+          is about to expire and cannot be refreshed.
+        """
+        key = credentials_key(credentials)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._add(key, credentials)
+        if self._expiring(entry):
+            self._refresh(entry, self._expiring, raise_errors=True)
+        return entry.credentials
+
+    def refresh(self, credentials):
+        """Refresh the access token of credentials now.
+
+        Args:
+          - credentials: OAuth 2.0 credentials as JSON.
+        """
+        key = credentials_key(credentials)
+        entry = self._entries.get(key) or self._add(key, credentials)
+        self._refresh(entry, raise_errors=True)
+
+    def remove(self, credentials):
+        """Forget credentials.
+
+        Raises:
+          A KeyError when the credentials are not managed.
+        """
+        with self._cond:
+            entry = self._entries.pop(credentials_key(credentials))
+            entry.removed = True
+
+    def error(self, credentials):
+        """Return the exception of the last failed background refresh of
+        credentials, or None when it succeeded."""
+        return self._entries[credentials_key(credentials)].error
+
+    def start(self):
+        """Start the background refresh thread."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background refresh thread and wait for it to finish."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __contains__(self, credentials):
+        return credentials_key(credentials) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __unicode__(self):
+        return '<CredentialManager instance with %d credentials>' % len(self)
+
+    def _add(self, key, credentials):
+        from oauth2client.client import OAuth2Credentials
+
+        parsed = OAuth2Credentials.from_json(credentials)
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(key, parsed)
+                self._schedule(entry, self._refresh_time(entry))
+        return entry
+
+    def _expiry(self, entry):
+        expiry = entry.credentials.token_expiry
+        if expiry is None:
+            return None
+        return calendar.timegm(expiry.utctimetuple())
+
+    def _refresh_time(self, entry):
+        expiry = self._expiry(entry)
+        return None if expiry is None else expiry - self.lead
+
+    def _expiring(self, entry):
+        # Whether the token expires before the background thread would
+        # refresh it.
+        if entry.credentials.access_token is None:
+            return True
+        expiry = self._expiry(entry)
+        if expiry is None:
+            return False
+        margin = 0 if self._running else self.lead
+        return expiry - margin <= self._clock()
+
+    def _is_due(self, entry):
+        refresh_time = self._refresh_time(entry)
+        return refresh_time is not None and refresh_time <= self._clock()
+
+    def _schedule(self, entry, due):
+        entry.version += 1
+        if due is not None:
+            heapq.heappush(self._due,
+                           (due, next(self._seq), entry.version, entry))
+            self._cond.notify()
+
+    def _refresh(self, entry, needed=None, raise_errors=False):
+        with entry.lock:
+            # Another thread may have refreshed the token meanwhile.
+            if needed is not None and not needed(entry):
+                return
+            try:
+                entry.credentials.refresh(self._http_object())
+            except Exception as e:
+                with self._cond:
+                    entry.error = e
+                    entry.failures += 1
+                    self._schedule(entry, self._clock() + min(
+                        self.lead, self.retry * 2 ** (entry.failures - 1)))
+                if raise_errors:
+                    raise
+                return
+            with self._cond:
+                entry.error = None
+                entry.failures = 0
+                self._schedule(entry, self._refresh_time(entry))
+        if self.persist is not None:
+            self.persist(entry.key, entry.credentials.to_json())
+
+    def _http_object(self):
+        if self._http is not None:
+            return self._http()
+        from oauth2client import transport
+        return transport.get_http_object()
+
+    def _take(self):
+        # Return the next entry to refresh, blocking until one is due, or
+        # None when stopped.
+        with self._cond:
+            while self._running:
+                now = self._clock()
+                if self._due and self._due[0][0] <= now:
+                    _, _, version, entry = heapq.heappop(self._due)
+                    if entry.version == version and not entry.removed:
+                        return entry
+                    continue
+                self._cond.wait(self._due[0][0] - now if self._due else None)
+            return None
+
+    def _work(self):
+        while True:
+            entry = self._take()
+            if entry is None:
+                return
+            self._refresh(entry, self._is_due)
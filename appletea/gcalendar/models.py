@@ -2,10 +2,19 @@
 
 Events object model for Google Calendar API responses.
 """
+import collections
+import heapq
+
+from appletea import serialization
 from appletea.exceptions import HTTPError
+from appletea.gcalendar import recurrence
 from appletea.utils import UnicodeMixin
 
 
+EventChanges = collections.namedtuple(
+    'EventChanges', ['added', 'removed', 'modified', 'fields'])
+
+
 class GCalendarEvents(UnicodeMixin):
     """GCalendarEvents data object.
 
@@ -15,6 +24,119 @@ class GCalendarEvents(UnicodeMixin):
         self._raise_for_status(json.get('error', ''))
         self.json = json
         self.events = [GEventData(item) for item in json.get('items', [])]
+        self._index = None
+
+    def instances(self, time_min, time_max):
+        """Return the events within a time window, recurring events expanded.
+
+        Recurring events are expanded into their instances locally (see
+        appletea.gcalendar.recurrence), so that events can be requested
+        without singleEvents, which is a fraction of the items and pages for
+        long windows. Modified instances (exceptions) replace the instances
+        they override, cancelled instances are left out.
+
+        Args:
+          - time_min: lower bound (exclusive) of the event end times, as
+            datetime (naive datetimes are UTC) or RFC 3339 timestamp.
+          - time_max: upper bound (exclusive) of the event start times.
+
+        Returns:
+          A generator of GEventData objects, in order of start time.
+
+        Raises:
+          A ValueError when a recurring event holds an unsupported rule.
+        """
+        time_zone = self.json.get('timeZone')
+        items = self.json.get('items', [])
+        exceptions = {}
+        for item in items:
+            if 'recurringEventId' in item:
+                exceptions.setdefault(item['recurringEventId'], set()).add(
+                    recurrence.original_start(item, time_zone))
+
+        streams = []
+        for item in items:
+            if item.get('status') == 'cancelled':
+                continue
+            if 'recurrence' in item:
+                events = recurrence.expand(
+                    item, time_min, time_max, time_zone,
+                    exceptions.get(item['id'], ()))
+            elif recurrence.overlaps(item, time_min, time_max, time_zone):
+                events = [item]
+            else:
+                continue
+            streams.append(_keyed(events, len(streams), time_zone))
+        for _, _, event in heapq.merge(*streams):
+            yield GEventData(event)
+
+    def snapshot(self):
+        """Return the version of every event, to compare later events with.
+
+        Returns:
+          A dict mapping event ids to etags, which can be stored as JSON and
+          passed to diff.
+        """
+        return dict((item['id'], _version(item)) for item in self._items())
+
+    def diff(self, previous, fields=False):
+        """Return the changes from previous events to these events.
+
+        Events are matched by id and compared by etag, so unchanged events
+        are not compared any further. Cancelled events count as removed.
+
+        Args:
+          - previous: GCalendarEvents (or EventStore) object, or a snapshot
+            as returned by snapshot.
+          - fields: whether to compare the properties of modified events
+            (only when previous is not a snapshot).
+
+        Returns:
+          An EventChanges (added, removed, modified, fields) tuple: lists of
+          the added and modified GEventData objects and of the ids of the
+          removed events, and if requested a dict mapping the ids of the
+          modified events to dicts mapping the changed properties to
+          (previous, new) value tuples (None otherwise).
+        """
+        return _diff(self, previous, fields)
+
+    def _items(self):
+        return [item for item in self.json.get('items', [])
+                if item.get('status') != 'cancelled']
+
+    def _entries(self):
+        # Yield (id, version, load event) of the events to diff.
+        for item in self._items():
+            yield item['id'], _version(item), lambda item=item: item
+
+    def _event(self, id):
+        if self._index is None:
+            self._index = dict((item['id'], item) for item in self._items())
+        return self._index.get(id)
+
+    def to_bytes(self):
+        """Return a compact binary representation of these events.
+
+        Returns:
+          The serialized events as bytes.
+        """
+        return serialization.dumps(serialization.GCALENDAR_EVENTS, self.json)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Return events from their binary representation.
+
+        Args:
+          - data: serialized events as returned by to_bytes.
+
+        Returns:
+          A GCalendarEvents object.
+
+        Raises:
+          A SerializationError when data is not a serialized GCalendarEvents
+          object.
+        """
+        return cls(serialization.loads(serialization.GCALENDAR_EVENTS, data))
 
     def _raise_for_status(self, e):
         if e:
@@ -34,6 +156,56 @@ class GCalendarEvents(UnicodeMixin):
         return ('<GCalendarEvents instance with %d events>' % len(self.events))
 
 
+def _keyed(events, i, time_zone):
+    # Yield (start, stream, event) tuples, so that events starting at the
+    # same time are merged in stream order rather than compared.
+    for event in events:
+        yield recurrence.start_time(event, time_zone), i, event
+
+
+def _version(item):
+    return item.get('etag') or item.get('updated')
+
+
+def _diff(events, previous, fields):
+    # Diff events (GCalendarEvents or EventStore) with previous events or a
+    # snapshot.
+    if isinstance(previous, dict):
+        versions, old = previous, None
+    else:
+        versions, old = previous.snapshot(), previous._event
+
+    added = []
+    modified = []
+    changes = {} if fields and old is not None else None
+    ids = set()
+    for key, version, load in events._entries():
+        ids.add(key)
+        if key not in versions:
+            added.append(GEventData(load()))
+            continue
+        previous_version = versions[key]
+        if previous_version is not None and previous_version == version:
+            continue
+        item = load()
+        if previous_version is None and (old is None or old(key) == item):
+            continue
+        modified.append(GEventData(item))
+        if changes is not None:
+            changes[key] = _changed(old(key), item)
+    removed = [key for key in versions if key not in ids]
+    return EventChanges(added, removed, modified, changes)
+
+
+def _changed(old, new):
+    # Return the top-level properties that differ between two events.
+    changes = {}
+    for name in set(old) | set(new):
+        if name != 'etag' and old.get(name) != new.get(name):
+            changes[name] = (old.get(name), new.get(name))
+    return changes
+
+
 class GEventData(UnicodeMixin):
     """GEventData data object.
 
@@ -0,0 +1,463 @@
+"""Recurring event expansion.
+
+Expands recurring events into their instances locally, so that events can be
+requested without singleEvents, which returns every instance of a recurring
+event as a separate item.
+
+Supported are the RRULE, RDATE and EXDATE properties of RFC 5545, with the
+FREQ (DAILY, WEEKLY, MONTHLY or YEARLY), INTERVAL, COUNT, UNTIL, BYDAY,
+BYMONTHDAY, BYMONTH and WKST rule parts. Rules are expanded in the wall clock
+time of the event time zone, which is exact on Python 3.9+ (zoneinfo) and
+assumes the UTC offset of the first instance otherwise.
+"""
+import calendar
+import datetime
+import heapq
+import re
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+
+_DAY = datetime.timedelta(days=1)
+_WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+_FREQUENCIES = ['DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY']
+_RULE_PARTS = set(['FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'BYDAY',
+                   'BYMONTHDAY', 'BYMONTH', 'WKST'])
+# Time within which a rule with a COUNT must run out to count as bounded.
+_HORIZON = datetime.timedelta(days=3653)
+
+_DATETIME = re.compile(r'^(\d{4})-(\d\d)-(\d\d)(?:T(\d\d):(\d\d):(\d\d)'
+                       r'(?:\.\d+)?(Z|[+-]\d\d:\d\d)?)?$')
+_ICAL_TIME = re.compile(r'^(\d{4})(\d\d)(\d\d)(?:T(\d\d)(\d\d)(\d\d)(Z)?)?$')
+_BYDAY = re.compile(r'^([+-]?\d{1,2})?(MO|TU|WE|TH|FR|SA|SU)$')
+
+
+class _Zone(object):
+    # Converts between wall clock time of a time zone and UTC (naive
+    # datetimes), falling back to a fixed offset.
+    def __init__(self, name, offset):
+        self.name = name
+        self.offset = offset
+        self.zone = None
+        if name and ZoneInfo is not None:
+            try:
+                self.zone = ZoneInfo(name)
+            except (KeyError, ValueError):
+                pass
+
+    def utcoffset(self, wall):
+        if self.zone is None:
+            return self.offset
+        return wall.replace(tzinfo=self.zone).utcoffset()
+
+    def to_utc(self, wall):
+        return wall - self.utcoffset(wall)
+
+    def to_wall(self, utc):
+        if self.zone is None:
+            return utc + self.offset
+        utc = utc.replace(tzinfo=datetime.timezone.utc)
+        return utc.astimezone(self.zone).replace(tzinfo=None)
+
+
+def _parse_datetime(value):
+    # Return (naive datetime, UTC offset or None, all day) of an RFC 3339
+    # date or timestamp.
+    m = _DATETIME.match(value)
+    if m is None:
+        raise ValueError('Invalid date or time "%s"' % value)
+    year, month, day, hour, minute, second, tz = m.groups()
+    if hour is None:
+        return datetime.datetime(int(year), int(month), int(day)), None, True
+    dt = datetime.datetime(int(year), int(month), int(day), int(hour),
+                           int(minute), int(second))
+    if tz is None:
+        return dt, None, False
+    if tz == 'Z':
+        return dt, datetime.timedelta(0), False
+    offset = datetime.timedelta(hours=int(tz[1:3]), minutes=int(tz[4:6]))
+    return dt, -offset if tz[0] == '-' else offset, False
+
+
+def _parse_ical(value):
+    # Return (naive datetime, UTC) of an iCalendar DATE or DATE-TIME value.
+    m = _ICAL_TIME.match(value)
+    if m is None:
+        raise ValueError('Invalid iCalendar date or time "%s"' % value)
+    values = [int(v) for v in m.groups()[:6] if v is not None]
+    return datetime.datetime(*values), m.group(7) == 'Z'
+
+
+def utc(value):
+    """Return a time as naive UTC datetime.
+
+    Args:
+      - value: datetime (naive datetimes are UTC) or RFC 3339 timestamp.
+    """
+    if isinstance(value, datetime.datetime):
+        if value.utcoffset() is None:
+            return value
+        return (value - value.utcoffset()).replace(tzinfo=None)
+    dt, offset, _ = _parse_datetime(value)
+    return dt - offset if offset else dt
+
+
+def _event_time(time, time_zone):
+    # Return (wall clock time, zone, all day) of an event start or end.
+    wall, offset, all_day = _parse_datetime(
+        time.get('dateTime') or time['date'])
+    zone = _Zone(time.get('timeZone') or time_zone,
+                 offset or datetime.timedelta(0))
+    if offset is not None:
+        wall = zone.to_wall(wall - offset)
+    return wall, zone, all_day
+
+
+def start_time(event, time_zone=None):
+    """Return the start time of an event in UTC.
+
+    Args:
+      - event: event resource.
+      - time_zone: time zone of the calendar, for all day events.
+
+    Returns:
+      A naive datetime.
+    """
+    value = event['start'].get('dateTime')
+    if value:
+        # A timestamp with an offset is a UTC time without the time zone.
+        dt, offset, _ = _parse_datetime(value)
+        if offset is not None:
+            return dt - offset
+    wall, zone, _ = _event_time(event['start'], time_zone)
+    return zone.to_utc(wall)
+
+
+def overlaps(event, time_min, time_max, time_zone=None):
+    """Return whether an event overlaps a time window.
+
+    Args:
+      - event: event resource.
+      - time_min: lower bound (exclusive) of the event end time.
+      - time_max: upper bound (exclusive) of the event start time.
+      - time_zone: time zone of the calendar, for all day events.
+    """
+    start = start_time(event, time_zone)
+    end = start_time({'start': event.get('end', event['start'])}, time_zone)
+    return start < utc(time_max) and end > utc(time_min)
+
+
+def original_start(event, time_zone=None):
+    """Return the key of the original start time of an event instance.
+
+    Args:
+      - event: instance or exception event resource.
+      - time_zone: time zone of the calendar, for all day events.
+
+    Returns:
+      The date of all day instances, the UTC start time of others.
+    """
+    time = event.get('originalStartTime') or event['start']
+    wall, zone, all_day = _event_time(time, time_zone)
+    return wall.date() if all_day else zone.to_utc(wall)
+
+
+def _month_days(year, month, monthdays, bydays):
+    # Return the sorted days of a month matching BYMONTHDAY and BYDAY.
+    n = calendar.monthrange(year, month)[1]
+    days = None
+    if monthdays:
+        days = set(d if d > 0 else n + d + 1 for d in monthdays)
+        days = set(d for d in days if 1 <= d <= n)
+    if bydays:
+        first = calendar.weekday(year, month, 1)
+        matching = set()
+        for ordinal, weekday in bydays:
+            weekdays = list(range(1 + (weekday - first) % 7, n + 1, 7))
+            if ordinal is None:
+                matching.update(weekdays)
+            elif -len(weekdays) <= ordinal - (ordinal > 0) < len(weekdays):
+                matching.add(weekdays[ordinal - (ordinal > 0)])
+        days = matching if days is None else days & matching
+    return [datetime.date(year, month, d) for d in sorted(days)]
+
+
+def _year_days(year, bydays):
+    # Return the sorted days of a year matching BYDAY (without BYMONTH).
+    first = datetime.date(year, 1, 1)
+    n = 366 if calendar.isleap(year) else 365
+    matching = set()
+    for ordinal, weekday in bydays:
+        days = list(range((weekday - first.weekday()) % 7, n, 7))
+        if ordinal is None:
+            matching.update(days)
+        elif -len(days) <= ordinal - (ordinal > 0) < len(days):
+            matching.add(days[ordinal - (ordinal > 0)])
+    return [first + datetime.timedelta(days=d) for d in sorted(matching)]
+
+
+def _parse_rule(rule):
+    parts = dict(p.split('=', 1) for p in rule.split(';') if p)
+    unsupported = set(parts) - _RULE_PARTS
+    if unsupported:
+        raise ValueError('Unsupported recurrence rule part(s): %s' %
+                         ', '.join(sorted(unsupported)))
+    if parts.get('FREQ') not in _FREQUENCIES:
+        raise ValueError('Unsupported recurrence frequency "%s"' %
+                         parts.get('FREQ'))
+    bydays = []
+    for day in parts.get('BYDAY', '').split(','):
+        if day:
+            m = _BYDAY.match(day)
+            if m is None:
+                raise ValueError('Invalid BYDAY value "%s"' % day)
+            ordinal = int(m.group(1)) if m.group(1) else None
+            bydays.append((ordinal, _WEEKDAYS.index(m.group(2))))
+    parts['BYDAY'] = bydays
+    for name in ('BYMONTHDAY', 'BYMONTH'):
+        parts[name] = [int(v) for v in parts.get(name, '').split(',') if v]
+    return parts
+
+
+def _periods(parts, dtstart):
+    # Yield (first day, candidate days) of the consecutive periods of a rule.
+    freq = parts['FREQ']
+    interval = int(parts.get('INTERVAL', 1))
+    bydays = parts['BYDAY']
+    monthdays = parts['BYMONTHDAY']
+    months = parts['BYMONTH']
+    start = dtstart.date()
+
+    if freq == 'DAILY':
+        weekdays = set(w for _, w in bydays)
+        day = start
+        while True:
+            if (not months or day.month in months) and \
+                    (not weekdays or day.weekday() in weekdays) and \
+                    (not monthdays or day in _month_days(
+                        day.year, day.month, monthdays, None)):
+                yield day, [day]
+            else:
+                yield day, []
+            day += interval * _DAY
+
+    elif freq == 'WEEKLY':
+        weekdays = set(w for _, w in bydays) or set([start.weekday()])
+        wkst = _WEEKDAYS.index(parts.get('WKST', 'MO'))
+        week = start - (start.weekday() - wkst) % 7 * _DAY
+        while True:
+            days = [week + i * _DAY for i in range(7)]
+            yield week, [d for d in days if d.weekday() in weekdays and
+                         (not months or d.month in months)]
+            week += 7 * interval * _DAY
+
+    elif freq == 'MONTHLY':
+        if not bydays and not monthdays:
+            monthdays = [start.day]
+        index = start.year * 12 + start.month - 1
+        while True:
+            year, month = divmod(index, 12)
+            month += 1
+            first = datetime.date(year, month, 1)
+            if months and month not in months:
+                yield first, []
+            else:
+                yield first, _month_days(year, month, monthdays, bydays)
+            index += interval
+
+    else:
+        if not bydays and not monthdays:
+            monthdays = [start.day]
+            months = months or [start.month]
+        year = start.year
+        while True:
+            first = datetime.date(year, 1, 1)
+            if bydays and not months and not monthdays:
+                yield first, _year_days(year, bydays)
+            else:
+                yield first, [d for m in (months or range(1, 13))
+                              for d in _month_days(year, m, monthdays,
+                                                   bydays)]
+            year += interval
+
+
+def _rrule(rule, dtstart, end, zone):
+    # Yield the start times of a rule in wall clock time, in order, up to end.
+    # DTSTART is the first instance (RFC 5545) and counts towards COUNT even
+    # when it does not match the rule; it is left to the caller to yield.
+    parts = _parse_rule(rule)
+    count = int(parts['COUNT']) if 'COUNT' in parts else None
+    until = None
+    if 'UNTIL' in parts:
+        until, is_utc = _parse_ical(parts['UNTIL'])
+        if is_utc:
+            until = zone.to_wall(until)
+        elif len(parts['UNTIL']) == 8:
+            until += _DAY - datetime.timedelta(microseconds=1)
+    n = 1
+    if count is not None and n >= count:
+        return
+    try:
+        for first, days in _periods(parts, dtstart):
+            if first > end.date():
+                return
+            for day in days:
+                dt = datetime.datetime.combine(day, dtstart.time())
+                if dt <= dtstart:
+                    continue
+                if until is not None and dt > until:
+                    return
+                yield dt
+                n += 1
+                if count is not None and n >= count:
+                    return
+    except OverflowError:
+        return
+
+
+def expand(event, time_min, time_max, time_zone=None, exceptions=()):
+    """Expand a recurring event into its instances within a time window.
+
+    Instances are generated on demand, in order of start time, and take the
+    form of the instances returned by the Calendar API with singleEvents: a
+    copy of the recurring event with its own id, start, end and
+    originalStartTime, and the id of the recurring event as recurringEventId.
+
+    Args:
+      - event: recurring event resource (with a recurrence property).
+      - time_min: lower bound (exclusive) of the instance end times, as
+        datetime (naive datetimes are UTC) or RFC 3339 timestamp.
+      - time_max: upper bound (exclusive) of the instance start times.
+      - time_zone: time zone of the calendar, for all day events.
+      - exceptions: original start keys (see original_start) of the
+        instances to leave out, e.g. because they were modified or cancelled.
+
+    Returns:
+      A generator of event resources.
+
+    Raises:
+      A ValueError when the recurrence holds an unsupported rule.
+    """
+    time_min, time_max = utc(time_min), utc(time_max)
+    dtstart, zone, all_day = _event_time(event['start'], time_zone)
+    dtend = _event_time(event.get('end', event['start']), time_zone)[0]
+    duration = dtend - dtstart
+    end = zone.to_wall(time_max) + _DAY
+
+    starts = [iter([dtstart])]
+    rdates = []
+    exdates = set()
+    for line in event.get('recurrence', []):
+        name, _, value = line.partition(':')
+        name = name.split(';')[0]
+        if name == 'RRULE':
+            starts.append(_rrule(value, dtstart, end, zone))
+        elif name in ('RDATE', 'EXDATE'):
+            for v in value.split(','):
+                dt, is_utc = _parse_ical(v)
+                if is_utc:
+                    dt = zone.to_wall(dt)
+                elif len(v) == 8:
+                    # A date designates the instance on that day.
+                    dt = datetime.datetime.combine(dt.date(), dtstart.time())
+                if name == 'RDATE':
+                    rdates.append(dt)
+                else:
+                    exdates.add(dt)
+        else:
+            raise ValueError('Unsupported recurrence property "%s"' % name)
+    starts.append(iter(sorted(rdates)))
+
+    exceptions = set(exceptions)
+    previous = None
+    for start in heapq.merge(*starts):
+        if start == previous:
+            continue
+        previous = start
+        if start in exdates:
+            continue
+        start_utc = zone.to_utc(start)
+        if start_utc >= time_max:
+            return
+        if zone.to_utc(start + duration) <= time_min:
+            continue
+        if (start.date() if all_day else start_utc) in exceptions:
+            continue
+        yield _instance(event, start, duration, zone, all_day)
+
+
+def last_start(event, time_zone=None):
+    """Return a bound on the start times of the instances of an event.
+
+    The bound is the start of the last instance, or the UNTIL time of rules
+    that end on one (a day later when it is a date), so that events that
+    ended before a time window can be told apart without expanding them.
+
+    Args:
+      - event: recurring event resource.
+      - time_zone: time zone of the calendar, for all day events.
+
+    Returns:
+      A naive UTC datetime, or None when the event recurs forever.
+
+    Raises:
+      A ValueError when the recurrence holds an unsupported rule.
+    """
+    dtstart, zone, _ = _event_time(event['start'], time_zone)
+    last = dtstart
+    for line in event.get('recurrence', []):
+        name, _, value = line.partition(':')
+        name = name.split(';')[0]
+        if name == 'RRULE':
+            parts = _parse_rule(value)
+            if 'UNTIL' in parts:
+                until, is_utc = _parse_ical(parts['UNTIL'])
+                last = max(last, zone.to_wall(until) if is_utc
+                           else until + _DAY)
+            elif 'COUNT' in parts:
+                # Rules that do not run out within the horizon (e.g. that
+                # never match) are taken to recur forever.
+                horizon = min(dtstart, datetime.datetime.max - _HORIZON)
+                starts = list(_rrule(value, dtstart, horizon + _HORIZON,
+                                     zone))
+                if len(starts) + 1 < int(parts['COUNT']):
+                    return None
+                last = max([last] + starts)
+            else:
+                return None
+        elif name == 'RDATE':
+            for v in value.split(','):
+                dt, is_utc = _parse_ical(v)
+                last = max(last, zone.to_wall(dt) if is_utc else dt + _DAY)
+    return zone.to_utc(last)
+
+
+def _format(wall, zone, all_day):
+    if all_day:
+        return {'date': wall.date().isoformat()}
+    offset = zone.utcoffset(wall)
+    minutes = int(offset.total_seconds()) // 60
+    sign = '-' if minutes < 0 else '+'
+    time = {'dateTime': '%s%s%02d:%02d' % (
+        wall.isoformat(), sign, abs(minutes) // 60, abs(minutes) % 60)}
+    if zone.name:
+        time['timeZone'] = zone.name
+    return time
+
+
+def _instance(event, start, duration, zone, all_day):
+    instance = dict(event)
+    del instance['recurrence']
+    if all_day:
+        suffix = start.strftime('%Y%m%d')
+    else:
+        suffix = zone.to_utc(start).strftime('%Y%m%dT%H%M%SZ')
+    instance['id'] = '%s_%s' % (event['id'], suffix)
+    instance['recurringEventId'] = event['id']
+    instance['start'] = _format(start, zone, all_day)
+    instance['originalStartTime'] = _format(start, zone, all_day)
+    instance['end'] = _format(start + duration, zone, all_day)
+    return instance
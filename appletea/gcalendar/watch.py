@@ -0,0 +1,482 @@
+"""Calendar push notifications.
+
+Keeps track of the events of many calendars from push notifications instead
+of polling. A channel is opened on the events of every watched calendar (see
+api.watch_events) and renewed before it expires; a local webhook receiver
+answers the notifications of the Calendar API and fetches the changes of the
+notified calendar only (an incremental sync with the sync token of the
+previous fetch):
+
+  def changed(watch, events):
+      store.update(events)
+
+  with WatchManager('https://example.com/calendar-notifications',
+                    listen=('127.0.0.1', 8080)) as manager:
+      manager.register(credentials.get(credentials_json), callback=changed)
+      ...
+
+The Calendar API only posts notifications to HTTPS URLs of verified domains,
+so the receiver usually runs behind a reverse proxy forwarding address to
+listen. Like appletea.gcalendar.api, the Google client libraries are imported
+on first use.
+"""
+import binascii
+import heapq
+import itertools
+import os
+import threading
+import time
+
+try:
+    import queue
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2
+    import Queue as queue
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from appletea.gcalendar import api
+from appletea.gcalendar.models import GCalendarEvents
+from appletea.utils import UnicodeMixin
+
+
+# Resource states of notifications telling that events changed. A 'sync'
+# notification only confirms a new channel.
+_CHANGED = frozenset(['exists', 'not_exists'])
+
+
+def _status(error):
+    # Return the HTTP status of an apiclient HttpError, or None.
+    return getattr(getattr(error, 'resp', None), 'status', None)
+
+
+def fetch_events(credentials, calendarId='primary', sync_token=None,
+                 **kwargs):
+    """Return all events of a calendar, or the events changed since a sync.
+
+    Follows the result pages of get_events, so that the result holds the
+    nextSyncToken of the calendar.
+
+    Args:
+      - credentials: Oauth2.0 crendentials object, as JSON or as parsed
+        OAuth2Credentials.
+      - calendarId: calendar identifier.
+      - sync_token: nextSyncToken of previous events, to only return the
+        events changed since (including deleted events, as cancelled).
+      - kwargs: additional arguments passed to get_events, which must be
+        allowed along with a syncToken (e.g. singleEvents or maxResults).
+
+    Returns:
+      A GCalendarEvents object with the events of all pages.
+
+    Raises:
+      An HttpError with status 410 when the sync token expired (the events
+      must then be fetched anew).
+    """
+    if sync_token is not None:
+        kwargs['syncToken'] = sync_token
+    items = []
+    while True:
+        json = api.get_events(credentials, calendarId, **kwargs).json
+        items.extend(json.get('items', []))
+        if not json.get('nextPageToken'):
+            break
+        kwargs['pageToken'] = json['nextPageToken']
+    json = dict(json, items=items)
+    json.pop('nextPageToken', None)
+    return GCalendarEvents(json)
+
+
+def notify(address, channel, state='exists', number=1):
+    """Post a notification as the Calendar API does, e.g. to test a receiver.
+
+    Args:
+      - address: URL of the receiver.
+      - channel: channel resource as returned by api.watch_events, with the
+        token of the channel if it has one.
+      - state: resource state: 'sync' for the first notification of a
+        channel, 'exists' when events changed.
+      - number: message number of the notification.
+
+    Returns:
+      The status code of the response.
+    """
+    headers = {
+        'X-Goog-Channel-ID': channel['id'],
+        'X-Goog-Resource-ID': channel.get('resourceId', ''),
+        'X-Goog-Resource-URI': channel.get('resourceUri', ''),
+        'X-Goog-Resource-State': state,
+        'X-Goog-Message-Number': str(number),
+    }
+    if channel.get('token'):
+        headers['X-Goog-Channel-Token'] = channel['token']
+    return requests.post(address, headers=headers, timeout=5).status_code
+
+
+class Watch(UnicodeMixin):
+    """Watch object.
+
+    The watched events of one calendar, as registered with a WatchManager:
+
+    - credentials, calendar_id, callback, kwargs: as registered.
+    - channel: the open channel resource, or None.
+    - sync_token: the nextSyncToken of the last fetch.
+    - synced: UNIX time of the last fetch.
+    - error: the exception of the last failed fetch or channel renewal, or
+      None.
+    """
+    def __init__(self, credentials, calendar_id, callback, kwargs):
+        self.credentials = credentials
+        self.calendar_id = calendar_id
+        self.callback = callback
+        self.kwargs = kwargs
+        self.channel = None
+        self.sync_token = None
+        self.synced = None
+        self.error = None
+        self.token = binascii.hexlify(os.urandom(16)).decode('ascii')
+        self.failures = 0
+        self.version = 0
+        self.removed = False
+        self.queued = False
+        self.lock = threading.Lock()
+
+    def __unicode__(self):
+        return '<Watch instance: %s>' % self.calendar_id
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.send_response(self.server.manager.handle(self.headers))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class WatchManager(UnicodeMixin):
+    """Watch manager object.
+
+    Registered calendars are fetched once in full, and then again
+    incrementally on every notification of a change. Notifications arriving
+    while a calendar is fetched are coalesced into one more fetch. The
+    callback of a calendar is called with the Watch and a GCalendarEvents
+    object of the events fetched: all events the first time (or when the
+    sync token expired), the changed events afterwards, deleted events
+    included as cancelled.
+
+    Channels are renewed lead seconds before they expire (or halfway through
+    their lifetime if shorter than lead): a new channel is opened, the
+    calendar fetched for changes missed meanwhile, and the old channel
+    stopped. Failed renewals are retried with exponential backoff.
+    Optionally, calendars are also fetched every poll seconds, in case
+    notifications were lost.
+
+    Notifications of unknown channels are answered with 404 and those with
+    a wrong token with 403. Credentials should be kept fresh by a
+    CredentialManager.
+
+    Args:
+      - address: HTTPS URL the Calendar API posts notifications to.
+      - listen: (host, port) address of the local receiver, or None to
+        answer notifications with handle from another web server.
+      - ttl: requested lifetime of the channels in seconds (the default of
+        the API if None, one week at most).
+      - lead: number of seconds before expiry at which channels are renewed.
+      - poll: number of seconds between fetches of calendars regardless of
+        notifications (never if None).
+      - concurrency: number of threads fetching calendars.
+      - retry: delay in seconds before the first retry of a failed renewal.
+      - clock: function returning the current UNIX time.
+    """
+    def __init__(self, address, listen=('127.0.0.1', 8080), ttl=None,
+                 lead=3600, poll=None, concurrency=4, retry=30,
+                 clock=time.time):
+        self.address = address
+        self.listen = listen
+        self.ttl = ttl
+        self.lead = lead
+        self.poll = poll
+        self.concurrency = concurrency
+        self.retry = retry
+        self._clock = clock
+        self._watches = set()
+        self._channels = {}
+        self._due = []
+        self._seq = itertools.count()
+        self._fetches = queue.Queue()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        self._httpd = None
+
+    @property
+    def url(self):
+        """Return the URL of the local receiver."""
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def register(self, credentials, calendarId='primary', callback=None,
+                 **kwargs):
+        """Watch the events of a calendar.
+
+        Opens a channel and fetches all events of the calendar (calling
+        callback) before returning.
+
+        Args:
+          - credentials: Oauth2.0 crendentials object, as JSON or as parsed
+            OAuth2Credentials.
+          - calendarId: calendar identifier.
+          - callback: optional function called with the Watch and the
+            fetched events on every fetch.
+          - kwargs: additional arguments passed to get_events (see
+            fetch_events).
+
+        Returns:
+          A Watch object.
+
+        Raises:
+          An HttpError when the channel cannot be opened or the events
+          cannot be fetched.
+        """
+        watch = Watch(credentials, calendarId, callback, kwargs)
+        with watch.lock:
+            # Open the channel first, so that no change is missed.
+            self._open(watch)
+            with self._cond:
+                self._watches.add(watch)
+            try:
+                self._fetch(watch, raise_errors=True)
+            except Exception:
+                self.unregister(watch)
+                raise
+        if self.poll is not None:
+            with self._cond:
+                self._schedule(watch, self._clock() + self.poll, 'poll')
+        return watch
+
+    def unregister(self, watch):
+        """Stop watching a calendar and stop its channel."""
+        with self._cond:
+            watch.removed = True
+            watch.version += 1
+            self._watches.discard(watch)
+            channel, watch.channel = watch.channel, None
+        if channel is not None:
+            self._close(watch, channel)
+
+    def handle(self, headers):
+        """Answer a notification.
+
+        Args:
+          - headers: the headers of the notification request (a mapping).
+
+        Returns:
+          The HTTP status of the response.
+        """
+        headers = CaseInsensitiveDict(headers.items())
+        with self._cond:
+            watch = self._channels.get(headers.get('X-Goog-Channel-ID'))
+        if watch is None:
+            return 404
+        if headers.get('X-Goog-Channel-Token') != watch.token:
+            return 403
+        if headers.get('X-Goog-Resource-State') in _CHANGED:
+            self._enqueue(watch)
+        return 200
+
+    def start(self):
+        """Start the receiver and the background threads."""
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+        if self.listen is not None:
+            self._httpd = _HTTPServer(self.listen, _Handler)
+            self._httpd.manager = self
+            self._threads.append(threading.Thread(
+                target=self._httpd.serve_forever))
+        self._threads.append(threading.Thread(target=self._renew))
+        for _ in range(self.concurrency):
+            self._threads.append(threading.Thread(target=self._work))
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+        return self
+
+    def stop(self, close=True):
+        """Stop the receiver and the background threads.
+
+        Args:
+          - close: whether to stop the channels of all watched calendars as
+            well, so that the Calendar API stops posting notifications.
+        """
+        with self._cond:
+            running, self._running = self._running, False
+            self._cond.notify_all()
+        if running:
+            if self._httpd is not None:
+                self._httpd.shutdown()
+                self._httpd.server_close()
+            for _ in range(self.concurrency):
+                self._fetches.put(None)
+            for t in self._threads:
+                t.join()
+            self._threads = []
+            self._httpd = None
+        if close:
+            for watch in list(self._watches):
+                self.unregister(watch)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __contains__(self, watch):
+        return watch in self._watches
+
+    def __len__(self):
+        return len(self._watches)
+
+    def __unicode__(self):
+        return '<WatchManager instance with %d calendars>' % len(self)
+
+    def _open(self, watch):
+        # Open a new channel for a calendar and schedule its renewal. Return
+        # the channel to close: the previous one, or the new one when the
+        # calendar was unregistered meanwhile.
+        channel = api.watch_events(watch.credentials, self.address,
+                                   watch.calendar_id, token=watch.token,
+                                   ttl=self.ttl)
+        channel.setdefault('token', watch.token)
+        expiration = channel.get('expiration')
+        with self._cond:
+            if watch.removed:
+                return channel
+            old, watch.channel = watch.channel, channel
+            self._channels[channel['id']] = watch
+            watch.failures = 0
+            if expiration:
+                # Renew lead seconds before expiry, but not before half the
+                # lifetime of the channel (when it is shorter than lead).
+                expiration = int(expiration) / 1000.0
+                now = self._clock()
+                due = max(expiration - self.lead, (now + expiration) / 2)
+                self._schedule(watch, due, 'renew')
+        return old
+
+    def _close(self, watch, channel):
+        with self._cond:
+            self._channels.pop(channel['id'], None)
+        try:
+            api.stop_channel(watch.credentials, channel)
+        except Exception:
+            # The channel expires anyway.
+            pass
+
+    def _schedule(self, watch, due, kind):
+        if kind == 'renew':
+            watch.version += 1
+        heapq.heappush(self._due,
+                       (due, next(self._seq), watch.version, kind, watch))
+        self._cond.notify()
+
+    def _take(self):
+        # Return the next due (kind, watch), or None when stopped.
+        with self._cond:
+            while self._running:
+                now = self._clock()
+                if self._due and self._due[0][0] <= now:
+                    _, _, version, kind, watch = heapq.heappop(self._due)
+                    if watch.removed or (kind == 'renew' and
+                                         version != watch.version):
+                        continue
+                    return kind, watch
+                timeout = self._due[0][0] - now if self._due else None
+                self._cond.wait(timeout)
+            return None
+
+    def _renew(self):
+        while True:
+            task = self._take()
+            if task is None:
+                return
+            kind, watch = task
+            if kind == 'poll':
+                self._enqueue(watch)
+                with self._cond:
+                    self._schedule(watch, self._clock() + self.poll, 'poll')
+                continue
+            try:
+                old = self._open(watch)
+            except Exception as e:
+                with self._cond:
+                    watch.error = e
+                    watch.failures += 1
+                    delay = min(self.lead,
+                                self.retry * 2 ** (watch.failures - 1))
+                    self._schedule(watch, self._clock() + delay, 'renew')
+                continue
+            self._enqueue(watch)
+            if old is not None:
+                self._close(watch, old)
+
+    def _enqueue(self, watch):
+        # Queue a fetch of a calendar, unless one is queued already.
+        with self._cond:
+            if watch.queued or watch.removed:
+                return
+            watch.queued = True
+        self._fetches.put(watch)
+
+    def _work(self):
+        while True:
+            watch = self._fetches.get()
+            if watch is None:
+                return
+            with watch.lock:
+                with self._cond:
+                    watch.queued = False
+                if not watch.removed:
+                    self._fetch(watch)
+
+    def _fetch(self, watch, raise_errors=False):
+        # Fetch the changes of a calendar (all events without sync token)
+        # and pass them to its callback. Called with the lock of the watch.
+        try:
+            try:
+                events = fetch_events(watch.credentials, watch.calendar_id,
+                                      watch.sync_token, **watch.kwargs)
+            except Exception as e:
+                if watch.sync_token is None or _status(e) != 410:
+                    raise
+                # The sync token expired, fetch all events again.
+                watch.sync_token = None
+                events = fetch_events(watch.credentials, watch.calendar_id,
+                                      **watch.kwargs)
+            watch.sync_token = events.json.get('nextSyncToken')
+            watch.synced = self._clock()
+            watch.error = None
+            if watch.callback is not None:
+                watch.callback(watch, events)
+        except Exception as e:
+            watch.error = e
+            if raise_errors:
+                raise
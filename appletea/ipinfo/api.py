@@ -3,12 +3,21 @@
 A REST client library for ipinfo.io APIs.
 """
 import json
-import requests
 
+from appletea import client
 from appletea.ipinfo.models import IpInfo
 
 
-def get_ipinfo(ip='', param='json'):
+BASE_URL = 'http://ipinfo.io'
+
+# Default transport sending the requests of calls without transport (see
+# appletea.transport), requests (HTTP/1.1) if None. Set to an HTTP2Transport
+# to multiplex concurrent requests over one HTTP/2 connection.
+TRANSPORT = None
+
+
+def get_ipinfo(ip='', param='json', cache=None, deadline=None,
+               transport=None):
     """Return IP address location information.
 
     Return an IP address location data object. You can pass in the IP you are
@@ -22,25 +31,34 @@ def get_ipinfo(ip='', param='json'):
       - ip: locally bound IP address if omitted.
       - param: optional argument can be 'ip', 'hostname', 'city', 'region',
         'country', 'loc', 'org' or 'postal'.
+      - cache: an optional appletea.cache.ResponseCache. Cached objects are
+        reused while fresh and revalidated with a conditional request once
+        stale.
+      - deadline: an optional appletea.deadline.Deadline bounding the request
+        (the current deadline if None).
+      - transport: transport sending the request (see appletea.transport),
+        TRANSPORT if None.
 
     Returns:
       An IP address location object with methods for accessing its data.
 
     Raises:
       A request.HTTPError when a bad request is made (a 4xx client error or 5xx
-      server error response).
+      server error response), a DeadlineExceeded when the deadline passes
+      first.
     """
     if ip:
         urlpart = '%s/%s' % (ip, param)
     else:
         urlpart = param
 
-    response = requests.get('http://ipinfo.io/%s' % urlpart, timeout=5)
-    response.raise_for_status()
+    def parse(response):
+        if param == 'json':
+            data = client.decode(response)
+        else:
+            data = json.dumps({param: response.text.strip()})
 
-    if param == 'json':
-        data = response.json()
-    else:
-        data = json.dumps({param: response.text.strip()})
+        return IpInfo(data)
 
-    return IpInfo(data)
+    return client.get('%s/%s' % (BASE_URL, urlpart), parse, cache=cache,
+                      transport=transport or TRANSPORT, deadline=deadline)
@@ -2,6 +2,7 @@
 
 Data object model for IP information API responses.
 """
+from appletea import serialization
 from appletea.utils import UnicodeMixin
 
 
@@ -26,6 +27,45 @@ class IpInfo(UnicodeMixin):
         location = self.__getattr__('loc')
         return tuple(location.split(','))
 
+    @property
+    def coordinates(self):
+        """Return location information as numbers.
+
+        Returns:
+          A tuple of geographic latitude and longitude coordinates in decimal
+          degrees, as floats.
+        """
+        coordinates = self.__dict__.get('_coordinates')
+        if coordinates is None:
+            latitude, longitude = self.loc
+            coordinates = self._coordinates = (float(latitude),
+                                               float(longitude))
+        return coordinates
+
+    def to_bytes(self):
+        """Return a compact binary representation of this object.
+
+        Returns:
+          The serialized IP address location object as bytes.
+        """
+        return serialization.dumps(serialization.IPINFO, self.json)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Return an IP address location object from its binary
+        representation.
+
+        Args:
+          - data: serialized object as returned by to_bytes.
+
+        Returns:
+          An IpInfo object.
+
+        Raises:
+          A SerializationError when data is not a serialized IpInfo object.
+        """
+        return cls(serialization.loads(serialization.IPINFO, data))
+
     def __getattr__(self, name):
         try:
             return self.json[name]
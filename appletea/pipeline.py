@@ -0,0 +1,163 @@
+"""IP address to weather pipeline.
+
+Looks up the weather at the location of many IP addresses, overlapping the
+IP information and forecast requests.
+"""
+import collections
+import itertools
+import threading
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from appletea.exceptions import DeadlineExceeded
+from appletea.forecastio import api as forecastio
+from appletea.ipinfo import api as ipinfo
+
+
+WeatherResult = collections.namedtuple(
+    'WeatherResult', ['ip', 'ipinfo', 'forecast', 'error'])
+
+_FORECAST, _IPINFO, _STOP = range(3)
+
+
+def get_weather(key, ips, concurrency=8, cache=None, deadline=None,
+                **kwargs):
+    """Return the forecasts at the locations of IP addresses.
+
+    IP addresses are looked up by a pool of threads, and the forecast of a
+    location is requested as soon as the first IP address at that location is
+    known, so that both stages overlap. Duplicate IP addresses and locations
+    are requested once. Results are yielded as they complete, not in the order
+    of the IP addresses:
+
+      for result in get_weather(key, ips):
+          if result.error is None:
+              print(result.ip, result.forecast.currently.temperature)
+
+    Args:
+      - key: Dark Sky API key.
+      - ips: iterable of IP addresses.
+      - concurrency: maximum number of simultaneous requests.
+      - cache: an optional appletea.cache.ResponseCache, used for both the
+        IP information and forecast responses.
+      - deadline: an optional appletea.deadline.Deadline bounding all
+        requests. When it passes or is cancelled, the outstanding requests
+        are abandoned and the remaining results are yielded at once with a
+        DeadlineExceeded error (and their IP information, if known).
+      - kwargs: additional arguments passed to get_forecast.
+
+    Returns:
+      A generator of WeatherResult (ip, ipinfo, forecast, error) tuples, one
+      per distinct IP address. Error holds the exception of the failed
+      request, in which case forecast (and ipinfo, if the IP address lookup
+      failed) is None.
+    """
+    return _Pipeline(key, cache, deadline, kwargs).run(ips, concurrency)
+
+
+class _Pipeline(object):
+    def __init__(self, key, cache, deadline, kwargs):
+        self.key = key
+        self.cache = cache
+        self.deadline = deadline
+        self.kwargs = kwargs
+        self._tasks = queue.PriorityQueue()
+        self._results = queue.Queue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._waiting = {}
+        self._forecasts = {}
+        self._located = {}
+        self._stopped = False
+
+    def run(self, ips, concurrency):
+        ips = list(collections.OrderedDict.fromkeys(ips))
+        if not ips:
+            return
+        for ip in ips:
+            self._put(_IPINFO, ip)
+        for _ in range(min(concurrency, len(ips))):
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+        if self.deadline is not None:
+            # Stop waiting for results once cancelled.
+            self.deadline.add_callback(lambda: self._results.put(None))
+        try:
+            pending = set(ips)
+            while pending:
+                result = self._next()
+                if result is None:
+                    break
+                pending.discard(result.ip)
+                yield result
+            for ip in ips:
+                if ip in pending:
+                    yield WeatherResult(ip, self._located.get(ip), None,
+                                        DeadlineExceeded('Deadline exceeded'))
+        finally:
+            self._stopped = True
+            for _ in range(concurrency):
+                self._put(_STOP, None)
+
+    def _next(self):
+        # Return the next result, or None when the deadline passed.
+        if self.deadline is None:
+            return self._results.get()
+        try:
+            return self._results.get(timeout=self.deadline.remaining())
+        except queue.Empty:
+            return None
+
+    def _put(self, stage, arg):
+        # Forecasts go first, so that results stream out early.
+        self._tasks.put((stage, next(self._seq), arg))
+
+    def _work(self):
+        while True:
+            stage, _, arg = self._tasks.get()
+            if stage == _STOP or self._stopped:
+                return
+            if stage == _IPINFO:
+                self._locate(arg)
+            else:
+                self._forecast(arg)
+
+    def _locate(self, ip):
+        try:
+            info = ipinfo.get_ipinfo(ip, cache=self.cache,
+                                     deadline=self.deadline)
+            coordinates = info.coordinates
+        except Exception as e:
+            self._results.put(WeatherResult(ip, None, None, e))
+            return
+        with self._lock:
+            self._located[ip] = info
+            done = self._forecasts.get(coordinates)
+            if done is None:
+                waiting = self._waiting.get(coordinates)
+                if waiting is None:
+                    self._waiting[coordinates] = [(ip, info)]
+                    self._put(_FORECAST, coordinates)
+                else:
+                    waiting.append((ip, info))
+                return
+        self._results.put(WeatherResult(ip, info, *done))
+
+    def _forecast(self, coordinates):
+        latitude, longitude = coordinates
+        try:
+            done = forecastio.get_forecast(self.key, latitude, longitude,
+                                           cache=self.cache,
+                                           deadline=self.deadline,
+                                           **self.kwargs), None
+        except Exception as e:
+            done = None, e
+        with self._lock:
+            self._forecasts[coordinates] = done
+            waiting = self._waiting.pop(coordinates)
+        for ip, info in waiting:
+            self._results.put(WeatherResult(ip, info, *done))
@@ -0,0 +1,223 @@
+"""Binary serialization.
+
+Compact, versioned binary serialization of appletea data objects, used to
+store them in caches or ship them between processes. Transport objects (such
+as the HTTP response a forecast was fetched with) are dropped.
+
+A serialized object consists of a 4-byte header (magic 'AT', format version
+and object kind) followed by a msgpack document. Forecast data blocks are
+stored column by column: numeric columns as packed little-endian int64 or
+float64 arrays (integers with gaps and mixed columns with a packed mask of
+the kind of each value) and string columns as a table of distinct strings
+plus packed indices.
+"""
+import array
+import struct
+import sys
+
+from appletea.exceptions import SerializationError
+
+
+MAGIC = b'AT'
+VERSION = 1
+
+FORECAST = 1
+IPINFO = 2
+GCALENDAR_EVENTS = 3
+
+_HEADER = struct.Struct('<2sBB')
+_MISSING = float('nan')
+_INT64 = 2 ** 63
+try:
+    _INTEGERS = frozenset([int, long])
+except NameError:  # Python 3
+    _INTEGERS = frozenset([int])
+_NUMBERS = _INTEGERS | frozenset([float])
+
+# Kinds of the values of a mixed numeric column.
+_ABSENT, _INTEGER, _FLOAT = 0, 1, 2
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError('Binary serialization requires msgpack, '
+                          'install it with: pip install msgpack')
+    return msgpack
+
+
+def dumps(kind, body):
+    """Return the binary representation of a document.
+
+    Args:
+      - kind: object kind stored in the header (FORECAST, IPINFO, ...).
+      - body: document made of dicts, lists, strings, numbers and bytes.
+
+    Returns:
+      The serialized document as bytes.
+    """
+    msgpack = _msgpack()
+    return _HEADER.pack(MAGIC, VERSION, kind) + msgpack.packb(
+        body, use_bin_type=True)
+
+
+def loads(kind, data):
+    """Return the document from its binary representation.
+
+    Args:
+      - kind: expected object kind.
+      - data: serialized document as returned by dumps.
+
+    Returns:
+      The deserialized document.
+
+    Raises:
+      A SerializationError when data is not a serialized document of the
+      expected kind or was written by an unsupported format version.
+    """
+    msgpack = _msgpack()
+    try:
+        magic, version, k = _HEADER.unpack_from(data)
+    except struct.error:
+        raise SerializationError('Truncated header')
+    if magic != MAGIC:
+        raise SerializationError('Not an appletea serialized object')
+    if version != VERSION:
+        raise SerializationError('Unsupported format version %d' % version)
+    if k != kind:
+        raise SerializationError('Expected object kind %d, got %d' %
+                                 (kind, k))
+    try:
+        return msgpack.unpackb(data[_HEADER.size:], raw=False)
+    except Exception as e:
+        raise SerializationError('Corrupt document: %s' % e)
+
+
+def _packed(typecode, values):
+    a = array.array(typecode, values)
+    if sys.byteorder == 'big':
+        a.byteswap()
+    try:
+        return a.tobytes()
+    except AttributeError:  # Python 2
+        return a.tostring()
+
+
+def _unpacked(typecode, data):
+    a = array.array(typecode)
+    try:
+        a.frombytes(data)
+    except AttributeError:  # Python 2
+        a.fromstring(data)
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a
+
+
+def pack_columns(rows):
+    """Return a list of dicts packed column by column.
+
+    Args:
+      - rows: list of dicts (such as the data points of a data block).
+
+    Returns:
+      A dict with the number of rows and a mapping of keys to columns.
+    """
+    keys = []
+    seen = set()
+    for row in rows:
+        for k in row:
+            if k not in seen:
+                seen.add(k)
+                keys.append(k)
+
+    columns = {}
+    for k in keys:
+        values = [row.get(k, None) for row in rows]
+        types = set(map(type, values))
+        complete = type(None) not in types
+        types.discard(type(None))
+        integers = [v for v in values
+                    if v is not None and type(v) is not float]
+        if types and types <= _NUMBERS and all(
+                -_INT64 <= v < _INT64 for v in integers):
+            if types <= _INTEGERS and complete:
+                columns[k] = ['q', _packed('q', values)]
+            elif types <= _INTEGERS:
+                # Packed with a mask of the rows holding a value.
+                columns[k] = ['j',
+                              _packed('B', [v is not None for v in values]),
+                              _packed('q', [v or 0 for v in values])]
+            elif types == set([float]):
+                values = [_MISSING if v is None else v for v in values]
+                columns[k] = ['d', _packed('d', values)]
+            else:
+                # Integers and floats packed separately, with a mask of the
+                # kind of every value.
+                kinds = [_ABSENT if v is None else
+                         _FLOAT if type(v) is float else _INTEGER
+                         for v in values]
+                ints = [v if kind == _INTEGER else 0
+                        for v, kind in zip(values, kinds)]
+                floats = [v if kind == _FLOAT else 0.0
+                          for v, kind in zip(values, kinds)]
+                columns[k] = ['n', _packed('B', kinds), _packed('q', ints),
+                              _packed('d', floats)]
+        elif types == set([str]):
+            table = []
+            index = {}
+            codes = []
+            for v in values:
+                if v is None:
+                    codes.append(0)
+                    continue
+                if v not in index:
+                    table.append(v)
+                    index[v] = len(table)
+                codes.append(index[v])
+            columns[k] = ['s', table, _packed('I', codes)]
+        else:
+            missing = [i for i, row in enumerate(rows) if k not in row]
+            columns[k] = ['o', values, missing]
+    return {'n': len(rows), 'columns': columns}
+
+
+def unpack_columns(packed):
+    """Return the list of dicts packed by pack_columns."""
+    rows = [{} for _ in range(packed['n'])]
+    for k, column in packed['columns'].items():
+        typecode = column[0]
+        if typecode == 'q':
+            for row, v in zip(rows, _unpacked('q', column[1])):
+                row[k] = v
+        elif typecode == 'd':
+            for row, v in zip(rows, _unpacked('d', column[1])):
+                if v == v:  # NaN marks a missing value
+                    row[k] = v
+        elif typecode == 'j':
+            for row, present, v in zip(rows, _unpacked('B', column[1]),
+                                       _unpacked('q', column[2])):
+                if present:
+                    row[k] = v
+        elif typecode == 'n':
+            for row, kind, i, f in zip(rows, _unpacked('B', column[1]),
+                                       _unpacked('q', column[2]),
+                                       _unpacked('d', column[3])):
+                if kind == _INTEGER:
+                    row[k] = i
+                elif kind == _FLOAT:
+                    row[k] = f
+        elif typecode == 's':
+            table = column[1]
+            for row, code in zip(rows, _unpacked('I', column[2])):
+                if code:
+                    row[k] = table[code - 1]
+        elif typecode == 'o':
+            missing = set(column[2])
+            for i, (row, v) in enumerate(zip(rows, column[1])):
+                if i not in missing:
+                    row[k] = v
+        else:
+            raise SerializationError('Unknown column type "%s"' % typecode)
+    return rows
@@ -0,0 +1,409 @@
+"""Sidecar server.
+
+A long-running local server answering forecast, IP information and calendar
+requests for the processes of a host, whatever their language, from one
+shared response cache, connection pool and rate limit:
+
+  python -m appletea.server --key KEY --port 8787 --forecast-rate 0.0115
+
+The forecast and IP information endpoints mirror the URLs of the APIs, so
+that a client only needs another base URL (e.g. forecastio.api.BASE_URL =
+'http://127.0.0.1:8787/forecast'):
+
+  - GET /forecast/<key>/<latitude>,<longitude>[,<time>]?<params>: the
+    forecast as returned by get_forecast. The key may be omitted when the
+    server has one. The query may hold the units, exclude, extend and lang
+    parameters of the API.
+  - GET /ipinfo/json, GET /ipinfo/<ip>/json: the IP information as returned
+    by get_ipinfo.
+  - POST /events: the events of a calendar as returned by get_events. The
+    body is a JSON object with the credentials (JSON string or object) and
+    optionally the calendarId and the events.list parameters of get_events,
+    which may also be passed in the query. Access tokens are kept fresh by a
+    shared CredentialManager.
+  - POST /batch: several requests at once. The body is a JSON list of paths
+    of GET requests or {"path": ..., "body": ...} objects of POST requests,
+    the response a list of {"status": ..., "body": ...} objects in the same
+    order. The requests of a batch are answered concurrently.
+
+Errors are answered with the status of the failed API request (502 when the
+API cannot be reached, 504 on timeout, 429 when the rate limit is exceeded)
+and a JSON object with an error message.
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import stat
+import sys
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from urllib.parse import parse_qsl, urlsplit
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+    from urlparse import parse_qsl, urlsplit
+
+import requests
+
+from appletea.cache import ResponseCache
+from appletea.exceptions import RateLimitError
+from appletea.forecastio import api as forecastio
+from appletea.ipinfo import api as ipinfo
+from appletea.transport import RateLimitedTransport, RequestsTransport
+from appletea.utils import UnicodeMixin
+
+
+_ROUTES = [
+    ('GET', re.compile(r'^/forecast/(?:(?P<key>[^/]+)/)?'
+                       r'(?P<latitude>[^/,]+),(?P<longitude>[^/,]+)'
+                       r'(?:,(?P<time>[^/,]+))?$'),
+     '_forecast'),
+    ('GET', re.compile(r'^/ipinfo/(?:(?P<ip>[^/]+)/)?json$'), '_ipinfo'),
+    ('POST', re.compile(r'^/events$'), '_events'),
+    ('POST', re.compile(r'^/batch$'), '_batch'),
+]
+
+# Query parameters of forecast requests passed on to the API.
+_FORECAST_PARAMS = frozenset(['units', 'exclude', 'extend', 'lang'])
+# Parameters of events requests passed on to the API.
+_EVENTS_PARAMS = frozenset([
+    'calendarId', 'alwaysIncludeEmail', 'iCalUID', 'maxAttendees',
+    'maxResults', 'orderBy', 'pageToken', 'privateExtendedProperty', 'q',
+    'sharedExtendedProperty', 'showDeleted', 'showHiddenInvitations',
+    'singleEvents', 'syncToken', 'timeMax', 'timeMin', 'timeZone',
+    'updatedMin'])
+
+
+class _Error(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._respond(None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._respond(self.rfile.read(length))
+
+    def _respond(self, body):
+        status, result = self.server.sidecar.handle(self.command, self.path,
+                                                    body)
+        content = json.dumps(result, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def server_bind(self):
+        # Replace the socket of a previous server.
+        path = self.server_address
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+        UnixStreamServer.server_bind(self)
+
+
+class Server(UnicodeMixin):
+    """Sidecar server object.
+
+    The server answers requests from a pool of threads. Responses are cached
+    in one ResponseCache; requests to the APIs share a connection pool and,
+    per API, a rate limit (see appletea.transport.RateLimitedTransport):
+
+      Server(('127.0.0.1', 8787), key=key, ttl=300).serve_forever()
+
+    or in a background thread between start and stop (or as a context
+    manager).
+
+    Args:
+      - address: (host, port) tuple of a TCP socket, or path of a Unix socket.
+      - key: optional Dark Sky API key of forecast requests without key.
+      - ttl: freshness lifetime in seconds of responses without a
+        Cache-Control max-age.
+      - maxsize: maximum number of cached responses.
+      - forecast_rate: maximum number of forecast requests per second
+        (unlimited if None).
+      - ipinfo_rate: maximum number of IP information requests per second
+        (unlimited if None).
+      - wait: maximum number of seconds a request waits for the rate limit
+        before it is answered with 429 Too Many Requests.
+      - concurrency: number of concurrent requests of a batch, and of
+        connections kept open per host.
+      - transport: optional transport of the API requests (a requests
+        session if None).
+    """
+    def __init__(self, address=('127.0.0.1', 8787), key=None, ttl=0,
+                 maxsize=1024, forecast_rate=None, ipinfo_rate=None, wait=5,
+                 concurrency=8, transport=None):
+        self.address = address
+        self.key = key
+        self.concurrency = concurrency
+        self.cache = ResponseCache(ttl=ttl, maxsize=maxsize)
+        if transport is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            transport = RequestsTransport(session)
+        self.transport = transport
+        self.transports = {
+            forecastio: _limited(transport, forecast_rate, wait),
+            ipinfo: _limited(transport, ipinfo_rate, wait),
+        }
+        self._credentials = None
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._pool = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """Return the base URL of the server (TCP sockets only)."""
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    @property
+    def credentials(self):
+        """Return the CredentialManager of calendar requests."""
+        with self._lock:
+            if self._credentials is None:
+                from appletea.gcalendar.credentials import CredentialManager
+
+                self._credentials = CredentialManager()
+                if self._httpd is not None:
+                    self._credentials.start()
+            return self._credentials
+
+    def start(self):
+        """Start serving requests in a background thread."""
+        self._bind()
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve requests until interrupted."""
+        if self._httpd is None:
+            self._bind()
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stop serving requests."""
+        if self._httpd is None:
+            return
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+        if isinstance(self.address, str):
+            os.remove(self.address)
+        self._httpd = None
+        self._pool.close()
+        self._pool = None
+        with self._lock:
+            if self._credentials is not None:
+                self._credentials.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, method, path, body=None):
+        """Answer a request.
+
+        Args:
+          - method: 'GET' or 'POST'.
+          - path: request path and query.
+          - body: request body as bytes (POST requests).
+
+        Returns:
+          A tuple (status, result) of the response status and the JSON
+          result.
+        """
+        try:
+            url = urlsplit(path)
+            for route_method, pattern, name in _ROUTES:
+                match = pattern.match(url.path)
+                if match is not None:
+                    break
+            else:
+                raise _Error(404, 'Unknown path "%s"' % url.path)
+            if method != route_method:
+                raise _Error(405, 'Use %s for "%s"' % (route_method,
+                                                       url.path))
+            params = dict(parse_qsl(url.query))
+            if body is not None:
+                body = json.loads(body.decode('utf-8')) if body else {}
+            return 200, getattr(self, name)(params, body,
+                                            **match.groupdict())
+        except Exception as e:
+            status = _status(e)
+            return status, {'error': str(e) or e.__class__.__name__}
+
+    def _bind(self):
+        if isinstance(self.address, str):
+            self._httpd = _UnixHTTPServer(self.address, _Handler)
+        else:
+            self._httpd = _HTTPServer(self.address, _Handler)
+        self._httpd.sidecar = self
+        self._pool = ThreadPool(self.concurrency)
+        with self._lock:
+            if self._credentials is not None:
+                self._credentials.start()
+
+    def _forecast(self, params, body, key, latitude, longitude, time):
+        key = key or self.key
+        if key is None:
+            raise _Error(400, 'No API key')
+        unknown = sorted(set(params) - _FORECAST_PARAMS)
+        if unknown:
+            raise _Error(400, 'Unknown query parameters: %s' %
+                         ', '.join(unknown))
+        forecast = forecastio.get_forecast(key, latitude, longitude,
+                                           cache=self.cache, time=time,
+                                           transport=self.transports[
+                                               forecastio],
+                                           **params)
+        return forecast.json
+
+    def _ipinfo(self, params, body, ip):
+        return ipinfo.get_ipinfo(ip or '', cache=self.cache,
+                                 transport=self.transports[ipinfo]).json
+
+    def _events(self, params, body):
+        from appletea.gcalendar import api as gcalendar
+
+        if not isinstance(body, dict):
+            raise _Error(400, 'Expected a JSON object')
+        kwargs = dict(params)
+        kwargs.update(body)
+        credentials = kwargs.pop('credentials', None)
+        unknown = sorted(set(kwargs) - _EVENTS_PARAMS)
+        if unknown:
+            raise _Error(400, 'Unknown parameters: %s' % ', '.join(unknown))
+        if credentials is None:
+            raise _Error(400, 'No credentials')
+        if not isinstance(credentials, str):
+            credentials = json.dumps(credentials)
+        events = gcalendar.get_events(self.credentials.get(credentials),
+                                      cache=self.cache, **kwargs)
+        return events.json
+
+    def _batch(self, params, body):
+        if not isinstance(body, list):
+            raise _Error(400, 'Expected a list of requests')
+        pool = self._pool
+        if pool is None:
+            # Not serving: answer the requests one after the other.
+            results = [self._batch_item(item) for item in body]
+        else:
+            results = pool.map(self._batch_item, body)
+        return [{'status': status, 'body': result}
+                for status, result in results]
+
+    def _batch_item(self, item):
+        if isinstance(item, dict):
+            method, path = 'POST', item.get('path', '')
+            body = json.dumps(item.get('body', {})).encode('utf-8')
+        else:
+            method, path, body = 'GET', item, None
+        if urlsplit(path).path == '/batch':
+            return 400, {'error': 'Batches cannot be nested'}
+        return self.handle(method, path, body)
+
+    def __unicode__(self):
+        return '<Server instance at %s>' % (self.address,)
+
+
+def _limited(transport, rate, wait):
+    if rate is None:
+        return transport
+    return RateLimitedTransport(transport, rate, wait=wait)
+
+
+def _status(e):
+    # Return the response status of an exception.
+    if isinstance(e, _Error):
+        return e.status
+    if isinstance(e, RateLimitError):
+        return 429
+    response = getattr(e, 'response', None)
+    if response is not None and response.status_code:
+        return response.status_code
+    resp = getattr(e, 'resp', None)  # Google API client HttpError.
+    if resp is not None and getattr(resp, 'status', None):
+        return resp.status
+    if isinstance(e, requests.Timeout):
+        return 504
+    if isinstance(e, (requests.ConnectionError, socket.error)):
+        return 502
+    if isinstance(e, (ValueError, TypeError)):
+        return 400
+    return 500
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=8787)
+    parser.add_argument('-u', '--unix', help='listen on this Unix socket')
+    parser.add_argument('-k', '--key', default=os.environ.get('DARKSKY_KEY'),
+                        help='Dark Sky API key (default: $DARKSKY_KEY)')
+    parser.add_argument('--ttl', type=float, default=0,
+                        help='cache lifetime of responses without max-age')
+    parser.add_argument('--maxsize', type=int, default=1024,
+                        help='maximum number of cached responses')
+    parser.add_argument('--forecast-rate', type=float,
+                        help='maximum forecast requests per second')
+    parser.add_argument('--ipinfo-rate', type=float,
+                        help='maximum IP information requests per second')
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    server = Server(args.unix or (args.host, args.port), key=args.key,
+                    ttl=args.ttl, maxsize=args.maxsize,
+                    forecast_rate=args.forecast_rate,
+                    ipinfo_rate=args.ipinfo_rate,
+                    concurrency=args.concurrency)
+    server.serve_forever()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,403 @@
+"""HTTP transports.
+
+Transports send the GET requests of the REST clients (see appletea.client).
+The default transport uses requests (HTTP/1.1, one connection per concurrent
+request); HTTP2Transport multiplexes concurrent requests over one HTTP/2
+connection per host. RateLimitedTransport and HedgedTransport wrap another
+transport.
+"""
+import collections
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from appletea.exceptions import RateLimitError
+
+
+class RequestsTransport(object):
+    """HTTP/1.1 transport using requests.
+
+    Args:
+      - session: optional requests.Session whose connection pool is shared
+        by the requests (a new connection per request if None).
+    """
+    def __init__(self, session=None):
+        self.session = session
+
+    def get(self, url, params=None, headers=None, timeout=5, stream=False):
+        """Send a GET request.
+
+        Args:
+          - url: request URL.
+          - params: query parameters.
+          - headers: additional request headers.
+          - timeout: connect and read timeout in seconds.
+          - stream: return once the headers are received, the body is read
+            with iter_content and the response must be closed.
+
+        Returns:
+          A requests.Response object.
+        """
+        kwargs = {}
+        if headers:
+            kwargs['headers'] = headers
+        if stream:
+            kwargs['stream'] = True
+        get = requests.get if self.session is None else self.session.get
+        return get(url, params=params, timeout=timeout, **kwargs)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+class HTTP2Transport(object):
+    """HTTP/2 transport using httpx.
+
+    Concurrent requests (e.g. from the threads of a PrefetchScheduler or
+    get_weather) to the same host share one HTTP/2 connection as separate
+    streams, instead of each holding a connection of its own. Requires httpx
+    with HTTP/2 support (pip install 'httpx[http2]').
+
+    A transport is selected per call, or as the default of a client module:
+
+      from appletea.transport import HTTP2Transport
+      transport = HTTP2Transport()
+      forecast = forecastio.get_forecast(key, latitude, longitude,
+                                         transport=transport)
+      forecastio.api.TRANSPORT = transport
+
+    Responses are returned as requests.Response objects, so models and
+    errors are the same as with the default transport.
+
+    Args:
+      - prior_knowledge: speak HTTP/2 to http:// URLs without upgrade
+        (servers that only support HTTP/2 over cleartext). HTTPS URLs
+        negotiate HTTP/2 and fall back to HTTP/1.1 either way.
+      - kwargs: additional arguments passed to httpx.Client.
+    """
+    def __init__(self, prior_knowledge=False, **kwargs):
+        self.prior_knowledge = prior_knowledge
+        self.kwargs = kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Return the httpx.Client, created on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('The HTTP/2 transport requires httpx, install '
+                              "it with: pip install 'httpx[http2]'")
+        kwargs = dict(self.kwargs)
+        kwargs.setdefault('http2', True)
+        if self.prior_knowledge:
+            kwargs.setdefault('http1', False)
+        return httpx.Client(**kwargs)
+
+    def get(self, url, params=None, headers=None, timeout=5, stream=False):
+        """Send a GET request (see RequestsTransport.get).
+
+        Raises:
+          A requests.ConnectionError or requests.Timeout when the request
+          cannot be completed.
+        """
+        import httpx
+
+        client = self.client
+        try:
+            request = client.build_request('GET', url, params=params,
+                                           headers=headers, timeout=timeout)
+            response = client.send(request, stream=stream)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(e)
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(e)
+        return _response(response, stream)
+
+    def close(self):
+        """Close the connections of this transport."""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RateLimitedTransport(object):
+    """Transport limiting the rate of the requests sent by another transport.
+
+    Requests are admitted by a token bucket holding up to burst tokens and
+    refilled with rate tokens a second. A request that finds the bucket empty
+    waits for its token, unless that takes longer than wait seconds. Cached
+    responses that are still fresh are not requested and cost no token.
+
+    Args:
+      - transport: transport sending the admitted requests (the default
+        transport if None).
+      - rate: maximum number of requests per second, e.g. 1000 / 86400.0 for
+        a quota of 1000 requests a day.
+      - burst: maximum number of requests sent at once.
+      - wait: maximum number of seconds a request waits for its token
+        (unlimited if None).
+      - clock: function returning the current time in seconds.
+      - sleep: function waiting a number of seconds.
+    """
+    def __init__(self, transport=None, rate=1.0, burst=1, wait=None,
+                 clock=time.time, sleep=time.sleep):
+        self.transport = transport or DEFAULT
+        self.rate = float(rate)
+        self.burst = burst
+        self.wait = wait
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        """Send a GET request once the rate allows it (see
+        RequestsTransport.get).
+
+        Raises:
+          A RateLimitError when the request would wait longer than wait
+          seconds.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._last) * self.rate)
+            self._last = now
+            delay = max(0, (1 - self._tokens) / self.rate)
+            if self.wait is not None and delay > self.wait:
+                raise RateLimitError('Rate limit of %g requests per second '
+                                     'exceeded' % self.rate)
+            # Take the token now, so that waiting requests queue up.
+            self._tokens -= 1
+        if delay:
+            self._sleep(delay)
+        return self.transport.get(url, **kwargs)
+
+    def close(self):
+        self.transport.close()
+
+
+class HedgedTransport(object):
+    """Transport hedging the requests sent by another transport.
+
+    A request still unanswered after the hedging delay is sent a second
+    time, and the first response to arrive is returned, which cuts the tail
+    latency due to an occasional slow connection or server:
+
+      forecastio.api.TRANSPORT = HedgedTransport(quantile=0.95, ratio=0.05)
+
+    The hedging delay is the given quantile of the response times of the
+    recent requests, so that only the slowest requests are hedged. Hedged
+    requests are budgeted by a token bucket refilled with ratio tokens per
+    request, so that the number of requests sent (and the quota used) grows
+    by ratio at most. The response of the slower request is closed when it
+    arrives; its connection is not interrupted. Streamed requests are not
+    hedged. Only idempotent requests should be sent through this transport,
+    which the GET requests of the REST clients are.
+
+    Args:
+      - transport: transport sending the requests (the default transport if
+        None). Hedged requests are sent by the same transport, and so count
+        against the rate of a RateLimitedTransport.
+      - quantile: quantile of the recent response times used as hedging
+        delay, e.g. 0.95 to hedge the 5% slowest requests.
+      - ratio: maximum number of hedged requests per request.
+      - burst: maximum number of hedged requests sent in a row, so that
+        slow requests coming in bursts are all hedged.
+      - window: number of recent response times the delay is computed from.
+      - min_samples: number of response times observed before requests are
+        hedged.
+      - min_delay: minimum hedging delay in seconds.
+      - clock: function returning the current time in seconds.
+    """
+    def __init__(self, transport=None, quantile=0.95, ratio=0.05, burst=10,
+                 window=200, min_samples=20, min_delay=0.005,
+                 clock=time.time):
+        self.transport = transport or DEFAULT
+        self.quantile = quantile
+        self.ratio = ratio
+        self.burst = burst
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.requests = 0
+        self.hedged = 0
+        self._clock = clock
+        self._latencies = collections.deque(maxlen=window)
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Return the hedging delay in seconds, or None until min_samples
+        response times were observed."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        i = min(len(latencies) - 1, int(self.quantile * len(latencies)))
+        return max(self.min_delay, latencies[i])
+
+    def get(self, url, **kwargs):
+        """Send a GET request, hedged once it takes longer than the hedging
+        delay (see RequestsTransport.get).
+
+        Raises:
+          The error of the last request to fail when all requests failed.
+        """
+        if kwargs.get('stream'):
+            return self.transport.get(url, **kwargs)
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+        delay = self.delay()
+        if delay is None:
+            start = self._clock()
+            response = self.transport.get(url, **kwargs)
+            self._observe(start)
+            return response
+
+        call = _Call()
+        self._send(call, url, kwargs)
+        try:
+            return call.first(call.results.get(timeout=delay))
+        except queue.Empty:
+            pass
+        with self._lock:
+            hedge = self._tokens >= 1
+            if hedge:
+                self._tokens -= 1
+                self.hedged += 1
+        if hedge:
+            self._send(call, url, kwargs)
+        return call.wait()
+
+    def close(self):
+        self.transport.close()
+
+    def _send(self, call, url, kwargs):
+        call.sent += 1
+        t = threading.Thread(target=self._attempt, args=(call, url, kwargs))
+        t.daemon = True
+        t.start()
+
+    def _attempt(self, call, url, kwargs):
+        start = self._clock()
+        try:
+            response = self.transport.get(url, **kwargs)
+        except Exception as e:
+            call.put(None, e)
+        else:
+            self._observe(start)
+            call.put(response, None)
+
+    def _observe(self, start):
+        with self._lock:
+            self._latencies.append(self._clock() - start)
+
+
+class _Call(object):
+    # The requests sent for one call of HedgedTransport.get.
+    def __init__(self):
+        self.sent = 0
+        self.done = False
+        self.results = queue.Queue()
+        self._lock = threading.Lock()
+
+    def put(self, response, error):
+        with self._lock:
+            if not self.done:
+                self.results.put((response, error))
+                return
+        if response is not None:
+            response.close()
+
+    def wait(self):
+        # Return the first response, or raise the last error.
+        for i in range(self.sent):
+            response, error = self.results.get()
+            if error is None or i == self.sent - 1:
+                return self.first((response, error))
+
+    def first(self, result):
+        with self._lock:
+            self.done = True
+        # Close the responses that arrived meanwhile.
+        while True:
+            try:
+                response, _ = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if response is not None:
+                response.close()
+        response, error = result
+        if error is not None:
+            raise error
+        return response
+
+
+class _Raw(object):
+    # File-like body of a streamed httpx response, read by
+    # requests.Response.iter_content.
+    def __init__(self, response):
+        self.response = response
+        self._chunks = response.iter_bytes()
+
+    def read(self, size=None):
+        import httpx
+
+        try:
+            return next(self._chunks, b'')
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(e)
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(e)
+
+    def close(self):
+        self.response.close()
+
+
+def _response(r, stream=False):
+    # Return an httpx response as requests.Response.
+    response = requests.Response()
+    response.status_code = r.status_code
+    response.reason = r.reason_phrase
+    response.headers = CaseInsensitiveDict(r.headers.items())
+    response.url = str(r.url)
+    response.encoding = r.encoding
+    # raw closes the httpx response when the response is closed.
+    response.raw = _Raw(r)
+    if not stream:
+        response._content = r.content
+        response._content_consumed = True
+    try:
+        response.elapsed = r.elapsed
+    except RuntimeError:  # Not measured, e.g. by mock transports.
+        pass
+    return response
+
+
+DEFAULT = RequestsTransport()
@@ -0,0 +1,6 @@
+"""
+Performance benchmarks for appletea, run against local stand-in servers.
+
+Usage: python -m benchmarks.run --help
+       python -m benchmarks.imports --help
+"""
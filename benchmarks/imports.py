@@ -0,0 +1,80 @@
+"""Import-time benchmark.
+
+Measures the cold import time of the appletea packages in fresh interpreters
+and lists the heavy third-party modules each import pulls in:
+
+  python -m benchmarks.imports --output imports.json
+  python -m benchmarks.imports --compare imports.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from benchmarks.run import percentile
+
+
+MODULES = ['appletea', 'appletea.forecastio', 'appletea.ipinfo',
+           'appletea.gcalendar']
+
+# Modules that should only be loaded when actually used.
+HEAVY = ['requests', 'googleapiclient', 'oauth2client', 'httplib2']
+
+PROBE = '''
+import json, sys, time
+t0 = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - t0
+heavy = sorted(m for m in %r if m in sys.modules)
+print(json.dumps({'elapsed': elapsed, 'heavy': heavy}))
+'''
+
+
+def measure(module, iterations):
+    """Import module in fresh interpreters and return its statistics."""
+    samples = []
+    heavy = []
+    for _ in range(iterations):
+        out = subprocess.check_output(
+            [sys.executable, '-c', PROBE % (module, HEAVY)])
+        probe = json.loads(out.decode('utf-8'))
+        samples.append(probe['elapsed'])
+        heavy = probe['heavy']
+    samples.sort()
+    return {'iterations': iterations,
+            'p50': percentile(samples, 50),
+            'p90': percentile(samples, 90),
+            'heavy': heavy}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--iterations', type=int, default=10)
+    parser.add_argument('-o', '--output', help='save results to this file')
+    parser.add_argument('-c', '--compare', help='compare with saved results')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)['results']
+
+    results = {}
+    fmt = '%-24s %10s %10s %10s  %s'
+    print(fmt % ('module', 'p50 (ms)', 'p90 (ms)', 'base (ms)', 'loads'))
+    for module in MODULES:
+        s = results[module] = measure(module, args.iterations)
+        base = baseline.get(module)
+        print(fmt % (module, '%.1f' % (s['p50'] * 1000),
+                     '%.1f' % (s['p90'] * 1000),
+                     '%.1f' % (base['p50'] * 1000) if base else '-',
+                     ', '.join(s['heavy'])))
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({'results': results}, fp, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Benchmark payloads.
+
+Synthetic but realistically shaped payloads for forecast.io, ipinfo.io and
+Google Calendar API responses.
+"""
+import datetime
+import math
+import random
+
+
+FORECAST_FIELDS = ['precipIntensity', 'precipProbability', 'temperature',
+                   'apparentTemperature', 'dewPoint', 'humidity', 'windSpeed',
+                   'windBearing', 'cloudCover', 'pressure', 'ozone']
+ICONS = ['clear-day', 'clear-night', 'rain', 'cloudy', 'partly-cloudy-day',
+         'partly-cloudy-night', 'wind', 'fog']
+
+
+def _datapoint(rnd, t, fields):
+    d = {'time': t, 'summary': 'Partly Cloudy',
+         'icon': rnd.choice(ICONS), 'precipType': 'rain'}
+    for i, field in enumerate(fields):
+        d[field] = round(10 * math.sin(t / 3600.0 + i) + rnd.random(), 2)
+    return d
+
+
+def forecast(latitude=51.036391, longitude=3.699794, extend=True,
+             start=1461862800, seed=0):
+    """Return a forecast payload.
+
+    Args:
+      - latitude: geographic latitude coordinates in decimal degrees.
+      - longitude: geographic longitude coordinated in decimal degrees.
+      - extend: return 169 hourly data points (extend=hourly) rather than 49.
+      - start: UNIX time of the first data point.
+      - seed: seed of the random generator for reproducible payloads.
+
+    Returns:
+      A dict shaped like a forecast.io API response.
+    """
+    rnd = random.Random(seed)
+    hours = 169 if extend else 49
+    minutely = [_datapoint(rnd, start + 60 * i, FORECAST_FIELDS[:2])
+                for i in range(61)]
+    hourly = [_datapoint(rnd, start + 3600 * i, FORECAST_FIELDS)
+              for i in range(hours)]
+    daily = []
+    for i in range(8):
+        d = _datapoint(rnd, start + 86400 * i, FORECAST_FIELDS)
+        d.update({'sunriseTime': start + 86400 * i + 21600,
+                  'sunsetTime': start + 86400 * i + 72000,
+                  'moonPhase': 0.7,
+                  'temperatureMin': d['temperature'] - 5,
+                  'temperatureMax': d['temperature'] + 5})
+        daily.append(d)
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'timezone': 'Europe/Brussels',
+        'offset': 2,
+        'currently': _datapoint(rnd, start, FORECAST_FIELDS),
+        'minutely': {'summary': 'Clear for the hour.', 'icon': 'clear-day',
+                     'data': minutely},
+        'hourly': {'summary': 'Light rain on Saturday.', 'icon': 'rain',
+                   'data': hourly},
+        'daily': {'summary': 'Light rain throughout the week.', 'icon': 'rain',
+                  'data': daily},
+        'alerts': [{'title': 'Flood Watch', 'expires': start + 86400,
+                    'description': 'Flood watch in effect.',
+                    'uri': 'http://alerts.weather.gov/flood-watch'}],
+        'flags': {'units': 'us', 'sources': ['gfs', 'cmc', 'isd']},
+    }
+
+
+def ipinfo(ip='8.8.8.8'):
+    """Return an ipinfo payload for the given IP address."""
+    return {'ip': ip, 'hostname': 'google-public-dns-a.google.com',
+            'city': 'Mountain View', 'region': 'California', 'country': 'US',
+            'loc': '37.3845,-122.0881', 'org': 'AS15169 Google Inc.',
+            'postal': '94040'}
+
+
+def calendar_event(i, start=datetime.datetime(2016, 1, 4, 8, 0)):
+    """Return the i-th event of a busy calendar."""
+    begin = start + datetime.timedelta(minutes=30 * i)
+    end = begin + datetime.timedelta(minutes=25)
+    organizer = {'email': 'organizer%d@example.com' % (i % 50),
+                 'displayName': 'Organizer %d' % (i % 50)}
+    return {
+        'kind': 'calendar#event',
+        'etag': '"%d"' % (1459400861637901 + i),
+        'id': 'event%08d' % i,
+        'status': 'confirmed',
+        'htmlLink': 'https://www.google.com/calendar/event?eid=event%08d' % i,
+        'created': '2015-12-16T08:42:27.000Z',
+        'updated': '2015-12-16T08:42:28.120Z',
+        'summary': 'Summary for event #%d' % i,
+        'location': 'Room %d' % (i % 20),
+        'creator': organizer,
+        'organizer': organizer,
+        'start': {'dateTime': begin.strftime('%Y-%m-%dT%H:%M:%S+01:00')},
+        'end': {'dateTime': end.strftime('%Y-%m-%dT%H:%M:%S+01:00')},
+        'iCalUID': 'event%08d@google.com' % i,
+        'sequence': 0,
+        'attendees': [{'email': 'attendee%d@example.com' % j,
+                       'displayName': 'Attendee %d' % j,
+                       'responseStatus': 'accepted'}
+                      for j in range(i % 6)],
+        'reminders': {'useDefault': True},
+    }
+
+
+def calendar(events=5000, offset=0):
+    """Return a Google Calendar events list payload.
+
+    Args:
+      - events: number of events in the payload.
+      - offset: index of the first event.
+
+    Returns:
+      A dict shaped like a Google Calendar events list response.
+    """
+    return {
+        'kind': 'calendar#events',
+        'etag': '"4599256691240100"',
+        'summary': 'john.doe@gmail.com',
+        'updated': '2016-05-02T20:13:56.250Z',
+        'timeZone': 'Europe/Brussels',
+        'accessRole': 'owner',
+        'defaultReminders': [],
+        'items': [calendar_event(i) for i in range(offset, offset + events)],
+    }
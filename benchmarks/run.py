@@ -0,0 +1,279 @@
+"""Benchmark runner.
+
+Measures throughput, latency percentiles, allocations and peak memory of the
+appletea hot paths against local stand-in servers, and saves the results so
+that successive runs can be compared:
+
+  python -m benchmarks.run --output before.json
+  python -m benchmarks.run --compare before.json
+
+A case regresses when its median latency grows by more than the threshold.
+"""
+import argparse
+import atexit
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks import payloads
+from benchmarks.stubs import H2StubServer, StubServer
+
+
+# Number of simultaneous requests of the concurrent cases.
+CONCURRENCY = 32
+
+CREDENTIALS = {
+    '_module': 'oauth2client.client', '_class': 'OAuth2Credentials',
+    'access_token': 'stub-token', 'client_id': 'stub-client',
+    'client_secret': 'stub-secret', 'refresh_token': 'stub-refresh',
+    'token_expiry': None, 'token_uri': None, 'user_agent': 'appletea-bench',
+    'invalid': False, 'id_token': None, 'token_response': None,
+    'revoke_uri': None, 'scopes': [],
+}
+
+
+def percentile(samples, p):
+    """Return the p-th percentile (0-100) of sorted samples."""
+    if not samples:
+        return 0.0
+    k = (len(samples) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(samples) - 1)
+    return samples[lo] + (samples[hi] - samples[lo]) * (k - lo)
+
+
+def measure(fn, iterations, warmup=3):
+    """Run fn repeatedly and return its statistics.
+
+    Latencies are measured without tracing. A final traced run records the
+    memory blocks still held by the result and the peak traced memory.
+    """
+    for _ in range(warmup):
+        fn()
+
+    latencies = []
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = fn()
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    del result
+
+    return {
+        'iterations': iterations,
+        'throughput': iterations / elapsed,
+        'mean': sum(latencies) / len(latencies),
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'allocated_blocks': sum(s.count_diff for s in stats),
+        'allocated_bytes': sum(s.size_diff for s in stats),
+        'peak_memory': peak,
+    }
+
+
+def concurrent_forecasts(base_url, transport):
+    """Return a case sending CONCURRENCY forecast requests at once."""
+    from concurrent.futures import ThreadPoolExecutor
+    from appletea.forecastio import api
+
+    pool = ThreadPoolExecutor(CONCURRENCY)
+    atexit.register(pool.shutdown)
+
+    def fetch(i):
+        return api.get_forecast('key', 51.036391, 3.699794)
+
+    def run():
+        saved = api.BASE_URL, api.TRANSPORT
+        api.BASE_URL, api.TRANSPORT = base_url, transport
+        try:
+            return list(pool.map(fetch, range(CONCURRENCY)))
+        finally:
+            api.BASE_URL, api.TRANSPORT = saved
+    return run
+
+
+def cases(stub, events):
+    """Return the benchmark cases as a list of (name, callable) tuples."""
+    from appletea import forecastio, ipinfo
+    from appletea.forecastio.models import Forecast
+    from appletea.ipinfo.models import IpInfo
+    from appletea.gcalendar.models import GCalendarEvents
+    from appletea.gcalendar.store import EventStore
+
+    forecastio.api.BASE_URL = stub.url + '/forecast'
+    ipinfo.api.BASE_URL = stub.url + '/ipinfo'
+
+    forecast_json = payloads.forecast(extend=True)
+    ipinfo_json = payloads.ipinfo()
+    calendar_json = payloads.calendar(events)
+
+    def forecast_model():
+        f = Forecast(json.loads(json.dumps(forecast_json)), None)
+        return f.currently, f.minutely, f.hourly, f.daily, f.alerts
+
+    def stream_currently():
+        # Time to the current conditions of a streamed forecast.
+        items = forecastio.stream_forecast('key', 51.036391, 3.699794,
+                                           extend='hourly')
+        try:
+            for name, value in items:
+                if name == 'currently':
+                    return value
+        finally:
+            items.close()
+
+    def forecast_blocks(**kwargs):
+        f = forecastio.get_forecast('key', 51.036391, 3.699794, **kwargs)
+        return f.currently, f.minutely, f.hourly, f.daily, f.alerts
+
+    result = [
+        ('get_forecast', forecast_blocks),
+        ('get_forecast[extend=hourly]',
+         lambda: forecast_blocks(extend='hourly')),
+        ('stream_forecast[extend=hourly]',
+         lambda: list(forecastio.stream_forecast(
+             'key', 51.036391, 3.699794, extend='hourly'))),
+        ('stream_forecast[extend=hourly,currently]', stream_currently),
+        ('get_ipinfo', lambda: ipinfo.get_ipinfo('8.8.8.8')),
+        ('Forecast[extend=hourly]', forecast_model),
+        ('IpInfo', lambda: IpInfo(dict(ipinfo_json)).loc),
+        ('GCalendarEvents[%d]' % events,
+         lambda: GCalendarEvents(calendar_json)),
+        ('EventStore[%d]' % events,
+         lambda: EventStore(calendar_json['items'])),
+    ]
+
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        sys.stderr.write('skipping to_bytes/from_bytes: msgpack is not '
+                         'installed\n')
+    else:
+        forecast = Forecast(forecast_json, None)
+        forecast_bytes = forecast.to_bytes()
+        result.extend([
+            ('Forecast.to_bytes[extend=hourly]', forecast.to_bytes),
+            ('Forecast.from_bytes[extend=hourly]',
+             lambda: Forecast.from_bytes(forecast_bytes)),
+        ])
+
+    try:
+        import h2  # noqa: F401
+        import httpx  # noqa: F401
+    except ImportError:
+        sys.stderr.write('skipping http2: httpx and h2 are not installed\n')
+    else:
+        from appletea.transport import HTTP2Transport
+
+        h2_stub = H2StubServer(events=0).start()
+        atexit.register(h2_stub.stop)
+        http2 = HTTP2Transport(prior_knowledge=True)
+        atexit.register(http2.close)
+        result.extend([
+            ('get_forecast[x%d concurrent]' % CONCURRENCY,
+             concurrent_forecasts(stub.url + '/forecast', None)),
+            ('get_forecast[x%d concurrent,http2]' % CONCURRENCY,
+             concurrent_forecasts(h2_stub.url + '/forecast', http2)),
+        ])
+
+    try:
+        from appletea import gcalendar
+    except ImportError:
+        sys.stderr.write('skipping get_events: google-api-python-client '
+                         'is not installed\n')
+    else:
+        credentials = dict(CREDENTIALS, token_uri=stub.url + '/token')
+        credentials = json.dumps(credentials)
+        gcalendar.api.API_ENDPOINT = stub.url + '/calendar/v3/'
+        result.append(('get_events[%d]' % events,
+                       lambda: gcalendar.get_events(credentials)))
+
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison against a baseline and return the regressions."""
+    regressions = []
+    fmt = '%-40s %12s %12s %8s'
+    print(fmt % ('case', 'p50 (ms)', 'base (ms)', 'change'))
+    for name, stats in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            print(fmt % (name, '%.3f' % (stats['p50'] * 1000), '-', 'new'))
+            continue
+        change = stats['p50'] / base['p50'] - 1
+        print(fmt % (name, '%.3f' % (stats['p50'] * 1000),
+                     '%.3f' % (base['p50'] * 1000),
+                     '%+.1f%%' % (change * 100)))
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def report(results):
+    fmt = '%-40s %10s %10s %10s %10s %12s %12s'
+    print(fmt % ('case', 'ops/s', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)',
+                 'blocks', 'peak (KiB)'))
+    for name, s in sorted(results.items()):
+        print(fmt % (name, '%.1f' % s['throughput'],
+                     '%.3f' % (s['p50'] * 1000), '%.3f' % (s['p90'] * 1000),
+                     '%.3f' % (s['p99'] * 1000), s['allocated_blocks'],
+                     '%.1f' % (s['peak_memory'] / 1024.0)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--iterations', type=int, default=50)
+    parser.add_argument('-e', '--events', type=int, default=5000,
+                        help='number of events in calendar payloads')
+    parser.add_argument('-k', '--filter', default='',
+                        help='only run cases containing this substring')
+    parser.add_argument('-o', '--output', help='save results to this file')
+    parser.add_argument('-c', '--compare', help='compare with saved results')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='relative p50 slowdown counted as a regression')
+    args = parser.parse_args(argv)
+
+    results = {}
+    with StubServer(events=args.events) as stub:
+        for name, fn in cases(stub, args.events):
+            if args.filter in name:
+                results[name] = measure(fn, args.iterations)
+    report(results)
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'created': time.time(),
+                       'results': results}, fp, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)['results']
+        print('')
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\nregressions: %s' % ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Local stand-in servers.
+
+Threaded HTTP servers replaying forecast.io, ipinfo.io and Google Calendar
+payloads on the loopback interface.
+"""
+import json
+import re
+import socket
+import sys
+import threading
+
+from benchmarks import payloads
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qs
+
+
+ROUTES = [
+    (re.compile(r'^/forecast/[^/]+/[^/]+$'), 'forecast'),
+    (re.compile(r'^/ipinfo/(?:[^/]+/)?json$'), 'ipinfo'),
+    (re.compile(r'^/calendar/v3/calendars/[^/]+/events$'), 'calendar'),
+    (re.compile(r'^/token$'), 'token'),
+]
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Concurrent cases open many connections at once.
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Streaming cases close their connections without reading the rest
+        # of the response.
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request,
+                                                   client_address)
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.server.stub.route(self.path)
+        if body is None:
+            return self._send(404, b'{}')
+        self._send(200, body)
+
+    do_POST = do_GET
+
+    def _send(self, status, body):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(object):
+    """Local stand-in for the forecast.io, ipinfo.io and Google Calendar APIs.
+
+    Payloads are encoded once up front so that the server itself adds as
+    little noise as possible to the measurements. Use it as a context manager:
+
+      with StubServer(events=5000) as stub:
+          forecastio.api.BASE_URL = stub.url + '/forecast'
+
+    Args:
+      - events: number of events in a calendar events list response.
+      - page_size: number of events per page (all events on one page if 0).
+    """
+    def __init__(self, events=5000, page_size=0):
+        self.events = events
+        self.page_size = page_size or events
+        self._bodies = {
+            'forecast': self._dumps(payloads.forecast(extend=False)),
+            'forecast-extended': self._dumps(payloads.forecast(extend=True)),
+            'ipinfo': self._dumps(payloads.ipinfo()),
+            'token': self._dumps({'access_token': 'stub-token',
+                                  'token_type': 'Bearer',
+                                  'expires_in': 3600}),
+        }
+        self._pages = {}
+        self._server = None
+        self._thread = None
+
+    @staticmethod
+    def _dumps(d):
+        return json.dumps(d).encode('utf-8')
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def route(self, path):
+        """Return the encoded response body for a request path, or None."""
+        url = urlparse(path)
+        for pattern, name in ROUTES:
+            if pattern.match(url.path):
+                return self.body(name, parse_qs(url.query))
+        return None
+
+    def body(self, name, query):
+        """Return the encoded response body for a route."""
+        if name == 'forecast' and 'hourly' in query.get('extend', []):
+            return self._bodies['forecast-extended']
+        if name == 'calendar':
+            return self._page(int(query.get('pageToken', ['0'])[0]))
+        return self._bodies[name]
+
+    def _page(self, offset):
+        if offset not in self._pages:
+            count = min(self.page_size, self.events - offset)
+            page = payloads.calendar(count, offset)
+            if offset + count < self.events:
+                page['nextPageToken'] = str(offset + count)
+            self._pages[offset] = self._dumps(page)
+        return self._pages[offset]
+
+    server_class = _ThreadingHTTPServer
+    handler_class = _Handler
+
+    def start(self):
+        self._server = self.server_class(('127.0.0.1', 0), self.handler_class)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn,
+                          socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _H2Handler(socketserver.BaseRequestHandler):
+    # Serves one HTTP/2 (cleartext, prior knowledge) connection, answering
+    # its streams as they complete and respecting flow control.
+    def handle(self):
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        config = h2.config.H2Configuration(client_side=False,
+                                           header_encoding='utf-8')
+        self.conn = h2.connection.H2Connection(config=config)
+        self.conn.initiate_connection()
+        self.pending = {}
+        paths = {}
+        self.request.sendall(self.conn.data_to_send())
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            for event in self.conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    paths[event.stream_id] = dict(event.headers)[':path']
+                elif isinstance(event, h2.events.StreamEnded):
+                    self._respond(event.stream_id,
+                                  paths.pop(event.stream_id, '/'))
+                elif isinstance(event, h2.events.StreamReset):
+                    self.pending.pop(event.stream_id, None)
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    return
+            self._flush()
+            self.request.sendall(self.conn.data_to_send())
+
+    def _respond(self, stream_id, path):
+        body = self.server.stub.route(path)
+        status = '200'
+        if body is None:
+            status, body = '404', b'{}'
+        self.conn.send_headers(stream_id, [
+            (':status', status), ('content-type', 'application/json'),
+            ('content-length', str(len(body)))])
+        self.pending[stream_id] = memoryview(body)
+
+    def _flush(self):
+        for stream_id, body in list(self.pending.items()):
+            while body:
+                size = min(self.conn.local_flow_control_window(stream_id),
+                           self.conn.max_outbound_frame_size, len(body))
+                if size <= 0:
+                    break
+                self.conn.send_data(stream_id, body[:size].tobytes(),
+                                    end_stream=size == len(body))
+                body = body[size:]
+            if body:
+                self.pending[stream_id] = body
+            else:
+                del self.pending[stream_id]
+
+
+class H2StubServer(StubServer):
+    """StubServer speaking HTTP/2 over cleartext (prior knowledge).
+
+    Requires the h2 package. Use with an HTTP2Transport(prior_knowledge=True).
+    """
+    server_class = _ThreadingTCPServer
+    handler_class = _H2Handler
@@ -0,0 +1,91 @@
+import requests
+import unittest
+
+from appletea.forecastio.alerts import AlertStore, alert_key
+from appletea.forecastio.models import Alert, Forecast
+
+
+def _alert(uri, expires=1000, title='Flood Watch'):
+    return {'title': title, 'expires': expires, 'uri': uri,
+            'description': '...'}
+
+
+class TestAlertStore(unittest.TestCase):
+    def setUp(self):
+        self.now = 100
+        self.store = AlertStore(clock=lambda: self.now)
+
+    def test_alert_key_falls_back_to_title_and_expires(self):
+        self.assertEqual(alert_key({'uri': 'u'}), 'u')
+        self.assertEqual(alert_key({'title': 't', 'expires': 5}), ('t', 5))
+
+    def test_same_alert_of_many_locations_is_stored_once(self):
+        self.store.report((1, 1), [_alert('a')])
+        self.store.report((2, 2), [_alert('a')])
+        self.assertEqual(len(self.store), 1)
+        self.assertIs(self.store.alerts((1, 1))[0],
+                      self.store.alerts((2, 2))[0])
+        self.assertEqual(self.store.locations('a'), set([(1, 1), (2, 2)]))
+
+    def test_poll_reports_changes_once(self):
+        self.store.report((1, 1), [_alert('a'), _alert('b')])
+        added, removed = self.store.poll()
+        self.assertEqual(sorted(a.uri for a in added), ['a', 'b'])
+        self.assertEqual(removed, [])
+
+        self.store.report((1, 1), [_alert('a'), _alert('b')])
+        self.store.report((2, 2), [_alert('a')])
+        self.assertEqual(self.store.poll(), ([], []))
+
+    def test_alert_is_removed_when_no_location_reports_it(self):
+        self.store.report((1, 1), [_alert('a')])
+        self.store.report((2, 2), [_alert('a')])
+        self.store.poll()
+        self.store.report((1, 1), [])
+        self.assertIn('a', self.store)
+        self.store.report((2, 2), [])
+        self.assertNotIn('a', self.store)
+        added, removed = self.store.poll()
+        self.assertEqual([a.uri for a in removed], ['a'])
+
+    def test_alert_is_evicted_when_it_expires(self):
+        self.store.report((1, 1), [_alert('a', expires=200)])
+        self.store.poll()
+        self.now = 200
+        self.assertEqual(self.store.alerts((1, 1)), [])
+        added, removed = self.store.poll()
+        self.assertEqual([a.uri for a in removed], ['a'])
+        self.assertEqual(len(self.store), 0)
+
+    def test_expired_alert_is_not_added(self):
+        self.store.report((1, 1), [_alert('a', expires=50)])
+        self.assertEqual(len(self.store), 0)
+
+    def test_changed_alert_is_removed_and_added(self):
+        self.store.report((1, 1), [_alert('a')])
+        self.store.poll()
+        self.store.report((1, 1), [_alert('a', title='Flood Warning')])
+        added, removed = self.store.poll()
+        self.assertEqual([a.title for a in added], ['Flood Warning'])
+        self.assertEqual([a.title for a in removed], ['Flood Watch'])
+
+    def test_changes_between_polls_cancel_out(self):
+        self.store.report((1, 1), [_alert('a')])
+        self.store.report((1, 1), [])
+        self.assertEqual(self.store.poll(), ([], []))
+
+    def test_update_reads_alerts_of_forecast(self):
+        forecast = Forecast({'latitude': 1, 'longitude': 2,
+                             'alerts': [_alert('a')]}, requests.Response())
+        self.store.update(forecast)
+        self.assertEqual(self.store.locations('a'), set([(1, 2)]))
+
+
+class TestAlert(unittest.TestCase):
+    def test_expires_is_computed_once(self):
+        alert = Alert(_alert('a'))
+        self.assertIs(alert.expires, alert.expires)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import datetime
 import mock
 import requests
 import requests_mock
@@ -5,7 +6,11 @@ import unittest
 
 from collections import OrderedDict as odict
 from appletea import forecastio
+from appletea.cache import ResponseCache
+from appletea.deadline import Deadline
+from appletea.exceptions import DeadlineExceeded
 from appletea.forecastio.models import Forecast
+from appletea.transport import RequestsTransport
 
 
 def _urlq(items):
@@ -15,6 +20,16 @@ def _urlq(items):
     return '&'.join(l)
 
 
+class _RecordingTransport(RequestsTransport):
+    def __init__(self):
+        RequestsTransport.__init__(self)
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return RequestsTransport.get(self, url, **kwargs)
+
+
 class TestApi(unittest.TestCase):
     def setUp(self):
         self.baseurl = 'https://api.forecast.io/forecast'
@@ -51,6 +66,50 @@ class TestApi(unittest.TestCase):
         with mock.patch('requests.get', requests_get_mock):
             forecastio.get_forecast(self.apikey, self.latitude, self.longitude)
 
+    @requests_mock.Mocker()
+    def test_get_forecast_shortens_timeout_to_deadline(self, mock):
+        mock.get(requests_mock.ANY, [{'json': {}},
+                                     {'json': {'hourly': {'data': []}}}])
+        with Deadline(2):
+            forecast = forecastio.get_forecast(
+                self.apikey, self.latitude, self.longitude,
+                exclude='hourly')
+            self.assertLessEqual(mock.last_request.timeout, 2)
+            forecast.hourly
+            self.assertLessEqual(mock.last_request.timeout, 2)
+        self.assertEqual(mock.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_get_forecast_with_expired_deadline(self, mock):
+        mock.get(requests_mock.ANY, json={})
+        deadline = Deadline()
+        deadline.cancel()
+        with self.assertRaises(DeadlineExceeded):
+            forecastio.get_forecast(self.apikey, self.latitude,
+                                    self.longitude, deadline=deadline)
+        self.assertEqual(mock.call_count, 0)
+
+    @requests_mock.Mocker()
+    def test_get_forecast_calls_time_machine_url(self, mock):
+        mock.get(requests_mock.ANY, json={})
+        utc = datetime.timezone.utc if hasattr(datetime, 'timezone') else None
+        for time, expected in [
+                (1433116800, '1433116800'),
+                (datetime.date(2015, 6, 1), '2015-06-01T00:00:00'),
+                (datetime.datetime(2015, 6, 1, 12, 30, 15, 500),
+                 '2015-06-01T12:30:15'),
+                ('2015-06-01T12:00:00', '2015-06-01T12:00:00')]:
+            forecastio.get_forecast(self.apikey, self.latitude,
+                                    self.longitude, time=time)
+            self.assertEqual(mock.last_request.url, '%s/%s/%s,%s,%s' % (
+                self.baseurl, self.apikey, self.latitude, self.longitude,
+                expected))
+        if utc is not None:
+            forecastio.get_forecast(
+                self.apikey, self.latitude, self.longitude,
+                time=datetime.datetime(2015, 6, 1, tzinfo=utc))
+            self.assertTrue(mock.last_request.url.endswith(',1433116800'))
+
     @requests_mock.Mocker()
     def test_get_forecast_calls_correct_url(self, mock):
         mock.get(requests_mock.ANY, json={})
@@ -96,3 +155,136 @@ class TestApi(unittest.TestCase):
         r = forecastio.get_forecast(self.apikey, self.latitude, self.longitude)
 
         self.assertIsInstance(r, Forecast)
+
+    @requests_mock.Mocker()
+    def test_get_forecast_revalidates_cached_forecast(self, mock):
+        mock.get(requests_mock.ANY, [
+            {'json': {'currently': {}}, 'headers': {'ETag': '"abc"'}},
+            {'status_code': 304}])
+        cache = ResponseCache()
+        r1 = forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache)
+        r2 = forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache)
+
+        self.assertIs(r1, r2)
+        self.assertEqual(mock.call_count, 2)
+        self.assertEqual(mock.last_request.headers['If-None-Match'], '"abc"')
+
+    @requests_mock.Mocker()
+    def test_get_forecast_returns_fresh_cached_forecast(self, mock):
+        mock.get(requests_mock.ANY, json={},
+                 headers={'Cache-Control': 'max-age=300'})
+        cache = ResponseCache()
+        r1 = forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache)
+        r2 = forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache)
+
+        self.assertIs(r1, r2)
+        self.assertEqual(mock.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_get_forecast_converts_cached_forecast(self, mock):
+        mock.get(requests_mock.ANY, json={
+            'currently': {'temperature': 100}, 'flags': {'units': 'si'}},
+            headers={'Cache-Control': 'max-age=300'})
+        cache = ResponseCache()
+        si = forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache,
+            units='si')
+        us = forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache)
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(si.currently.temperature, 100)
+        self.assertEqual(us.currently.temperature, 212)
+        self.assertIs(forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache,
+            units='us'), us)
+
+    @requests_mock.Mocker()
+    def test_reading_missing_block_after_deadline_raises(self, mock):
+        mock.get(requests_mock.ANY, json={'currently': {}})
+        forecast = forecastio.get_forecast(self.apikey, self.latitude,
+                                           self.longitude,
+                                           exclude='hourly,alerts')
+        deadline = Deadline()
+        deadline.cancel()
+        with deadline:
+            with self.assertRaises(DeadlineExceeded):
+                forecast.hourly
+            with self.assertRaises(DeadlineExceeded):
+                forecast.alerts
+        self.assertEqual(mock.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_converted_forecast_fetches_and_converts_missing_block(self, mock):
+        def respond(request, context):
+            self.assertEqual(request.qs['units'], ['us'])
+            if 'flags' in request.qs['exclude'][0]:
+                return {'hourly': {'data': [{'time': 0,
+                                             'temperature': 212}]}}
+            context.headers['Cache-Control'] = 'max-age=300'
+            return {'currently': {}, 'flags': {'units': 'us',
+                                               'nearest-station': 1.0}}
+        mock.get(requests_mock.ANY, json=respond)
+        cache = ResponseCache()
+        us = forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache,
+            units='us', exclude='hourly')
+        si = forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache,
+            units='si', exclude='hourly')
+
+        self.assertEqual([p.temperature for p in si.hourly.data], [100])
+        self.assertEqual([p.temperature for p in us.hourly.data], [212])
+        self.assertEqual(si.json['flags']['nearest-station'], 1.61)
+
+    @requests_mock.Mocker()
+    def test_missing_block_is_fetched_with_transport_and_cache(self, mock):
+        def respond(request, context):
+            if 'flags' in request.qs['exclude'][0]:
+                context.headers['Cache-Control'] = 'max-age=300'
+                return {'hourly': {'data': [{'time': 0}]}}
+            return {'currently': {}}
+        mock.get(requests_mock.ANY, json=respond)
+        transport = _RecordingTransport()
+        cache = ResponseCache()
+        for _ in range(2):
+            forecast = forecastio.get_forecast(
+                self.apikey, self.latitude, self.longitude, cache=cache,
+                transport=transport, exclude='hourly')
+            self.assertEqual(len(forecast.hourly.data), 1)
+
+        # The block is fetched once, the forecast (not cacheable) twice.
+        self.assertEqual(mock.call_count, 3)
+        self.assertEqual(len(transport.urls), 3)
+        self.assertIsNone(forecastio.api.TRANSPORT)
+
+    @requests_mock.Mocker()
+    def test_get_forecast_without_flags_is_cached_per_units(self, mock):
+        mock.get(requests_mock.ANY, json={},
+                 headers={'Cache-Control': 'max-age=300'})
+        cache = ResponseCache()
+        for units in ('si', 'us'):
+            forecastio.get_forecast(
+                self.apikey, self.latitude, self.longitude, cache=cache,
+                units=units, exclude='flags')
+
+        self.assertEqual(mock.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_get_forecast_refetches_modified_forecast(self, mock):
+        mock.get(requests_mock.ANY, [
+            {'json': {}, 'headers': {'Last-Modified': 'Mon, 02 May 2016'}},
+            {'json': {'offset': 2}}])
+        cache = ResponseCache()
+        forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache)
+        r = forecastio.get_forecast(
+            self.apikey, self.latitude, self.longitude, cache=cache)
+
+        self.assertEqual(r.json, {'offset': 2})
+        self.assertEqual(mock.last_request.headers['If-Modified-Since'],
+                         'Mon, 02 May 2016')
@@ -0,0 +1,159 @@
+import datetime
+import json
+import os
+import os.path as osp
+import re
+import requests
+import requests_mock
+import shutil
+import tempfile
+import time
+import unittest
+
+from appletea.forecastio.backfill import CHECKPOINT, Backfill
+from appletea.forecastio.export import ForecastExporter, read_columns
+from appletea.forecastio.models import Forecast
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+SITES = [(51.0, 3.5), (50.5, 4.0)]
+START = datetime.date(2015, 6, 1)
+END = datetime.date(2015, 6, 4)
+
+
+def _forecast(request, context):
+    location = request.path.rsplit('/', 1)[1].split(',')
+    day = datetime.datetime.strptime(location[2], '%Y-%m-%dt%H:%M:%S')
+    time = int((day - datetime.datetime(1970, 1, 1)).total_seconds())
+    return {'latitude': float(location[0]), 'longitude': float(location[1]),
+            'hourly': {'data': [{'time': time + 3600 * h, 'temperature': h}
+                                for h in range(24)]}}
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.mock = requests_mock.Mocker()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        self.forecast = self.mock.get(re.compile('forecast.io'),
+                                      json=_forecast)
+
+    def backfill(self, **kwargs):
+        kwargs.setdefault('format', 'npz')
+        return Backfill('key', self.path, SITES, START, END, **kwargs)
+
+    def requested(self):
+        return sorted(r.path.rsplit('/', 1)[1]
+                      for r in self.mock.request_history)
+
+    def test_run_fetches_every_site_and_day(self):
+        result = self.backfill(chunk_size=48).run()
+        self.assertEqual(result, (6, [], 0))
+        self.assertEqual(self.requested()[:2], [
+            '50.5,4.0,2015-06-01t00:00:00', '50.5,4.0,2015-06-02t00:00:00'])
+        self.assertEqual(self.forecast.last_request.qs['exclude'],
+                         ['currently,minutely,daily,alerts,flags'])
+        columns = read_columns(self.path)
+        self.assertEqual(len(columns['time']), 6 * 24)
+        self.assertEqual(len(set(zip(columns['latitude'], columns['time']))),
+                         6 * 24)
+
+    def test_resumes_without_fetching_days_twice(self):
+        result = self.backfill().run(limit=4)
+        self.assertEqual(result.done, 4)
+        self.assertEqual(result.remaining, 2)
+        result = self.backfill().run()
+        self.assertEqual((result.done, result.remaining), (2, 0))
+        self.assertEqual(self.backfill().run(), (0, [], 0))
+        self.assertEqual(self.mock.call_count, 6)
+        self.assertEqual(len(read_columns(self.path)['time']), 6 * 24)
+
+    def test_drops_parts_written_after_the_checkpoint(self):
+        self.backfill().run(limit=2)
+        # A crash after writing a part file and during its checkpoint.
+        shutil.copy(osp.join(self.path, 'part-00000.npz'),
+                    osp.join(self.path, 'part-00001.npz'))
+        with open(osp.join(self.path, CHECKPOINT), 'ab') as fp:
+            fp.write(b'{"started":"part-00001.npz"}\n')
+            fp.write(b'{"part":"part-00001.npz","jobs":[[51.0')
+        backfill = self.backfill()
+        self.assertIn('part-00001.npz', os.listdir(self.path))
+        self.assertEqual(backfill.run(), (4, [], 0))
+        self.assertEqual(len(read_columns(self.path)['time']), 6 * 24)
+        with open(osp.join(self.path, CHECKPOINT)) as fp:
+            entries = [json.loads(line) for line in fp]
+        self.assertEqual(sum(len(e.get('jobs', ())) for e in entries), 6)
+
+    def test_keeps_part_files_it_did_not_write(self):
+        self.backfill().run(limit=2)
+        other = osp.join(self.path, 'part-00001.npz')
+        shutil.copy(osp.join(self.path, 'part-00000.npz'), other)
+        self.backfill().run()
+        self.assertTrue(osp.exists(other))
+
+    def test_refuses_export_without_checkpoint(self):
+        with ForecastExporter(self.path, format='npz') as exporter:
+            exporter.write(Forecast({'latitude': 1, 'longitude': 2, 'hourly': {
+                'data': [{'time': 0, 'temperature': 10}]}}, None))
+        with self.assertRaises(ValueError):
+            self.backfill()
+        self.assertEqual(os.listdir(self.path), ['part-00000.npz'])
+
+    def test_failed_jobs_are_retried_by_the_next_run(self):
+        self.mock.get(re.compile('51.0,3.5,2015-06-02'), status_code=500)
+        result = self.backfill().run()
+        self.assertEqual(result.done, 5)
+        self.assertEqual([job for job, _ in result.failed],
+                         [(51.0, 3.5, datetime.date(2015, 6, 2))])
+        self.assertIsInstance(result.failed[0][1], requests.HTTPError)
+        self.assertEqual(result.remaining, 1)
+
+        self.mock.get(re.compile('forecast.io'), json=_forecast)
+        self.assertEqual(self.backfill().run(), (1, [], 0))
+
+    def test_exhausted_quota_stops_the_run(self):
+        self.mock.get(re.compile('forecast.io'), status_code=429)
+        with self.assertRaises(requests.HTTPError):
+            self.backfill(concurrency=1).run()
+        self.assertEqual(self.mock.call_count, 1)
+        self.assertEqual(len(list(self.backfill().pending())), 6)
+
+    def test_stopped_run_stops_planning_jobs(self):
+        self.mock.get(re.compile('forecast.io'), status_code=429)
+        backfill = Backfill('key', self.path, SITES, START,
+                            START + datetime.timedelta(days=10000),
+                            concurrency=1, format='npz')
+        planned = []
+
+        def pending():
+            for job in Backfill.pending(backfill):
+                planned.append(job)
+                yield job
+        backfill.pending = pending
+        with self.assertRaises(requests.HTTPError):
+            backfill.run()
+        time.sleep(0.2)
+        self.assertLess(len(planned), 10)
+
+    def test_rate_paces_requests(self):
+        sleeps = []
+        backfill = self.backfill(concurrency=1, rate=2, clock=lambda: 0,
+                                 sleep=sleeps.append)
+        backfill.run(limit=3)
+        self.assertEqual(sleeps, [0.5, 1.0])
+
+    def test_unknown_block(self):
+        with self.assertRaises(ValueError):
+            self.backfill(block='weekly')
+        self.assertFalse(os.listdir(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
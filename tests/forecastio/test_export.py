@@ -0,0 +1,115 @@
+import json
+import math
+import os
+import os.path as osp
+import requests
+import shutil
+import tempfile
+import unittest
+
+from appletea.forecastio.export import ForecastExporter, read_columns
+from appletea.forecastio.models import Forecast
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class _TestExport(object):
+    format = None
+
+    def setUp(self):
+        json_file = osp.join(
+            osp.dirname(osp.abspath(__file__)), 'data/forecast.json')
+        with open(json_file) as fp:
+            self.json_data = json.loads(fp.read())
+        self.forecast = Forecast(self.json_data, requests.Response())
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def exporter(self, **kwargs):
+        return ForecastExporter(self.path, format=self.format, **kwargs)
+
+    def test_round_trip(self):
+        points = self.json_data['hourly']['data']
+        with self.exporter() as exporter:
+            self.assertEqual(exporter.write(self.forecast), len(points))
+        columns = read_columns(self.path)
+        self.assertEqual(list(columns)[:4],
+                         ['latitude', 'longitude', 'time', 'summary'])
+        self.assertEqual(list(columns['time']), [p['time'] for p in points])
+        self.assertEqual(list(columns['temperature']),
+                         [p['temperature'] for p in points])
+        self.assertEqual(list(columns['summary']),
+                         [p['summary'] for p in points])
+        self.assertEqual(set(columns['latitude']),
+                         set([self.json_data['latitude']]))
+        self.assertTrue(all(math.isnan(v) for v in columns['windGust']))
+
+    def test_chunks_and_appends(self):
+        n = len(self.json_data['hourly']['data'])
+        with self.exporter(chunk_size=n) as exporter:
+            exporter.write(self.forecast)
+            exporter.write(self.forecast.hourly, latitude=1, longitude=2)
+            self.assertEqual(exporter.rows, 2 * n)
+        with self.exporter(fields=['temperature']) as exporter:
+            exporter.write(self.forecast)
+        self.assertEqual(len(os.listdir(self.path)), 3)
+
+        columns = read_columns(self.path, ['longitude', 'temperature'])
+        self.assertEqual(list(columns), ['longitude', 'temperature'])
+        self.assertEqual(len(columns['temperature']), 3 * n)
+        self.assertEqual(list(columns['longitude'][n:2 * n]), [2] * n)
+        with self.assertRaises(KeyError):
+            read_columns(self.path, ['summary'])
+
+    def test_daily_and_currently(self):
+        with self.exporter(block='daily') as exporter:
+            exporter.write(self.forecast)
+        columns = read_columns(self.path, ['time', 'sunriseTime'])
+        self.assertEqual(list(columns['sunriseTime']),
+                         [p['sunriseTime']
+                          for p in self.json_data['daily']['data']])
+
+        path = osp.join(self.path, 'currently')
+        with ForecastExporter(path, block='currently',
+                              format=self.format) as exporter:
+            exporter.write(self.forecast)
+        self.assertEqual(list(read_columns(path)['time']),
+                         [self.json_data['currently']['time']])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.exporter(block='weekly')
+        with self.assertRaises(ValueError):
+            self.exporter().write(self.forecast.hourly)
+        with self.assertRaises(TypeError):
+            self.exporter().write(self.json_data)
+        self.assertEqual(read_columns(self.path), {})
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestNpzExport(_TestExport, unittest.TestCase):
+    format = 'npz'
+
+    def test_format_of_existing_export(self):
+        with self.exporter() as exporter:
+            exporter.write(self.forecast)
+        self.assertEqual(ForecastExporter(self.path).format, 'npz')
+        with self.assertRaises(ValueError):
+            ForecastExporter(self.path, format='parquet')
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class TestParquetExport(_TestExport, unittest.TestCase):
+    format = 'parquet'
+
+
+if __name__ == '__main__':
+    unittest.main()
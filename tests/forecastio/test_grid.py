@@ -0,0 +1,120 @@
+import math
+import unittest
+
+from appletea.forecastio import ForecastGrid
+from appletea.forecastio.models import Forecast
+
+
+def _forecast(latitude, longitude, temperatures, start=0):
+    data = [{'time': start + 3600 * i, 'temperature': t}
+            for i, t in enumerate(temperatures) if t is not None]
+    return Forecast({'latitude': latitude, 'longitude': longitude,
+                     'hourly': {'data': data}}, None)
+
+
+def _nearest(forecasts, latitude, longitude, k):
+    scale = math.cos(math.radians(latitude))
+    return [s for _, s in sorted(
+        (math.hypot(latitude - f.json['latitude'],
+                    (longitude - f.json['longitude']) * scale), s)
+        for s, f in enumerate(forecasts))[:k]]
+
+
+class TestForecastGrid(unittest.TestCase):
+    def setUp(self):
+        # 3x3 lattice where temperature = latitude + longitude + hour
+        self.forecasts = [
+            _forecast(lat, lon, [lat + lon + h for h in range(3)])
+            for lat in (50.0, 51.0, 52.0) for lon in (3.0, 4.0, 5.0)]
+        self.grid = ForecastGrid(self.forecasts, ['temperature'])
+
+    def test_grid_holds_packed_values(self):
+        self.assertEqual(len(self.grid), 9)
+        self.assertEqual(list(self.grid.times), [0, 3600, 7200])
+        self.assertEqual(str(self.grid), '<ForecastGrid instance: 9 '
+                         'locations with 3 hourly data points>')
+
+    def test_nearest_returns_closest_locations(self):
+        nearest = self.grid.nearest(51.1, 4.2, k=2)
+        self.assertEqual([s for _, s in nearest], [4, 5])
+
+    def test_nearest_raises_for_k_below_one(self):
+        with self.assertRaises(ValueError):
+            self.grid.nearest(51.1, 4.2, k=0)
+
+    def test_nearest_matches_brute_force(self):
+        grid = ForecastGrid(self.forecasts, ['temperature'], cell=0.3)
+        for lat, lon in [(49.0, 2.0), (51.4, 4.6), (53.0, 5.5)]:
+            scale = math.cos(math.radians(lat))
+            expected = sorted(
+                (math.hypot(lat - f.json['latitude'],
+                            (lon - f.json['longitude']) * scale), s)
+                for s, f in enumerate(self.forecasts))[:3]
+            self.assertEqual([s for _, s in grid.nearest(lat, lon, k=3)],
+                             [s for _, s in expected])
+
+    def test_value_at_location_and_data_point_is_exact(self):
+        for method in ('idw', 'bilinear'):
+            self.assertEqual(
+                self.grid.value('temperature', 51.0, 4.0, 3600, method), 56)
+
+    def test_bilinear_value_interpolates_space_and_time(self):
+        value = self.grid.value('temperature', 50.5, 3.25, 1800, 'bilinear')
+        self.assertAlmostEqual(value, 50.5 + 3.25 + 0.5)
+
+    def test_idw_value_is_weighted_between_neighbours(self):
+        value = self.grid.value('temperature', 50.5, 3.5, 0, k=4)
+        self.assertAlmostEqual(value, 54.0)
+
+    def test_value_outside_time_range_is_nan(self):
+        self.assertTrue(math.isnan(
+            self.grid.value('temperature', 51.0, 4.0, 7201)))
+
+    def test_bilinear_value_outside_lattice_is_nan(self):
+        self.assertTrue(math.isnan(
+            self.grid.value('temperature', 49.0, 4.0, 0, 'bilinear')))
+
+    def test_idw_skips_missing_values(self):
+        forecasts = [_forecast(50.0, 3.0, [1.0, None]),
+                     _forecast(50.0, 3.1, [2.0, 4.0])]
+        grid = ForecastGrid(forecasts, ['temperature'])
+        self.assertEqual(grid.value('temperature', 50.0, 3.0, 3600), 4.0)
+
+    def test_bilinear_requires_lattice(self):
+        grid = ForecastGrid(self.forecasts[:-1], ['temperature'])
+        with self.assertRaises(ValueError):
+            grid.value('temperature', 51.0, 4.0, 0, 'bilinear')
+
+    def test_value_raises_for_unknown_field(self):
+        with self.assertRaises(ValueError):
+            self.grid.value('humidity', 51.0, 4.0, 0)
+
+    def test_values_returns_array(self):
+        values = self.grid.values('temperature', [(51.0, 4.0, 0),
+                                                  (52.0, 5.0, 7200)])
+        self.assertEqual(list(values), [55.0, 59.0])
+
+    def test_nearest_in_single_location_grid(self):
+        grid = ForecastGrid([_forecast(51.0, 4.0, [1])], ['temperature'])
+        for lat, lon in [(51.001, 4.0), (51.01, 4.01), (-30.0, 150.0)]:
+            self.assertEqual(grid.nearest(lat, lon, k=3)[0][1], 0)
+
+    def test_nearest_in_collinear_grids(self):
+        for forecasts in (
+                [_forecast(51.0, 0.01 * i, [1]) for i in range(100)],
+                [_forecast(0.01 * i, 4.0, [1]) for i in range(100)],
+                [_forecast(51.0, 4.0, [1]) for i in range(40)]):
+            grid = ForecastGrid(forecasts, ['temperature'])
+            for lat, lon in [(51.001, 0.5), (51.5, 3.0), (0.25, 4.5),
+                             (60.0, -20.0)]:
+                nearest = [s for _, s in grid.nearest(lat, lon, k=4)]
+                self.assertEqual(nearest, _nearest(forecasts, lat, lon, 4))
+
+    def test_nearest_far_outside_the_grid(self):
+        forecasts = [_forecast(50.0 + 0.1 * i, 3.0 + 0.1 * j, [1])
+                     for i in range(10) for j in range(10)]
+        grid = ForecastGrid(forecasts, ['temperature'])
+        for lat, lon in [(50.45, 3.45), (-40.0, 170.0), (80.0, 3.5),
+                         (50.5, -100.0)]:
+            nearest = [s for _, s in grid.nearest(lat, lon, k=4)]
+            self.assertEqual(nearest, _nearest(forecasts, lat, lon, 4))
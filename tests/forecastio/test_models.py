@@ -1,14 +1,35 @@
 import datetime
 import json
+import mock
 import os.path as osp
 import requests
 import requests_mock
+import threading
+import time
 import unittest
 
 from appletea.forecastio.models import (
     Forecast, ForecastioDataPoint, ForecastioDataBlock, Alert)
 
 
+class _Blocks(dict):
+    # Forecast JSON handing out blocks once n blocks were asked for, so that
+    # the threads fetching them store them together.
+    def __init__(self, json_data, n):
+        dict.__init__(self, json_data)
+        self.n = n
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            self.n -= 1
+            if self.n == 0:
+                self.ready.set()
+        self.ready.wait(2)
+        return dict.__getitem__(self, key)
+
+
 class TestModels(unittest.TestCase):
     def setUp(self):
         response = requests.Response()
@@ -110,6 +131,17 @@ class TestModels(unittest.TestCase):
         self.assertEqual(str(e_cm.exception), 'Property "undefined" not '
                          'valid or is not available for this forecast.')
 
+    def test_forecast_to_bytes_round_trip(self):
+        forecast = Forecast.from_bytes(self.forecast.to_bytes())
+        self.assertEqual(forecast.json, self.json_data)
+        self.assertIsNone(forecast.response)
+        self.assertEqual(forecast.hourly.data[0].temperature,
+                         self.forecast.hourly.data[0].temperature)
+
+    def test_forecast_to_bytes_is_smaller_than_json(self):
+        self.assertLess(len(self.forecast.to_bytes()),
+                        len(json.dumps(self.json_data)))
+
 
 class TestModelsEmptyData(unittest.TestCase):
     def setUp(self):
@@ -169,3 +201,61 @@ class TestModelsEmptyData(unittest.TestCase):
     def test_get_daily_forecast_reloads_empty_and_returns_data_block_object(self, mock):
         mock.get(requests_mock.ANY, json={})
         self.assertIsInstance(self.forecast.daily, ForecastioDataBlock)
+
+    @requests_mock.Mocker()
+    def test_concurrent_reads_fetch_missing_block_once(self, mock):
+        def slow(request, context):
+            time.sleep(0.05)
+            return self.json_data
+        mock.get(requests_mock.ANY, json=slow)
+        json = self.forecast.json
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(self.forecast.hourly))
+            for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(len(results[0].data),
+                         len(self.json_data['hourly']['data']))
+        # The json is replaced rather than modified.
+        self.assertEqual(json, {})
+        self.assertIn('hourly', self.forecast.json)
+
+    @requests_mock.Mocker()
+    def test_concurrent_reads_of_different_blocks_keep_all_blocks(self, m):
+        keys = ['minutely', 'currently', 'hourly', 'daily']
+        blocks = _Blocks(self.json_data, len(keys))
+        m.get(requests_mock.ANY, json={})
+
+        with mock.patch.object(Forecast, '_parse',
+                               lambda self, response: Forecast(blocks, None)):
+            threads = [threading.Thread(target=getattr,
+                                        args=(self.forecast, k))
+                       for k in keys]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(sorted(self.forecast.json), sorted(keys))
+
+    @requests_mock.Mocker()
+    def test_blocks_are_shared_and_immutable(self, mock):
+        mock.get(requests_mock.ANY, json=self.json_data)
+        block = self.forecast.daily
+        self.assertIs(self.forecast.daily, block)
+        self.assertIsInstance(block.data, tuple)
+        self.assertIs(self.forecast.currently, self.forecast.currently)
+
+    @requests_mock.Mocker()
+    def test_failed_fetch_is_retried(self, mock):
+        mock.get(requests_mock.ANY, status_code=503)
+        self.assertEqual(self.forecast.hourly.data, ())
+        mock.get(requests_mock.ANY, json=self.json_data)
+        self.assertEqual(len(self.forecast.hourly.data),
+                         len(self.json_data['hourly']['data']))
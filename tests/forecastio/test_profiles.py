@@ -0,0 +1,164 @@
+import json
+import mock
+import os
+import os.path as osp
+import requests
+import requests_mock
+import shutil
+import tempfile
+import unittest
+
+from appletea import forecastio
+from appletea.cache import ResponseCache
+from appletea.forecastio import profiles
+from appletea.forecastio.models import Forecast
+from appletea.forecastio.profiles import BlockProfiles
+
+
+class TestProfiles(unittest.TestCase):
+    def setUp(self):
+        self.profiles = BlockProfiles(warmup=2)
+
+    def test_exclude_returns_none_while_warming_up(self):
+        self.profiles.record('p', 'hourly')
+        self.assertIsNone(self.profiles.exclude('p'))
+        self.assertIsNone(self.profiles.exclude('p'))
+
+    def test_exclude_lists_unused_blocks_after_warm_up(self):
+        self.profiles.exclude('p')
+        self.profiles.exclude('p')
+        self.profiles.record('p', 'hourly')
+        self.profiles.record('p', 'currently')
+        self.assertEqual(self.profiles.exclude('p'), 'minutely,daily,alerts')
+
+    def test_recorded_block_is_requested_again(self):
+        self.profiles.exclude('p')
+        self.profiles.exclude('p')
+        self.assertEqual(self.profiles.exclude('p'),
+                         'currently,minutely,hourly,daily,alerts')
+        self.profiles.record('p', 'daily')
+        self.assertEqual(self.profiles.exclude('p'),
+                         'currently,minutely,hourly,alerts')
+
+    def test_exclude_returns_none_when_all_blocks_are_used(self):
+        self.profiles.exclude('p')
+        self.profiles.exclude('p')
+        for block in profiles.BLOCKS:
+            self.profiles.record('p', block)
+        self.assertIsNone(self.profiles.exclude('p'))
+
+    def test_save_and_load_profiles(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = osp.join(tmpdir, 'profiles.json')
+        self.profiles.exclude('p')
+        self.profiles.record('p', 'hourly')
+        self.profiles.save(path)
+        self.assertEqual(os.listdir(tmpdir), ['profiles.json'])
+
+        loaded = BlockProfiles.load(path)
+        self.assertEqual(loaded.warmup, 2)
+        self.assertIn('p', loaded)
+        self.assertEqual(loaded.blocks('p'), set(['hourly']))
+        self.assertIsNone(loaded.exclude('p'))
+        self.assertEqual(loaded.exclude('p'),
+                         'currently,minutely,daily,alerts')
+
+    def test_load_missing_file_returns_empty_profiles(self):
+        self.assertEqual(len(BlockProfiles.load('/nonexistent/p.json')), 0)
+
+    def test_call_site_returns_file_and_line(self):
+        name = profiles.call_site(0)
+        self.assertTrue(name.startswith(__file__.rstrip('c') + ':'))
+
+
+class TestGetForecastProfile(unittest.TestCase):
+    def setUp(self):
+        json_file = osp.join(
+            osp.dirname(osp.abspath(__file__)), 'data/forecast.json')
+        with open(json_file) as fp:
+            self.json_data = json.loads(fp.read())
+        patcher = mock.patch.object(profiles, 'default', BlockProfiles(1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_forecast(self, **kwargs):
+        return forecastio.get_forecast('key', 51.036391, 3.699794,
+                                       profile='p', **kwargs)
+
+    @requests_mock.Mocker()
+    def test_get_forecast_excludes_unused_blocks(self, mock):
+        mock.get(requests_mock.ANY, json=self.json_data)
+        self.get_forecast(units='si').hourly
+        self.assertNotIn('exclude', mock.last_request.qs)
+
+        self.get_forecast(units='si')
+        self.assertEqual(mock.last_request.qs['exclude'],
+                         ['currently,minutely,daily,alerts'])
+        self.assertEqual(mock.last_request.qs['units'], ['si'])
+
+    @requests_mock.Mocker()
+    def test_get_forecast_keeps_explicit_exclude(self, mock):
+        mock.get(requests_mock.ANY, json=self.json_data)
+        self.get_forecast()
+        self.get_forecast(exclude='alerts')
+        self.assertEqual(mock.last_request.qs['exclude'], ['alerts'])
+
+    @requests_mock.Mocker()
+    def test_reading_excluded_block_records_it(self, mock):
+        mock.get(requests_mock.ANY, json=self.json_data)
+        self.get_forecast()
+        self.get_forecast().daily
+        self.assertEqual(profiles.default.blocks('p'), set(['daily']))
+
+    @requests_mock.Mocker()
+    def test_reading_excluded_alerts_fetches_them(self, mock):
+        alerts = self.json_data['alerts']
+        json_data = dict(self.json_data)
+        del json_data['alerts']
+        mock.get(requests_mock.ANY, [{'json': json_data},
+                                     {'json': json_data},
+                                     {'json': {'alerts': alerts}}])
+        self.get_forecast()
+        forecast = self.get_forecast()
+        self.assertIn('alerts', mock.last_request.qs['exclude'][0])
+
+        self.assertEqual([a.json for a in forecast.alerts], alerts)
+        self.assertEqual(mock.last_request.qs['exclude'],
+                         ['minutely,currently,hourly,daily,flags'])
+        self.assertEqual(profiles.default.blocks('p'), set(['alerts']))
+
+    @requests_mock.Mocker()
+    def test_shared_forecast_records_to_profile_of_each_call(self, mock):
+        mock.get(requests_mock.ANY, json=self.json_data,
+                 headers={'Cache-Control': 'max-age=300'})
+        cache = ResponseCache()
+        a = forecastio.get_forecast('key', 1, 2, cache=cache, profile='a')
+        b = forecastio.get_forecast('key', 1, 2, cache=cache, profile='b')
+        a.hourly
+        b.daily
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertIsInstance(a, Forecast)
+        self.assertIs(a.hourly, b.forecast.hourly)
+        self.assertEqual(profiles.default.blocks('a'), set(['hourly']))
+        self.assertEqual(profiles.default.blocks('b'), set(['daily']))
+
+
+class TestForecastReload(unittest.TestCase):
+    @requests_mock.Mocker()
+    def test_reload_keeps_query_and_replaces_exclude(self, mock):
+        mock.get(requests_mock.ANY, json={'daily': {'data': []}})
+        response = requests.Response()
+        response.url = 'https://api.forecast.io/forecast/key/1,2?' \
+                       'units=si&exclude=daily%2Calerts&lang=nl'
+        Forecast({}, response).daily
+        qs = mock.last_request.qs
+        self.assertEqual(qs['units'], ['si'])
+        self.assertEqual(qs['lang'], ['nl'])
+        self.assertEqual(qs['exclude'],
+                         ['minutely,currently,hourly,alerts,flags'])
+
+
+if __name__ == '__main__':
+    unittest.main()
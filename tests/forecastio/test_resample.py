@@ -0,0 +1,119 @@
+import json
+import math
+import mock
+import os.path as osp
+import unittest
+
+from appletea.forecastio import resample as resampling
+from appletea.forecastio.models import Forecast, ForecastioDataBlock
+
+
+def _block(values, offset=0, start=1461880800, step=3600):
+    data = []
+    for i, v in enumerate(values):
+        d = {'time': start + i * step, 'summary': 'Clear'}
+        if v is not None:
+            d['precipIntensity'] = v
+            d['windSpeed'] = 10 * v
+        data.append(d)
+    return ForecastioDataBlock({'summary': 'Dry', 'data': data}, offset)
+
+
+class TestResample(unittest.TestCase):
+    def test_column_returns_packed_values(self):
+        block = _block([1.0, None, 3])
+        column = block.column('precipIntensity')
+        self.assertEqual(column.typecode, 'd')
+        self.assertEqual(column[0], 1.0)
+        self.assertTrue(math.isnan(column[1]))
+        self.assertEqual(column[2], 3.0)
+
+    def test_column_of_text_property_is_nan(self):
+        block = _block([1.0])
+        self.assertTrue(math.isnan(block.column('summary')[0]))
+
+    def test_resample_aggregates_windows(self):
+        # 2016-04-28 22:00 UTC, six hourly points
+        block = _block([1, 2, 3, 4, 5, 6])
+        r = block.resample(3 * 3600, precipIntensity='sum', windSpeed='max')
+        self.assertIsInstance(r, ForecastioDataBlock)
+        self.assertEqual([p.utime for p in r.data],
+                         [1461877200, 1461888000, 1461898800])
+        self.assertEqual([p.precipIntensity for p in r.data], [3, 12, 6])
+        self.assertEqual([p.windSpeed for p in r.data], [20, 50, 60])
+
+    def test_resample_aligns_windows_to_local_time(self):
+        block = _block([1, 2, 3, 4, 5, 6], offset=2)
+        r = block.resample(3 * 3600, precipIntensity='sum')
+        # local midnight is 22:00 UTC
+        self.assertEqual([p.utime for p in r.data], [1461880800, 1461891600])
+        self.assertEqual([p.precipIntensity for p in r.data], [6, 15])
+
+    def test_resample_with_origin(self):
+        block = _block([1, 2, 3, 4, 5, 6], offset=2)
+        r = block.resample(3 * 3600, origin=3600, precipIntensity='count')
+        self.assertEqual([p.precipIntensity for p in r.data], [1, 3, 2])
+
+    def test_resample_ignores_missing_values_and_empty_windows(self):
+        block = _block([1, None, None, None, None, 6], step=1800)
+        r = block.resample(3600, precipIntensity='mean')
+        self.assertEqual(len(r.data), 3)
+        self.assertEqual(r.data[0].precipIntensity, 1)
+        with self.assertRaises(ValueError):
+            r.data[1].precipIntensity
+        self.assertEqual(r.data[2].precipIntensity, 6)
+
+    def test_resample_raises_for_unknown_aggregation(self):
+        with self.assertRaises(ValueError):
+            _block([1]).resample(3600, precipIntensity='median')
+
+    def test_resample_raises_for_non_positive_period(self):
+        for period in (0, -3600):
+            with self.assertRaises(ValueError):
+                _block([1]).resample(period, precipIntensity='sum')
+
+    def test_rolling_aggregates_trailing_window(self):
+        block = _block([1, 2, None, 4, 5])
+        r = block.rolling(2 * 3600, precipIntensity='sum', windSpeed='max')
+        self.assertEqual([p.d.get('precipIntensity') for p in r.data],
+                         [1, 3, 2, 4, 9])
+        self.assertEqual([p.d.get('windSpeed') for p in r.data],
+                         [10, 20, 20, 40, 50])
+
+    def test_rolling_handles_gaps_in_time(self):
+        data = [{'time': t, 'temperature': v}
+                for t, v in [(0, 1.0), (3600, 3.0), (36000, 5.0)]]
+        r = ForecastioDataBlock({'data': data}).rolling(
+            7200, temperature='mean')
+        self.assertEqual([p.temperature for p in r.data], [1.0, 2.0, 5.0])
+
+    def test_rolling_raises_for_first_aggregation(self):
+        with self.assertRaises(ValueError):
+            _block([1]).rolling(3600, precipIntensity='first')
+
+    def test_rolling_sum_does_not_drift(self):
+        values = [1e16, 1.0, -1e16] + [0.1] * 200
+        block = _block(values)
+        rolling = block.rolling(2 * 3600, precipIntensity='sum')
+        resampled = block.resample(2 * 3600, precipIntensity='sum')
+        # Rows 1, 3, ... end windows holding the same rows as resample's.
+        self.assertEqual(
+            [p.precipIntensity for p in rolling.data[5::2]],
+            [p.precipIntensity for p in resampled.data[2:-1]])
+        self.assertAlmostEqual(rolling.data[-1].precipIntensity, 0.2)
+
+    def test_forecast_blocks_use_payload_offset(self):
+        json_file = osp.join(
+            osp.dirname(osp.abspath(__file__)), 'data/forecast.json')
+        with open(json_file) as fp:
+            forecast = Forecast(json.loads(fp.read()), None)
+        self.assertEqual(forecast.hourly.offset, 2)
+        daily = forecast.hourly.resample(86400, temperature='max')
+        self.assertEqual(daily.data[0].utime, 1461794400)
+
+
+class TestResampleWithoutNumpy(TestResample):
+    def setUp(self):
+        patcher = mock.patch.object(resampling, '_numpy', lambda: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
@@ -0,0 +1,106 @@
+import requests_mock
+import time
+import unittest
+
+from appletea.forecastio import PrefetchScheduler
+from appletea.forecastio.models import Forecast
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPrefetchScheduler(unittest.TestCase):
+    def setUp(self):
+        self.apikey = '238ff8ab86e8245aa668b9d9cf8e8'
+        self.clock = FakeClock()
+        self.scheduler = PrefetchScheduler(self.apikey, ttl=100,
+                                           clock=self.clock)
+        self.scheduler._running = True
+
+    def test_take_returns_higher_priority_sites_first(self):
+        self.scheduler.register(1, 1, priority=0)
+        self.scheduler.register(2, 2, priority=5)
+        self.scheduler.register(3, 3, priority=1)
+        taken = [self.scheduler._take() for _ in range(3)]
+        self.assertEqual([s.latitude for s in taken], [2, 3, 1])
+
+    def test_take_respects_rate(self):
+        self.scheduler.rate = 2
+        self.scheduler.register(1, 1)
+        self.scheduler.register(2, 2)
+        self.scheduler._take()
+        self.assertEqual(self.scheduler._next_slot, 1000.5)
+        self.clock.now = 1000.5
+        self.assertEqual(self.scheduler._take().latitude, 2)
+
+    def test_take_skips_unregistered_sites(self):
+        self.scheduler.register(1, 1)
+        self.scheduler.register(2, 2)
+        self.scheduler.unregister(1, 1)
+        self.assertEqual(self.scheduler._take().latitude, 2)
+        self.assertNotIn((1, 1), self.scheduler)
+
+    def test_first_refreshes_are_spread_over_interval(self):
+        for i in range(10):
+            self.scheduler.register(i, i)
+        for _ in range(10):
+            self.scheduler._done(self.scheduler._take(), Forecast({}, None))
+        due = sorted(d for d, _, _, _ in self.scheduler._due)
+        self.assertGreaterEqual(due[0], 1000 + 45)
+        self.assertLessEqual(due[-1], 1000 + 90)
+        self.assertEqual(len(set(due)), 10)
+
+    def test_refreshes_are_scheduled_ahead_of_expiry(self):
+        self.scheduler.register(1, 1)
+        site = self.scheduler._take()
+        self.scheduler._done(site, Forecast({}, None))
+        self.scheduler._done(site, Forecast({}, None))
+        due = [d for d, _, v, _ in self.scheduler._due if v == site.version]
+        self.assertEqual(due, [1000 + 90])
+
+    def test_failed_refresh_keeps_forecast_and_backs_off(self):
+        forecast = Forecast({}, None)
+        self.scheduler.register(1, 1)
+        site = self.scheduler._take()
+        self.scheduler._done(site, forecast)
+        error = ValueError('boom')
+        self.scheduler._done(site, error=error)
+        self.scheduler._done(site, error=error)
+        self.assertIs(self.scheduler.get(1, 1), forecast)
+        self.assertIs(self.scheduler.error(1, 1), error)
+        due = [d for d, _, v, _ in self.scheduler._due if v == site.version]
+        self.assertEqual(due, [1010])
+
+    @requests_mock.Mocker()
+    def test_unregister_drops_cached_forecast(self, mock):
+        mock.get(requests_mock.ANY, json={'flags': {'units': 'si'}})
+        self.scheduler.register(1, 2, units='si')
+        self.scheduler._refresh(self.scheduler._take())
+        self.assertEqual(len(self.scheduler.cache), 1)
+        self.scheduler.unregister(1, 2)
+        self.assertEqual(len(self.scheduler.cache), 0)
+
+    def test_get_raises_for_unregistered_site(self):
+        with self.assertRaises(KeyError):
+            self.scheduler.get(1, 1)
+
+    @requests_mock.Mocker()
+    def test_start_fetches_registered_sites(self, mock):
+        mock.get(requests_mock.ANY, json={'offset': 2})
+        scheduler = PrefetchScheduler(self.apikey, concurrency=2)
+        scheduler.register(51.036391, 3.699794)
+        scheduler.register(37.3845, -122.0881)
+        with scheduler:
+            deadline = time.time() + 5
+            while time.time() < deadline and (
+                    scheduler.get(51.036391, 3.699794) is None or
+                    scheduler.get(37.3845, -122.0881) is None):
+                time.sleep(0.01)
+        self.assertEqual(scheduler.get(37.3845, -122.0881).json,
+                         {'offset': 2})
+        self.assertEqual(mock.call_count, 2)
@@ -0,0 +1,92 @@
+import json
+import os.path as osp
+import requests
+import requests_mock
+import unittest
+
+from appletea import forecastio
+from appletea.forecastio import stream
+from appletea.forecastio.models import Alert, ForecastioDataPoint
+from appletea.forecastio.stream import ForecastParser
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _json(items):
+    return [(n, v.json if isinstance(v, Alert) else getattr(v, 'd', v))
+            for n, v in items]
+
+
+class TestForecastParser(unittest.TestCase):
+    def setUp(self):
+        json_file = osp.join(
+            osp.dirname(osp.abspath(__file__)), 'data/forecast.json')
+        with open(json_file, 'rb') as fp:
+            self.raw = fp.read()
+        self.json_data = json.loads(self.raw.decode('utf-8'))
+
+    def test_items_are_independent_of_chunk_size(self):
+        expected = list(stream.parse([self.raw]))
+        for size in (1, 2, 7, 100):
+            items = list(stream.parse(_chunks(self.raw, size)))
+            self.assertEqual(_json(items), _json(expected))
+
+    def test_data_points_are_returned_one_by_one(self):
+        items = list(stream.parse(_chunks(self.raw, 64)))
+        hourly = [v for n, v in items if n == 'hourly']
+        self.assertTrue(all(isinstance(v, ForecastioDataPoint)
+                            for v in hourly))
+        self.assertEqual([v.d for v in hourly],
+                         self.json_data['hourly']['data'])
+        self.assertEqual(dict(items)['hourly.summary'],
+                         self.json_data['hourly']['summary'])
+        self.assertEqual(dict(items)['flags'], self.json_data['flags'])
+
+    def test_currently_is_returned_before_the_rest_arrives(self):
+        raw = self.raw[:self.raw.index(b'"daily"') + 20]
+        parser = ForecastParser()
+        items = dict(parser.feed(raw))
+        self.assertEqual(items['currently'].d, self.json_data['currently'])
+        self.assertNotIn('daily', items)
+        with self.assertRaises(ValueError):
+            parser.close()
+
+    def test_parsed_bytes_are_released(self):
+        parser = ForecastParser()
+        parser.feed(self.raw[:self.raw.index(b'"daily"')])
+        self.assertLess(len(parser._buf), 1024)
+
+    def test_alerts_and_strings_with_escapes(self):
+        body = {'alerts': [{'title': 'A "storm" \\ }]', 'expires': 1}],
+                'currently': {'summary': '{[,'}, 'minutely': {'data': []}}
+        items = list(stream.parse(_chunks(json.dumps(body).encode(), 3)))
+        self.assertIsInstance(items[0][1], Alert)
+        self.assertEqual(items[0][1].title, 'A "storm" \\ }]')
+        self.assertEqual(items[1][1].summary, '{[,')
+        self.assertEqual(len(items), 2)
+
+    def test_invalid_response_raises_value_error(self):
+        for raw in (b'[1]', b'{"a" 1}', b'{"a":1}}', b'{"a":1]'):
+            with self.assertRaises(ValueError):
+                list(stream.parse([raw]))
+
+
+class TestStreamForecast(unittest.TestCase):
+    @requests_mock.Mocker()
+    def test_stream_forecast_yields_items(self, mock):
+        mock.get(requests_mock.ANY, json={'currently': {'time': 1},
+                                          'hourly': {'data': [{'time': 2}]}})
+        items = list(forecastio.stream_forecast('key', 1, 2,
+                                                extend='hourly'))
+        self.assertEqual([(n, v.utime) for n, v in items],
+                         [('currently', 1), ('hourly', 2)])
+        self.assertEqual(mock.last_request.qs, {'extend': ['hourly']})
+        self.assertTrue(mock.last_request.path.endswith('/key/1,2'))
+
+    @requests_mock.Mocker()
+    def test_stream_forecast_raises_http_error(self, mock):
+        mock.get(requests_mock.ANY, status_code=404, json={})
+        with self.assertRaises(requests.HTTPError):
+            list(forecastio.stream_forecast('key', 1, 2))
@@ -0,0 +1,77 @@
+import json
+import os.path as osp
+import requests
+import unittest
+
+from appletea.forecastio import units
+from appletea.forecastio.models import Forecast
+
+
+class TestUnits(unittest.TestCase):
+    def setUp(self):
+        json_file = osp.join(
+            osp.dirname(osp.abspath(__file__)), 'data/forecast.json')
+        with open(json_file) as fp:
+            self.json_data = json.loads(fp.read())
+        self.forecast = Forecast(self.json_data, requests.Response())
+
+    def test_conversions_between_systems(self):
+        def convert(field, value, source, target):
+            for f, scale, offset, digits in units.conversions(source,
+                                                              target):
+                if f == field:
+                    return round(value * scale + offset, digits)
+            return value
+
+        self.assertEqual(convert('temperature', 100, 'si', 'us'), 212)
+        self.assertEqual(convert('temperature', 32, 'us', 'ca'), 0)
+        self.assertEqual(convert('windSpeed', 10, 'si', 'ca'), 36)
+        self.assertEqual(convert('windSpeed', 10, 'uk2', 'us'), 10)
+        self.assertEqual(convert('visibility', 10, 'us', 'si'), 16.09)
+        self.assertEqual(convert('precipIntensity', 1, 'us', 'si'), 25.4)
+        self.assertEqual(convert('precipAccumulation', 1, 'us', 'uk2'), 2.54)
+        self.assertEqual(convert('pressure', 1000, 'us', 'si'), 1000)
+        self.assertEqual(units.conversions('si', 'si'), [])
+
+    def test_unknown_system_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            units.conversions('si', 'auto')
+        with self.assertRaises(ValueError):
+            units.convert({}, 'si')
+
+    def test_forecast_convert(self):
+        us = self.forecast.convert('us')
+        self.assertEqual(us.units, 'us')
+        self.assertEqual(us.currently.temperature, 49.21)
+        self.assertEqual(us.currently.windSpeed, 9.1)
+        self.assertEqual(us.currently.humidity,
+                         self.forecast.currently.humidity)
+        self.assertEqual(len(us.hourly.data), len(self.forecast.hourly.data))
+        self.assertEqual(us.hourly.data[0].time,
+                         self.forecast.hourly.data[0].time)
+        # The original forecast is not modified.
+        self.assertEqual(self.json_data['currently']['temperature'], 9.56)
+        self.assertEqual(self.json_data['flags']['units'], 'si')
+
+    def test_forecast_convert_reuses_conversions(self):
+        self.assertIs(self.forecast.convert('si'), self.forecast)
+        self.assertIs(self.forecast.convert('us'),
+                      self.forecast.convert('us'))
+
+    def test_round_trip(self):
+        si = self.forecast.convert('us').convert('si')
+        for a, b in zip(si.hourly.data, self.forecast.hourly.data):
+            self.assertAlmostEqual(a.temperature, b.temperature, delta=0.01)
+
+    def test_block_convert(self):
+        block = self.forecast.hourly
+        self.assertEqual(block.units, 'si')
+        converted = block.convert('ca')
+        self.assertEqual(converted.units, 'ca')
+        self.assertEqual(converted.data[0].windSpeed,
+                         round(block.data[0].windSpeed * 3.6, 2))
+        self.assertEqual(block.resample(86400, temperature='max').units, 'si')
+
+
+if __name__ == '__main__':
+    unittest.main()
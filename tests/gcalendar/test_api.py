@@ -1,9 +1,14 @@
 import apiclient
+import httplib2
+import json
 import mock
 import os.path as osp
+import subprocess
+import sys
 import unittest
 
 from appletea import gcalendar
+from appletea.cache import ResponseCache
 from appletea.exceptions import HTTPError
 from appletea.gcalendar.models import GCalendarEvents
 from collections import OrderedDict as odict
@@ -108,6 +113,42 @@ class TestApi(unittest.TestCase):
                         request_execute_mock):
             gcalendar.get_events(self.credentials)
 
+    def test_get_events_sync_token_without_orderBy(self):
+        def request_execute_mock(request, **kwargs):
+            urlres = urllib.parse.urlparse(request.uri)
+            qs = urllib.parse.parse_qs(urlres.query)
+            self.assertDictEqual(qs, {u'alt': [u'json'],
+                                      u'syncToken': [u'abc']})
+            return {}
+
+        with mock.patch('apiclient.http.HttpRequest.execute',
+                        request_execute_mock):
+            gcalendar.get_events(self.credentials, syncToken='abc')
+
+    def test_watch_events_and_stop_channel(self):
+        requests = []
+
+        def request_execute_mock(request, **kwargs):
+            requests.append((request.uri, json.loads(request.body)))
+            return {'id': 'c1', 'resourceId': 'r1', 'expiration': '1000'}
+
+        with mock.patch('apiclient.http.HttpRequest.execute',
+                        request_execute_mock):
+            channel = gcalendar.watch_events(
+                self.credentials, 'https://example.com/n', id='c1',
+                token='secret', ttl=3600)
+            gcalendar.stop_channel(self.credentials, channel)
+
+        self.assertEqual(channel['resourceId'], 'r1')
+        self.assertTrue(requests[0][0].split('?')[0].endswith(
+            '/calendars/primary/events/watch'))
+        self.assertEqual(requests[0][1], {
+            'id': 'c1', 'type': 'web_hook', 'address': 'https://example.com/n',
+            'token': 'secret', 'params': {'ttl': '3600'}})
+        self.assertTrue(requests[1][0].split('?')[0].endswith(
+            '/channels/stop'))
+        self.assertEqual(requests[1][1], {'id': 'c1', 'resourceId': 'r1'})
+
     def test_get_events_calls_correct_url_with_orderBy(self):
         def request_execute_mock(request, **kwargs):
             urlres = urllib.parse.urlparse(request.uri)
@@ -139,3 +180,32 @@ class TestApi(unittest.TestCase):
             gcalendar.get_events(
                 self.credentials, maxAttendees=5, timeMax='2011-06-03T10:00:00Z',
                 timeMin='2011-06-03T10:00:00Z', singleEvents=True)
+
+    def test_import_does_not_load_google_api_client(self):
+        probe = ('import sys, appletea.gcalendar; '
+                 'print(\'googleapiclient\' in sys.modules or '
+                 '\'oauth2client\' in sys.modules)')
+        out = subprocess.check_output([sys.executable, '-c', probe])
+        self.assertEqual(out.strip(), b'False')
+
+    def test_get_events_revalidates_cached_events(self):
+        responses = [{'etag': '"1"'}, None]
+
+        def request_execute_mock(request, **kwargs):
+            body = responses.pop(0)
+            if body is None:
+                self.assertEqual(request.headers['If-None-Match'], '"1"')
+                resp = httplib2.Response({'status': 304})
+                raise apiclient.errors.HttpError(resp, b'')
+            request.postproc(httplib2.Response({'status': 200,
+                                                'etag': '"1"'}), b'{}')
+            return body
+
+        cache = ResponseCache()
+        with mock.patch('apiclient.http.HttpRequest.execute',
+                        request_execute_mock):
+            events1 = gcalendar.get_events(self.credentials, cache=cache)
+            events2 = gcalendar.get_events(self.credentials, cache=cache)
+
+        self.assertIs(events1, events2)
+        self.assertEqual(responses, [])
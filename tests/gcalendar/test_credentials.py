@@ -0,0 +1,118 @@
+import datetime
+import mock
+import os.path as osp
+import threading
+import time
+import unittest
+
+from appletea import gcalendar
+from appletea.gcalendar.credentials import CredentialManager, credentials_key
+from oauth2client.client import OAuth2Credentials
+
+# token_expiry of the test credentials: 2016-05-03T23:31:33Z
+EXPIRY = 1462318293
+
+
+class TestCredentialManager(unittest.TestCase):
+    def setUp(self):
+        with open(osp.join(osp.dirname(osp.abspath(__file__)),
+                           'data/application-default-credentials.json')) as fp:
+            self.credentials = fp.read()
+        self.now = EXPIRY - 3600
+        self.refreshes = []
+        self.persisted = []
+        self.manager = CredentialManager(
+            lead=300, persist=lambda *args: self.persisted.append(args),
+            http=lambda: None, clock=lambda: self.now)
+
+        def refresh(credentials, http):
+            self.refreshes.append(credentials)
+            time.sleep(0.05)
+            credentials.access_token = 'new-token'
+            credentials.token_expiry = datetime.datetime.utcfromtimestamp(
+                self.now + 3600)
+        patcher = mock.patch.object(OAuth2Credentials, 'refresh', refresh)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_parses_credentials_once(self):
+        credentials = self.manager.get(self.credentials)
+        self.assertIsInstance(credentials, OAuth2Credentials)
+        self.assertIs(self.manager.get(self.credentials), credentials)
+        self.assertIn(self.credentials, self.manager)
+        self.assertEqual(self.refreshes, [])
+
+    def test_refreshed_credentials_keep_their_key(self):
+        credentials = self.manager.get(self.credentials)
+        self.manager.refresh(self.credentials)
+        refreshed = credentials.to_json()
+        self.assertNotEqual(refreshed, self.credentials)
+        self.assertEqual(credentials_key(refreshed),
+                         credentials_key(self.credentials))
+        self.assertEqual(credentials_key(credentials),
+                         credentials_key(self.credentials))
+        self.assertIs(self.manager.get(refreshed), credentials)
+        self.assertEqual(len(self.manager), 1)
+
+    def test_get_refreshes_expiring_token(self):
+        self.now = EXPIRY - 60
+        credentials = self.manager.get(self.credentials)
+        self.assertEqual(credentials.access_token, 'new-token')
+        self.assertEqual(len(self.refreshes), 1)
+        key, json = self.persisted[0]
+        self.assertEqual(key, credentials_key(self.credentials))
+        self.assertIn('new-token', json)
+
+    def test_concurrent_gets_refresh_once(self):
+        self.now = EXPIRY - 60
+        threads = [threading.Thread(target=self.manager.get,
+                                    args=(self.credentials,))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.refreshes), 1)
+
+    def test_background_refresh_ahead_of_expiry(self):
+        self.manager.get(self.credentials)
+        self.now = EXPIRY - 200
+        with self.manager:
+            for _ in range(100):
+                if self.persisted:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(len(self.refreshes), 1)
+        self.assertIsNone(self.manager.error(self.credentials))
+
+    def test_failed_background_refresh_is_recorded(self):
+        error = ValueError('refresh failed')
+        self.manager.get(self.credentials)
+        self.now = EXPIRY - 200
+        with mock.patch.object(OAuth2Credentials, 'refresh',
+                               side_effect=error):
+            with self.manager:
+                for _ in range(100):
+                    if self.manager.error(self.credentials):
+                        break
+                    time.sleep(0.01)
+        self.assertIs(self.manager.error(self.credentials), error)
+
+    def test_remove_forgets_credentials(self):
+        self.manager.get(self.credentials)
+        self.manager.remove(self.credentials)
+        self.assertEqual(len(self.manager), 0)
+
+    def test_get_events_accepts_managed_credentials(self):
+        def request_execute_mock(request, **kwargs):
+            return {'items': []}
+
+        with mock.patch('apiclient.http.HttpRequest.execute',
+                        request_execute_mock):
+            events = gcalendar.get_events(
+                self.manager.get(self.credentials))
+        self.assertEqual(len(events.events), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -79,3 +79,48 @@ class TestModels(unittest.TestCase):
         self.gcal = GCalendarEvents(self.json_data)
         expected_str = '<GEventData instance: organizer>'
         self.assertEqual(str(self.gcal.events[0].organizer), expected_str)
+
+    def test_gcalendarevents_to_bytes_round_trip(self):
+        self.gcal = GCalendarEvents(self.json_data)
+        gcal = GCalendarEvents.from_bytes(self.gcal.to_bytes())
+        self.assertEqual(gcal.json, self.json_data)
+        self.assertEqual(len(gcal.events), len(self.items))
+
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self.old = GCalendarEvents({'items': [
+            {'id': 'a', 'etag': '"1"', 'summary': 'A'},
+            {'id': 'b', 'etag': '"1"', 'summary': 'B'},
+            {'id': 'c', 'etag': '"1"', 'summary': 'C'}]})
+        self.new = GCalendarEvents({'items': [
+            {'id': 'a', 'etag': '"1"', 'summary': 'A'},
+            {'id': 'b', 'etag': '"2"', 'summary': 'B2', 'location': 'Rome'},
+            {'id': 'c', 'etag': '"2"', 'status': 'cancelled'},
+            {'id': 'd', 'etag': '"1"', 'summary': 'D'}]})
+
+    def test_diff_events(self):
+        changes = self.new.diff(self.old)
+        self.assertEqual([e.id for e in changes.added], ['d'])
+        self.assertEqual(changes.removed, ['c'])
+        self.assertEqual([e.id for e in changes.modified], ['b'])
+        self.assertIsNone(changes.fields)
+
+    def test_diff_fields(self):
+        changes = self.new.diff(self.old, fields=True)
+        self.assertEqual(changes.fields, {'b': {'summary': ('B', 'B2'),
+                                                'location': (None, 'Rome')}})
+
+    def test_diff_snapshot(self):
+        snapshot = json.loads(json.dumps(self.old.snapshot()))
+        changes = self.new.diff(snapshot)
+        self.assertEqual([e.id for e in changes.added], ['d'])
+        self.assertEqual(changes.removed, ['c'])
+        self.assertEqual([e.id for e in changes.modified], ['b'])
+
+    def test_diff_without_etags_compares_events(self):
+        old = GCalendarEvents({'items': [{'id': 'a', 'summary': 'A'},
+                                         {'id': 'b', 'summary': 'B'}]})
+        new = GCalendarEvents({'items': [{'id': 'a', 'summary': 'A'},
+                                         {'id': 'b', 'summary': 'B2'}]})
+        self.assertEqual([e.id for e in new.diff(old).modified], ['b'])
@@ -0,0 +1,170 @@
+import datetime
+import unittest
+
+from appletea.gcalendar import recurrence
+from appletea.gcalendar.models import GCalendarEvents
+
+
+def _event(recurrence_, start='2016-01-04T10:00:00+01:00',
+           end='2016-01-04T11:00:00+01:00', time_zone='Europe/Brussels',
+           id='abc'):
+    return {'id': id, 'summary': 'Meeting', 'recurrence': recurrence_,
+            'start': {'dateTime': start, 'timeZone': time_zone},
+            'end': {'dateTime': end, 'timeZone': time_zone}}
+
+
+def _starts(event, time_min='2016-01-01T00:00:00Z',
+            time_max='2017-01-01T00:00:00Z', **kwargs):
+    return [i['start'].get('dateTime') or i['start']['date']
+            for i in recurrence.expand(event, time_min, time_max, **kwargs)]
+
+
+class TestExpand(unittest.TestCase):
+    def test_weekly_by_day_with_count(self):
+        event = _event(['RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=4'])
+        self.assertEqual(_starts(event), [
+            '2016-01-04T10:00:00+01:00', '2016-01-06T10:00:00+01:00',
+            '2016-01-11T10:00:00+01:00', '2016-01-13T10:00:00+01:00'])
+
+    def test_dtstart_outside_rule_counts_as_first_instance(self):
+        # 2016-01-04 is a Monday
+        event = _event(['RRULE:FREQ=WEEKLY;BYDAY=TU,TH;COUNT=3'])
+        self.assertEqual(_starts(event), [
+            '2016-01-04T10:00:00+01:00', '2016-01-05T10:00:00+01:00',
+            '2016-01-07T10:00:00+01:00'])
+
+    def test_last_start(self):
+        self.assertEqual(
+            recurrence.last_start(_event(['RRULE:FREQ=DAILY;COUNT=3'])),
+            datetime.datetime(2016, 1, 6, 9))
+        self.assertEqual(recurrence.last_start(
+            _event(['RRULE:FREQ=DAILY;UNTIL=20160110T090000Z'])),
+            datetime.datetime(2016, 1, 10, 9))
+        for rule in ['RRULE:FREQ=WEEKLY',
+                     'RRULE:FREQ=MONTHLY;BYMONTHDAY=30;BYMONTH=2;COUNT=2']:
+            self.assertIsNone(recurrence.last_start(_event([rule])))
+
+    def test_instances_keep_wall_clock_time_across_dst(self):
+        event = _event(['RRULE:FREQ=WEEKLY;COUNT=2'],
+                       start='2016-03-21T10:00:00+01:00',
+                       end='2016-03-21T11:00:00+01:00')
+        self.assertEqual(_starts(event), ['2016-03-21T10:00:00+01:00',
+                                          '2016-03-28T10:00:00+02:00'])
+
+    def test_monthly_last_friday(self):
+        event = _event(['RRULE:FREQ=MONTHLY;BYDAY=-1FR;COUNT=3'],
+                       start='2016-01-29T10:00:00+01:00',
+                       end='2016-01-29T11:00:00+01:00')
+        self.assertEqual([s[:10] for s in _starts(event)],
+                         ['2016-01-29', '2016-02-26', '2016-03-25'])
+
+    def test_monthly_skips_months_without_day(self):
+        event = _event(['RRULE:FREQ=MONTHLY;COUNT=3'],
+                       start='2016-01-31T10:00:00+01:00',
+                       end='2016-01-31T11:00:00+01:00')
+        self.assertEqual([s[:10] for s in _starts(event)],
+                         ['2016-01-31', '2016-03-31', '2016-05-31'])
+
+    def test_yearly_on_leap_day(self):
+        event = _event(['RRULE:FREQ=YEARLY;COUNT=2'],
+                       start='2016-02-29T10:00:00+01:00',
+                       end='2016-02-29T11:00:00+01:00')
+        self.assertEqual(
+            [s[:10] for s in _starts(event, time_max='2025-01-01T00:00:00Z')],
+            ['2016-02-29', '2020-02-29'])
+
+    def test_until_is_inclusive(self):
+        event = _event(['RRULE:FREQ=DAILY;UNTIL=20160106T090000Z'])
+        self.assertEqual(len(_starts(event)), 3)
+
+    def test_exdate_and_rdate(self):
+        event = _event([
+            'RRULE:FREQ=DAILY;COUNT=3',
+            'EXDATE;TZID=Europe/Brussels:20160105T100000',
+            'RDATE;TZID=Europe/Brussels:20160110T150000'])
+        self.assertEqual(_starts(event), [
+            '2016-01-04T10:00:00+01:00', '2016-01-06T10:00:00+01:00',
+            '2016-01-10T15:00:00+01:00'])
+
+    def test_window_bounds(self):
+        event = _event(['RRULE:FREQ=DAILY'])
+        starts = _starts(event, time_min='2016-02-01T10:30:00+01:00',
+                         time_max='2016-02-03T10:00:00+01:00')
+        self.assertEqual(starts, ['2016-02-01T10:00:00+01:00',
+                                  '2016-02-02T10:00:00+01:00'])
+
+    def test_all_day_events(self):
+        event = {'id': 'abc', 'recurrence': ['RRULE:FREQ=DAILY;INTERVAL=2'],
+                 'start': {'date': '2016-01-01'},
+                 'end': {'date': '2016-01-02'}}
+        instances = list(recurrence.expand(
+            event, datetime.datetime(2016, 1, 1),
+            datetime.datetime(2016, 1, 6), 'Europe/Brussels'))
+        self.assertEqual([i['start'] for i in instances],
+                         [{'date': '2016-01-01'}, {'date': '2016-01-03'},
+                          {'date': '2016-01-05'}])
+        self.assertEqual(instances[1]['id'], 'abc_20160103')
+
+    def test_instance_resource(self):
+        event = _event(['RRULE:FREQ=DAILY'])
+        instance = next(recurrence.expand(
+            event, '2016-01-05T00:00:00Z', '2016-01-06T00:00:00Z'))
+        self.assertEqual(instance['id'], 'abc_20160105T090000Z')
+        self.assertEqual(instance['recurringEventId'], 'abc')
+        self.assertEqual(instance['originalStartTime'], instance['start'])
+        self.assertEqual(instance['end']['dateTime'],
+                         '2016-01-05T11:00:00+01:00')
+        self.assertNotIn('recurrence', instance)
+        self.assertEqual(instance['summary'], 'Meeting')
+
+    def test_unsupported_rule_raises_value_error(self):
+        for rule in ['RRULE:FREQ=HOURLY', 'RRULE:FREQ=MONTHLY;BYSETPOS=1']:
+            with self.assertRaises(ValueError):
+                _starts(_event([rule]))
+
+
+class TestInstances(unittest.TestCase):
+    def test_instances_apply_exceptions_in_start_order(self):
+        moved = {'id': 'abc_20160105T090000Z', 'recurringEventId': 'abc',
+                 'summary': 'Moved',
+                 'originalStartTime': {
+                     'dateTime': '2016-01-05T10:00:00+01:00'},
+                 'start': {'dateTime': '2016-01-07T08:00:00+01:00'},
+                 'end': {'dateTime': '2016-01-07T09:00:00+01:00'}}
+        cancelled = {'id': 'abc_20160106T090000Z', 'recurringEventId': 'abc',
+                     'status': 'cancelled',
+                     'originalStartTime': {
+                         'dateTime': '2016-01-06T10:00:00+01:00'}}
+        single = {'id': 'single', 'summary': 'Lunch',
+                  'start': {'dateTime': '2016-01-04T12:00:00+01:00'},
+                  'end': {'dateTime': '2016-01-04T13:00:00+01:00'}}
+        events = GCalendarEvents({
+            'timeZone': 'Europe/Brussels',
+            'items': [_event(['RRULE:FREQ=DAILY;COUNT=4']), single, moved,
+                      cancelled]})
+        ids = [e.id for e in events.instances('2016-01-01T00:00:00Z',
+                                              '2016-02-01T00:00:00Z')]
+        self.assertEqual(ids, ['abc_20160104T090000Z', 'single',
+                               'abc_20160105T090000Z',
+                               'abc_20160107T090000Z'])
+        self.assertEqual(
+            [e.summary for e in events.instances(
+                '2016-01-07T00:00:00Z', '2016-01-07T08:00:00Z')],
+            ['Moved'])
+
+    def test_instances_starting_at_the_same_time(self):
+        single = {'id': 'c',
+                  'start': {'dateTime': '2016-01-04T10:00:00+01:00'},
+                  'end': {'dateTime': '2016-01-04T11:00:00+01:00'}}
+        events = GCalendarEvents({'items': [
+            _event(['RRULE:FREQ=DAILY;COUNT=2'], id='a'),
+            _event(['RRULE:FREQ=DAILY;COUNT=2'], id='b'), single]})
+        ids = [e.id for e in events.instances('2016-01-01T00:00:00Z',
+                                              '2016-02-01T00:00:00Z')]
+        self.assertEqual(ids, ['a_20160104T090000Z', 'b_20160104T090000Z',
+                               'c', 'a_20160105T090000Z',
+                               'b_20160105T090000Z'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import json
+import os.path as osp
+import unittest
+
+from appletea.gcalendar.models import GCalendarEvents, GEventData
+from appletea.gcalendar.store import EventStore
+
+
+def _event(id, start, end, **kwargs):
+    event = {'id': id, 'etag': '"1"', 'status': 'confirmed',
+             'organizer': {'email': 'john.doe@gmail.com'},
+             'start': {'dateTime': start}, 'end': {'dateTime': end}}
+    event.update(kwargs)
+    return event
+
+
+class TestEventStore(unittest.TestCase):
+    def setUp(self):
+        self.items = [
+            _event('a', '2016-01-04T10:00:00+01:00',
+                   '2016-01-04T11:00:00+01:00', summary='A'),
+            _event('b', '2016-01-05T10:00:00+01:00',
+                   '2016-01-05T11:00:00+01:00', summary='B',
+                   recurrence=['RRULE:FREQ=DAILY;COUNT=3']),
+            _event('b_20160106T090000Z', '2016-01-06T10:00:00+01:00',
+                   '2016-01-06T11:00:00+01:00', status='cancelled',
+                   recurringEventId='b',
+                   originalStartTime={
+                       'dateTime': '2016-01-06T10:00:00+01:00'}),
+        ]
+        self.store = EventStore(GCalendarEvents(
+            {'timeZone': 'Europe/Brussels', 'items': self.items}))
+
+    def test_store_holds_columns(self):
+        self.assertEqual(self.store.time_zone, 'Europe/Brussels')
+        self.assertEqual(self.store.ids, ['a', 'b', 'b_20160106T090000Z'])
+        self.assertEqual(self.store.starts[0], 1451898000)
+        self.assertEqual(self.store.ends[0] - self.store.starts[0], 3600)
+        self.assertEqual(self.store.status('a'), 'confirmed')
+        self.assertEqual(self.store.organizer('a'), 'john.doe@gmail.com')
+
+    def test_get_decodes_event(self):
+        event = self.store.get('a')
+        self.assertIsInstance(event, GEventData)
+        self.assertEqual(event.d, self.items[0])
+        with self.assertRaises(KeyError):
+            self.store.get('z')
+
+    def test_iteration_skips_cancelled_events(self):
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual([e.id for e in self.store], ['a', 'b'])
+        self.assertIn('b_20160106T090000Z', self.store)
+
+    def test_update_replaces_event(self):
+        self.store.update([_event('a', '2016-02-01T10:00:00+01:00',
+                                  '2016-02-01T12:00:00+01:00',
+                                  status='cancelled')])
+        self.assertEqual(len(self.store.ids), 3)
+        self.assertEqual(self.store.status('a'), 'cancelled')
+        self.assertEqual(len(self.store), 1)
+
+    def test_instances(self):
+        instances = self.store.instances('2016-01-01T00:00:00Z',
+                                         '2016-02-01T00:00:00Z')
+        self.assertEqual([e.id for e in instances],
+                         ['a', 'b_20160105T090000Z', 'b_20160107T090000Z'])
+        instances = self.store.instances('2016-01-05T00:00:00Z',
+                                         '2016-01-06T00:00:00Z')
+        self.assertEqual([e.id for e in instances], ['b_20160105T090000Z'])
+
+    def test_instances_match_calendar_events(self):
+        items = self.items + [
+            _event('long', '2015-12-01T10:00:00+01:00',
+                   '2016-03-01T10:00:00+01:00'),
+            _event('ended', '2015-12-01T10:00:00+01:00',
+                   '2015-12-01T11:00:00+01:00',
+                   recurrence=['RRULE:FREQ=DAILY;UNTIL=20151210']),
+            _event('moved', '2016-01-20T10:00:00+01:00',
+                   '2016-01-20T11:00:00+01:00', recurringEventId='ended',
+                   originalStartTime={
+                       'dateTime': '2015-12-05T10:00:00+01:00'}),
+        ] + [_event('s%d' % i, '2016-01-%02dT08:00:00+01:00' % i,
+                    '2016-01-%02dT09:00:00+01:00' % i)
+             for i in range(1, 29)]
+        store = EventStore(items, time_zone='Europe/Brussels')
+        events = GCalendarEvents(
+            {'timeZone': 'Europe/Brussels', 'items': items})
+        for time_min, time_max in [
+                ('2015-12-05T00:00:00Z', '2015-12-06T00:00:00Z'),
+                ('2016-01-05T00:00:00Z', '2016-01-06T00:00:00Z'),
+                ('2016-01-20T09:30:00Z', '2016-01-21T00:00:00Z'),
+                ('2016-02-01T00:00:00Z', '2016-04-01T00:00:00Z')]:
+            self.assertEqual(
+                [e.id for e in store.instances(time_min, time_max)],
+                [e.id for e in events.instances(time_min, time_max)])
+
+    def test_update_rewrites_replaced_events(self):
+        for i in range(5):
+            self.store.update([dict(item, summary=str(i))
+                               for item in self.items])
+        self.assertLessEqual(len(self.store._blocks), 2)
+        self.assertEqual(self.store.get('b').summary, '4')
+
+    def test_diff(self):
+        other = EventStore([
+            self.items[0],
+            dict(self.items[1], etag='"2"', summary='B2'),
+            _event('c', '2016-01-04T10:00:00+01:00',
+                   '2016-01-04T11:00:00+01:00')])
+        changes = other.diff(self.store, fields=True)
+        self.assertEqual([e.id for e in changes.added], ['c'])
+        self.assertEqual(changes.removed, [])
+        self.assertEqual([e.id for e in changes.modified], ['b'])
+        self.assertEqual(changes.fields['b']['summary'], ('B', 'B2'))
+        self.assertEqual(other.diff(self.store.snapshot()).removed, [])
+
+    def test_store_of_calendar_events_data(self):
+        json_file = osp.join(osp.dirname(osp.abspath(__file__)),
+                             'data/calendar-events.json')
+        with open(json_file) as fp:
+            events = GCalendarEvents(json.load(fp))
+        store = EventStore(events)
+        self.assertEqual(store.snapshot(), events.snapshot())
+
+
+if __name__ == '__main__':
+    unittest.main()
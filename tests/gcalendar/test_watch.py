@@ -0,0 +1,183 @@
+import httplib2
+import mock
+import threading
+import time
+import unittest
+
+from apiclient.errors import HttpError
+
+from appletea.gcalendar.models import GCalendarEvents
+from appletea.gcalendar.watch import WatchManager, fetch_events, notify
+
+
+class _Calendar(object):
+    # Stand-in for the events and channels of the Calendar API.
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self.version = 0
+        self.changes = {}
+        self.channels = []
+        self.stopped = []
+        self.requests = []
+        self.expired = False
+
+    def change(self, item):
+        self.version += 1
+        self.changes[item['id']] = (self.version, item)
+
+    def get_events(self, credentials, calendarId, **kwargs):
+        self.requests.append(kwargs)
+        token = kwargs.get('syncToken')
+        if token is not None and self.expired:
+            self.expired = False
+            raise HttpError(httplib2.Response({'status': 410}), b'')
+        since = int(token or 0)
+        items = [item for version, item in sorted(self.changes.values(),
+                                                  key=lambda c: c[0])
+                 if version > since]
+        # One event per page.
+        start = int(kwargs.get('pageToken', 0))
+        json = {'items': items[start:start + 1]}
+        if start + 1 < len(items):
+            json['nextPageToken'] = str(start + 1)
+        else:
+            json['nextSyncToken'] = str(self.version)
+        return GCalendarEvents(json)
+
+    def watch_events(self, credentials, address, calendarId, token=None,
+                     ttl=None):
+        channel = {'id': 'channel-%d' % len(self.channels),
+                   'resourceId': 'resource', 'token': token,
+                   'expiration': str(int((time.time() + self.ttl) * 1000))}
+        self.channels.append(channel)
+        return dict(channel)
+
+    def stop_channel(self, credentials, channel):
+        self.stopped.append(channel['id'])
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.calendar = _Calendar()
+        self.calendar.change({'id': 'a', 'status': 'confirmed'})
+        self.calendar.change({'id': 'b', 'status': 'confirmed'})
+        for name in ('get_events', 'watch_events', 'stop_channel'):
+            patcher = mock.patch('appletea.gcalendar.api.%s' % name,
+                                 getattr(self.calendar, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.fetched = []
+        self.event = threading.Event()
+
+    def callback(self, watch, events):
+        self.fetched.append([e.id for e in events.events])
+        self.event.set()
+
+    def manager(self, **kwargs):
+        manager = WatchManager('https://example.com/notify',
+                               listen=('127.0.0.1', 0), **kwargs)
+        manager.start()
+        self.addCleanup(manager.stop)
+        return manager
+
+    def wait(self, n):
+        deadline = time.time() + 5
+        while len(self.fetched) < n and time.time() < deadline:
+            self.event.wait(0.05)
+            self.event.clear()
+        self.assertEqual(len(self.fetched), n)
+
+    def test_fetch_events_follows_pages(self):
+        events = fetch_events('credentials')
+        self.assertEqual([e.id for e in events.events], ['a', 'b'])
+        self.assertEqual(events.json['nextSyncToken'], '2')
+        self.calendar.change({'id': 'a', 'status': 'cancelled'})
+        events = fetch_events('credentials', sync_token='2')
+        self.assertEqual([e.status for e in events.events], ['cancelled'])
+
+    def test_notification_fetches_changes(self):
+        manager = self.manager()
+        watch = manager.register('credentials', callback=self.callback)
+        self.assertEqual(self.fetched, [['a', 'b']])
+        channel = watch.channel
+
+        self.assertEqual(notify(manager.url, channel, state='sync'), 200)
+        self.calendar.change({'id': 'c', 'status': 'confirmed'})
+        self.assertEqual(notify(manager.url, channel, number=2), 200)
+        self.wait(2)
+        self.assertEqual(self.fetched[1], ['c'])
+        self.assertEqual(self.calendar.requests[-1], {'syncToken': '2'})
+        self.assertEqual(watch.sync_token, '3')
+
+    def test_notifications_are_verified(self):
+        manager = self.manager()
+        watch = manager.register('credentials')
+        channel = dict(watch.channel, token='forged')
+        self.assertEqual(notify(manager.url, channel), 403)
+        self.assertEqual(notify(manager.url, dict(channel, id='other')), 404)
+        self.assertEqual(manager.handle({}), 404)
+
+    def test_expired_sync_token_fetches_all_events(self):
+        manager = self.manager()
+        watch = manager.register('credentials', callback=self.callback)
+        self.calendar.expired = True
+        manager.handle({'X-Goog-Channel-ID': watch.channel['id'],
+                        'X-Goog-Channel-Token': watch.token,
+                        'X-Goog-Resource-State': 'exists'})
+        self.wait(2)
+        self.assertEqual(self.fetched[1], ['a', 'b'])
+
+    def test_channels_are_renewed_before_expiry(self):
+        self.calendar.ttl = 1
+        manager = self.manager(lead=0.9)
+        watch = manager.register('credentials', callback=self.callback)
+        self.wait(2)
+        self.assertEqual(watch.channel['id'], 'channel-1')
+        self.assertIn('channel-0', self.calendar.stopped)
+        self.assertEqual(notify(manager.url, self.calendar.channels[0]), 404)
+
+    def test_stop_closes_channels(self):
+        manager = self.manager()
+        manager.register('credentials')
+        manager.register('credentials', calendarId='other')
+        self.assertEqual(len(manager), 2)
+        manager.stop()
+        self.assertEqual(sorted(self.calendar.stopped),
+                         ['channel-0', 'channel-1'])
+        self.assertEqual(len(manager), 0)
+
+    def test_channel_opened_while_unregistering_is_closed(self):
+        self.calendar.ttl = 1
+        manager = self.manager(lead=0.9)
+        watch = manager.register('credentials')
+        watch_events = self.calendar.watch_events
+
+        def unregister_and_watch(*args, **kwargs):
+            manager.unregister(watch)
+            return watch_events(*args, **kwargs)
+        with mock.patch('appletea.gcalendar.api.watch_events',
+                        unregister_and_watch):
+            deadline = time.time() + 5
+            while len(self.calendar.stopped) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(sorted(self.calendar.stopped),
+                         ['channel-0', 'channel-1'])
+        self.assertIsNone(watch.channel)
+        self.assertEqual(notify(manager.url, self.calendar.channels[1]), 404)
+
+    def test_restart_after_stop_without_start(self):
+        manager = WatchManager('https://example.com/notify', concurrency=1)
+        manager.stop()
+        manager.start()
+        self.addCleanup(manager.stop)
+        watch = manager.register('credentials', callback=self.callback)
+        self.calendar.change({'id': 'c', 'status': 'confirmed'})
+        manager.handle({'X-Goog-Channel-ID': watch.channel['id'],
+                        'X-Goog-Channel-Token': watch.token,
+                        'X-Goog-Resource-State': 'exists'})
+        self.wait(2)
+        self.assertEqual(self.fetched[1], ['c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ import requests_mock
 import unittest
 
 from appletea import ipinfo
+from appletea.cache import ResponseCache
 from appletea.ipinfo.models import IpInfo
 
 
@@ -97,3 +98,15 @@ class TestApi(unittest.TestCase):
         r = ipinfo.get_ipinfo(param='region')
 
         self.assertIsInstance(r, IpInfo)
+
+    @requests_mock.Mocker()
+    def test_get_ipinfo_revalidates_cached_object(self, mock):
+        mock.get(requests_mock.ANY, [
+            {'json': {'ip': '8.8.8.8'}, 'headers': {'ETag': 'W/"1"'}},
+            {'status_code': 304}])
+        cache = ResponseCache()
+        r1 = ipinfo.get_ipinfo(ip='8.8.8.8', cache=cache)
+        r2 = ipinfo.get_ipinfo(ip='8.8.8.8', cache=cache)
+
+        self.assertIs(r1, r2)
+        self.assertEqual(mock.last_request.headers['If-None-Match'], 'W/"1"')
@@ -34,6 +34,11 @@ class TestModels(unittest.TestCase):
         self.assertEquals(lat, expected_lat)
         self.assertEquals(lng, expected_lng)
 
+    def test_get_ipinfo_coordinates(self):
+        expected_lat, expected_lng = self.json_data['loc'].split(',')
+        self.assertEqual(self.ipinfo.coordinates,
+                         (float(expected_lat), float(expected_lng)))
+
     def test_get_ipinfo_org(self):
         self.assertEquals(self.ipinfo.org, self.json_data['org'])
 
@@ -51,3 +56,8 @@ class TestModels(unittest.TestCase):
         ip = self.json_data['ip']
         expected_str = '<IpInfo instance: %s>' % ip
         self.assertEqual(str(self.ipinfo), expected_str)
+
+    def test_get_ipinfo_to_bytes_round_trip(self):
+        ipinfo = IpInfo.from_bytes(self.ipinfo.to_bytes())
+        self.assertEqual(ipinfo.json, self.json_data)
+        self.assertEqual(ipinfo.loc, self.ipinfo.loc)
@@ -0,0 +1,68 @@
+import mock
+import unittest
+
+from appletea.cache import ResponseCache, cache_control
+
+
+class TestCacheControl(unittest.TestCase):
+    def test_cache_control_max_age(self):
+        self.assertEqual(cache_control({'Cache-Control': 'max-age=60'}),
+                         (True, 60))
+
+    def test_cache_control_max_age_corrected_for_age(self):
+        headers = {'Cache-Control': 'public, max-age=60', 'Age': '15'}
+        self.assertEqual(cache_control(headers), (True, 45))
+
+    def test_cache_control_no_cache(self):
+        self.assertEqual(cache_control({'Cache-Control': 'no-cache'}),
+                         (True, 0))
+
+    def test_cache_control_no_store(self):
+        self.assertEqual(cache_control({'Cache-Control': 'no-store'}),
+                         (False, None))
+
+    def test_cache_control_missing(self):
+        self.assertEqual(cache_control({}), (True, None))
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_update_stores_validators(self):
+        cache = ResponseCache()
+        entry = cache.update('k', 'v', {'ETag': '"1"',
+                                        'Last-Modified': 'yesterday'})
+        self.assertIs(cache.get('k'), entry)
+        self.assertEqual(entry.validators, {'If-None-Match': '"1"',
+                                            'If-Modified-Since': 'yesterday'})
+
+    def test_update_uses_max_age_over_default_ttl(self):
+        cache = ResponseCache(ttl=3600)
+        with mock.patch('time.time', return_value=1000):
+            self.assertEqual(cache.update('a', 'v', {}).expires, 4600)
+            entry = cache.update('b', 'v', {'Cache-Control': 'max-age=60'})
+            self.assertEqual(entry.expires, 1060)
+            self.assertTrue(entry.fresh)
+        with mock.patch('time.time', return_value=1060):
+            self.assertFalse(entry.fresh)
+
+    def test_update_does_not_store_no_store_responses(self):
+        cache = ResponseCache()
+        self.assertIsNone(cache.update('k', 'v', {'Cache-Control': 'no-store'}))
+        self.assertNotIn('k', cache)
+
+    def test_revalidated_extends_lifetime(self):
+        cache = ResponseCache()
+        entry = cache.update('k', 'v', {'ETag': '"1"'})
+        with mock.patch('time.time', return_value=1000):
+            cache.revalidated(entry, {'Cache-Control': 'max-age=10'})
+        self.assertEqual(entry.expires, 1010)
+        self.assertEqual(entry.etag, '"1"')
+
+    def test_maxsize_evicts_least_recently_used(self):
+        cache = ResponseCache(maxsize=2)
+        cache.update('a', 1, {})
+        cache.update('b', 2, {})
+        cache.get('a')
+        cache.update('c', 3, {})
+        self.assertEqual(len(cache), 2)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
@@ -0,0 +1,44 @@
+import requests
+import unittest
+
+from appletea import client
+
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.decoder = client.decoder
+
+    def tearDown(self):
+        client.set_decoder(self.decoder)
+
+    def test_loads_decodes_bytes(self):
+        self.assertEqual(client.loads(b'{"a": [1, 2.5, "x"]}'),
+                         {'a': [1, 2.5, 'x']})
+
+    def test_loads_decodes_text(self):
+        self.assertEqual(client.loads(u'{"a": "é"}'), {'a': u'é'})
+
+    def test_loads_with_stdlib_decoder(self):
+        client.set_decoder('json')
+        self.assertEqual(client.decoder, 'json')
+        self.assertEqual(client.loads(b'{"a": 1}'), {'a': 1})
+
+    def test_loads_raises_value_error_for_invalid_json(self):
+        for name in ['json', None]:
+            client.set_decoder(name)
+            with self.assertRaises(ValueError):
+                client.loads(b'{"a":')
+
+    def test_set_decoder_picks_an_installed_decoder(self):
+        client.set_decoder()
+        self.assertIn(client.decoder, [n for n, _ in client.DECODERS])
+
+    def test_set_decoder_raises_for_unknown_decoder(self):
+        with self.assertRaises(ValueError):
+            client.set_decoder('yaml')
+
+    def test_decode_reads_response_content(self):
+        response = requests.Response()
+        response._content = b'{"currently": {"time": 1461865912}}'
+        self.assertEqual(client.decode(response),
+                         {'currently': {'time': 1461865912}})
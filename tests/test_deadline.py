@@ -0,0 +1,68 @@
+import threading
+import unittest
+
+from appletea import deadline
+from appletea.deadline import Deadline
+from appletea.exceptions import DeadlineExceeded
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeadline(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+
+    def test_remaining_and_timeout(self):
+        d = Deadline(2, clock=self.clock)
+        self.assertEqual(d.remaining(), 2)
+        self.assertEqual(d.timeout(5), 2)
+        self.assertEqual(d.timeout(1), 1)
+        self.assertEqual(d.timeout(), 2)
+        self.clock.now += 3
+        self.assertTrue(d.expired)
+        self.assertRaises(DeadlineExceeded, d.timeout, 5)
+
+    def test_without_deadline(self):
+        d = Deadline()
+        self.assertIsNone(d.remaining())
+        self.assertEqual(d.timeout(5), 5)
+        self.assertFalse(d.expired)
+
+    def test_cancel_runs_callbacks_and_cancels_children(self):
+        d = Deadline(10, clock=self.clock)
+        child = d.child(20)
+        self.assertEqual(child.remaining(), 10)
+        called = []
+        d.add_callback(lambda: called.append(1))
+        d.cancel()
+        d.cancel()
+        self.assertEqual(called, [1])
+        self.assertTrue(child.cancelled)
+        with self.assertRaises(DeadlineExceeded):
+            child.check()
+        d.add_callback(lambda: called.append(2))
+        self.assertEqual(called, [1, 2])
+
+    def test_current_is_per_thread(self):
+        self.assertIsNone(deadline.current())
+        seen = []
+        with Deadline(2, clock=self.clock) as d:
+            self.assertIs(deadline.current(), d)
+            self.assertEqual(deadline.timeout(5), 2)
+            thread = threading.Thread(
+                target=lambda: seen.append(deadline.current()))
+            thread.start()
+            thread.join()
+        self.assertEqual(seen, [None])
+        self.assertIsNone(deadline.current())
+        self.assertEqual(deadline.timeout(5), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import re
+import requests
+import requests_mock
+import threading
+import unittest
+
+from appletea.deadline import Deadline
+from appletea.exceptions import DeadlineExceeded
+from appletea.forecastio import api as forecastio
+from appletea.pipeline import get_weather
+from appletea.transport import RequestsTransport
+
+
+LOCATIONS = {
+    '1.1.1.1': '51.0364,3.6998',
+    '2.2.2.2': '51.0364,3.6998',
+    '3.3.3.3': '50.8503,4.3517',
+}
+
+
+def _ipinfo(request, context):
+    ip = request.path.split('/')[1]
+    if ip not in LOCATIONS:
+        context.status_code = 404
+        return {}
+    return {'ip': ip, 'loc': LOCATIONS[ip]}
+
+
+def _forecast(request, context):
+    latitude, longitude = request.path.rsplit('/', 1)[1].split(',')
+    return {'latitude': float(latitude), 'longitude': float(longitude)}
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.mock = requests_mock.Mocker()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        self.mock.get(re.compile('ipinfo.io'), json=_ipinfo)
+        self.mock.get(re.compile('forecast.io'), json=_forecast)
+
+    def requests(self, host):
+        return [r for r in self.mock.request_history if r.netloc == host]
+
+    def test_get_weather_returns_forecast_per_ip(self):
+        results = dict((r.ip, r) for r in get_weather('key', LOCATIONS))
+        self.assertEqual(sorted(results), sorted(LOCATIONS))
+        for ip, result in results.items():
+            self.assertIsNone(result.error)
+            self.assertEqual(result.ipinfo.ip, ip)
+            self.assertEqual(
+                (result.forecast.json['latitude'],
+                 result.forecast.json['longitude']),
+                result.ipinfo.coordinates)
+
+    def test_get_weather_dedupes_ips_and_locations(self):
+        ips = ['1.1.1.1', '2.2.2.2', '1.1.1.1', '3.3.3.3']
+        results = list(get_weather('key', ips, concurrency=2))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(self.requests('ipinfo.io')), 3)
+        self.assertEqual(len(self.requests('api.forecast.io')), 2)
+
+    def test_get_weather_reports_failed_ip_lookup(self):
+        results = list(get_weather('key', ['9.9.9.9', '3.3.3.3']))
+        errors = [r for r in results if r.error is not None]
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0].ip, '9.9.9.9')
+        self.assertIsInstance(errors[0].error, requests.HTTPError)
+        self.assertIsNone(errors[0].forecast)
+
+    def test_get_weather_passes_kwargs_to_get_forecast(self):
+        list(get_weather('key', ['3.3.3.3'], units='si'))
+        request = self.requests('api.forecast.io')[0]
+        self.assertEqual(request.qs['units'], ['si'])
+
+    def test_get_weather_with_expired_deadline(self):
+        d = Deadline(0)
+        results = list(get_weather('key', ['1.1.1.1', '3.3.3.3'],
+                                   deadline=d))
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertIsInstance(result.error, DeadlineExceeded)
+            self.assertIsNone(result.forecast)
+        self.assertEqual(self.mock.call_count, 0)
+
+    def test_get_weather_cancelled_yields_partial_results(self):
+        sent, release, done = [threading.Event() for _ in range(3)]
+        self.addCleanup(done.wait, 5)
+        self.addCleanup(release.set)
+
+        class Transport(RequestsTransport):
+            def get(self, url, **kwargs):
+                # Outside of requests_mock, which sends one at a time.
+                if not url.endswith('50.8503,4.3517'):
+                    return RequestsTransport.get(self, url, **kwargs)
+                sent.set()
+                release.wait(5)
+                try:
+                    return RequestsTransport.get(self, url, **kwargs)
+                finally:
+                    done.set()
+        forecastio.TRANSPORT = Transport()
+        self.addCleanup(setattr, forecastio, 'TRANSPORT', None)
+
+        d = Deadline()
+        results = get_weather('key', ['1.1.1.1', '3.3.3.3'], deadline=d)
+        first = next(results)
+        self.assertEqual(first.ip, '1.1.1.1')
+        self.assertIsNone(first.error)
+        sent.wait(5)
+        d.cancel()
+        second = next(results)
+        self.assertEqual(second.ip, '3.3.3.3')
+        self.assertIsInstance(second.error, DeadlineExceeded)
+        self.assertEqual(second.ipinfo.ip, '3.3.3.3')
+        self.assertEqual(list(results), [])
+
+    def test_get_weather_without_ips(self):
+        self.assertEqual(list(get_weather('key', [])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from appletea import serialization
+from appletea.exceptions import SerializationError
+
+
+class TestSerialization(unittest.TestCase):
+    def test_pack_columns_round_trip(self):
+        rows = [{'time': 1, 'temperature': 9.5, 'icon': 'rain'},
+                {'time': 2, 'windBearing': 245, 'icon': 'rain'},
+                {'time': 3, 'temperature': 10, 'flag': True},
+                {'time': 4, 'nested': {'a': [1]}, 'flag': None}]
+        packed = serialization.pack_columns(rows)
+        self.assertEqual(serialization.unpack_columns(packed), rows)
+
+    def test_pack_columns_packs_numbers_and_strings(self):
+        rows = [{'time': 1, 'temperature': 9.5, 'icon': 'rain'},
+                {'time': 2, 'temperature': 8.0, 'icon': 'rain'}]
+        columns = serialization.pack_columns(rows)['columns']
+        self.assertEqual(columns['time'][0], 'q')
+        self.assertEqual(columns['temperature'][0], 'd')
+        self.assertEqual(columns['icon'][:2], ['s', ['rain']])
+
+    def test_pack_columns_keeps_integers_with_gaps(self):
+        rows = [{'windBearing': 245}, {}, {'windBearing': 12}]
+        packed = serialization.pack_columns(rows)
+        self.assertEqual(packed['columns']['windBearing'][0], 'j')
+        result = serialization.unpack_columns(packed)
+        self.assertEqual(result, rows)
+        self.assertIsInstance(result[0]['windBearing'], int)
+
+    def test_pack_columns_keeps_large_integers_with_gaps(self):
+        rows = [{'id': 2 ** 53 + 1}, {}, {'id': -2 ** 62 - 1}]
+        packed = serialization.pack_columns(rows)
+        self.assertEqual(serialization.unpack_columns(packed), rows)
+
+    def test_pack_columns_keeps_types_of_mixed_numbers(self):
+        rows = [{'pressure': 1013}, {'pressure': 1012.5}, {},
+                {'pressure': 2 ** 60 + 1}]
+        packed = serialization.pack_columns(rows)
+        self.assertEqual(packed['columns']['pressure'][0], 'n')
+        result = serialization.unpack_columns(packed)
+        self.assertEqual(result, rows)
+        self.assertEqual([type(r.get('pressure')) for r in result],
+                         [int, float, type(None), int])
+
+    def test_loads_round_trip(self):
+        data = serialization.dumps(serialization.IPINFO, {'ip': '8.8.8.8'})
+        self.assertEqual(data[:2], serialization.MAGIC)
+        self.assertEqual(serialization.loads(serialization.IPINFO, data),
+                         {'ip': '8.8.8.8'})
+
+    def test_loads_raises_for_other_kind(self):
+        data = serialization.dumps(serialization.IPINFO, {})
+        with self.assertRaises(SerializationError):
+            serialization.loads(serialization.FORECAST, data)
+
+    def test_loads_raises_for_unsupported_version(self):
+        data = serialization.dumps(serialization.IPINFO, {})
+        data = data[:2] + b'\xff' + data[3:]
+        with self.assertRaises(SerializationError) as e_cm:
+            serialization.loads(serialization.IPINFO, data)
+        self.assertEqual(str(e_cm.exception),
+                         'Unsupported format version 255')
+
+    def test_loads_raises_for_garbage(self):
+        for data in [b'', b'{"ip": "8.8.8.8"}']:
+            with self.assertRaises(SerializationError):
+                serialization.loads(serialization.IPINFO, data)
@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import requests_mock
+import unittest
+
+try:
+    from http.client import HTTPConnection
+except ImportError:  # Python 2
+    from httplib import HTTPConnection
+
+from appletea.forecastio import api as forecastio
+from appletea.ipinfo import api as ipinfo
+from appletea.server import Server
+
+
+class _UnixConnection(HTTPConnection):
+    def __init__(self, path):
+        HTTPConnection.__init__(self, 'localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def _request(connection, method, path, body=None):
+    headers = {}
+    if body is not None:
+        body = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    connection.request(method, path, body, headers)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read().decode('utf-8'))
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), key='secret', ttl=60)
+        self.mock = requests_mock.Mocker()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        self.forecast = self.mock.get(
+            requests_mock.ANY, json={'currently': {'temperature': 10}})
+
+    def test_forecast_is_cached(self):
+        for _ in range(2):
+            status, body = self.server.handle('GET', '/forecast/1,2?units=si')
+            self.assertEqual(status, 200)
+            self.assertEqual(body, {'currently': {'temperature': 10}})
+        self.assertEqual(self.forecast.call_count, 1)
+        request = self.forecast.last_request
+        self.assertTrue(request.path.endswith('/secret/1,2'))
+        self.assertEqual(request.qs, {'units': ['si']})
+
+    def test_forecast_rejects_other_query_parameters(self):
+        for query in ('profile=p', 'deadline=5', 'time=0', 'cache=1'):
+            status, body = self.server.handle('GET', '/forecast/1,2?' + query)
+            self.assertEqual(status, 400)
+            self.assertIn(query.split('=')[0], body['error'])
+        self.assertEqual(self.forecast.call_count, 0)
+
+    def test_events_rejects_other_parameters(self):
+        for query, params in [('', {'cache': 1}), ('?deadline=5', {}),
+                              ('?calendarId=c', {'profile': 'p'})]:
+            status, body = self.server.handle(
+                'POST', '/events' + query, json.dumps(
+                    dict(params, credentials='{}')).encode('utf-8'))
+            self.assertEqual(status, 400)
+            self.assertIn('Unknown parameters', body['error'])
+        status, body = self.server.handle('POST', '/events', b'[]')
+        self.assertEqual(status, 400)
+
+    def test_forecast_key_in_path(self):
+        self.server.handle('GET', '/forecast/other/1,2')
+        self.assertTrue(self.forecast.last_request.path.endswith('/other/1,2'))
+        self.server.handle('GET', '/forecast/1,2,1433116800')
+        self.assertTrue(self.forecast.last_request.path.endswith(
+            '/secret/1,2,1433116800'))
+
+    def test_errors(self):
+        self.assertEqual(self.server.handle('GET', '/nope')[0], 404)
+        self.assertEqual(self.server.handle('POST', '/forecast/1,2', b'')[0],
+                         405)
+        self.assertEqual(Server().handle('GET', '/forecast/1,2')[0], 400)
+        self.assertEqual(self.server.handle('POST', '/events', b'{}')[0], 400)
+
+        self.mock.get(requests_mock.ANY, status_code=403, json={})
+        status, body = self.server.handle('GET', '/forecast/3,4')
+        self.assertEqual(status, 403)
+        self.assertIn('error', body)
+
+    def test_batch(self):
+        self.mock.get('http://ipinfo.io/8.8.8.8/json', json={'ip': '8.8.8.8'})
+        status, body = self.server.handle(
+            'POST', '/batch', json.dumps(
+                ['/forecast/1,2', '/ipinfo/8.8.8.8/json', '/batch',
+                 {'path': '/events', 'body': {}}]).encode('utf-8'))
+        self.assertEqual(status, 200)
+        self.assertEqual([r['status'] for r in body], [200, 200, 400, 400])
+        self.assertEqual(body[1]['body'], {'ip': '8.8.8.8'})
+
+    def test_rate_limit(self):
+        with Server(('127.0.0.1', 0), ttl=60, forecast_rate=0.001,
+                    wait=0) as server:
+            self.assertEqual(server.handle('GET', '/forecast/k/1,2')[0], 200)
+            self.assertEqual(server.handle('GET', '/forecast/k/3,4')[0], 429)
+            # Cached responses cost no request.
+            self.assertEqual(server.handle('GET', '/forecast/k/1,2')[0], 200)
+
+    def test_serves_over_tcp_without_installing_transports(self):
+        with self.server:
+            self.assertIsNone(forecastio.TRANSPORT)
+            host, port = self.server.url[len('http://'):].split(':')
+            connection = HTTPConnection(host, int(port))
+            self.assertEqual(_request(connection, 'GET', '/forecast/1,2'),
+                             (200, {'currently': {'temperature': 10}}))
+            status, body = _request(connection, 'POST', '/batch',
+                                    ['/forecast/1,2'])
+            self.assertEqual(body[0]['status'], 200)
+            connection.close()
+        self.assertIsNone(forecastio.TRANSPORT)
+        self.assertIsNone(ipinfo.TRANSPORT)
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'no Unix sockets')
+    def test_serves_over_unix_socket(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'appletea.sock')
+        with Server(path, key='secret'):
+            connection = _UnixConnection(path)
+            self.assertEqual(_request(connection, 'GET', '/forecast/1,2')[0],
+                             200)
+            connection.close()
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
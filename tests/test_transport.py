@@ -0,0 +1,233 @@
+import mock
+import requests
+import requests_mock
+import threading
+import time
+import unittest
+
+from appletea import forecastio
+from appletea.cache import ResponseCache
+from appletea.transport import (
+    HedgedTransport, HTTP2Transport, RateLimitedTransport, RequestsTransport)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class TestRequestsTransport(unittest.TestCase):
+    @requests_mock.Mocker()
+    def test_get_sends_params_and_headers(self, mock):
+        mock.get(requests_mock.ANY, json={})
+        response = RequestsTransport().get('http://x/y', params={'a': 'b'},
+                                           headers={'If-None-Match': '"1"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock.last_request.qs, {'a': ['b']})
+        self.assertEqual(mock.last_request.headers['If-None-Match'], '"1"')
+
+
+class TestRateLimitedTransport(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def transport(self, **kwargs):
+        return RateLimitedTransport(clock=lambda: self.now,
+                                    sleep=self.sleeps.append, **kwargs)
+
+    @requests_mock.Mocker()
+    def test_requests_wait_for_their_token(self, mock):
+        mock.get(requests_mock.ANY, json={})
+        transport = self.transport(rate=2, burst=2)
+        for _ in range(4):
+            transport.get('http://x/y')
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+        self.assertEqual(mock.call_count, 4)
+
+    @requests_mock.Mocker()
+    def test_tokens_refill(self, mock):
+        mock.get(requests_mock.ANY, json={})
+        transport = self.transport(rate=1, wait=0)
+        transport.get('http://x/y')
+        self.now = 1.0
+        transport.get('http://x/y')
+        self.assertEqual(self.sleeps, [])
+
+
+class _Response(object):
+    def __init__(self, n):
+        self.n = n
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+class _ScriptedTransport(object):
+    # Answers the n-th request after delays[n] seconds, or raises errors[n].
+    def __init__(self, delays=(), errors=()):
+        self.delays = dict(delays)
+        self.errors = dict(errors)
+        self.responses = []
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self._lock:
+            n = len(self.responses)
+            self.responses.append(_Response(n))
+        time.sleep(self.delays.get(n, 0))
+        if n in self.errors:
+            raise self.errors[n]
+        return self.responses[n]
+
+
+class TestHedgedTransport(unittest.TestCase):
+    def transport(self, warmup=5, **kwargs):
+        # Warm up with fast requests, then delay or fail the next ones.
+        for name in ('delays', 'errors'):
+            kwargs[name] = dict((n + warmup, v)
+                                for n, v in kwargs.get(name, {}).items())
+        inner = _ScriptedTransport(kwargs.pop('delays'), kwargs.pop('errors'))
+        transport = HedgedTransport(inner, min_samples=warmup, **kwargs)
+        for _ in range(warmup):
+            transport.get('http://x/y')
+        return transport, inner
+
+    def test_requests_are_not_hedged_before_min_samples(self):
+        transport = HedgedTransport(_ScriptedTransport(), min_samples=3)
+        self.assertIsNone(transport.delay())
+        for _ in range(3):
+            transport.get('http://x/y')
+        self.assertEqual(transport.delay(), transport.min_delay)
+        self.assertEqual((transport.requests, transport.hedged), (3, 0))
+
+    def test_slow_request_is_hedged(self):
+        transport, inner = self.transport(delays={0: 0.3})
+        start = time.time()
+        response = transport.get('http://x/y')
+        self.assertLess(time.time() - start, 0.2)
+        self.assertEqual(response.n, 6)
+        self.assertEqual(transport.hedged, 1)
+        # The response of the slower request is closed when it arrives.
+        self.assertTrue(inner.responses[5].closed.wait(2))
+        self.assertFalse(response.closed.is_set())
+
+    def test_hedging_is_budgeted(self):
+        transport, inner = self.transport(ratio=0, burst=1,
+                                          delays={0: 0.1, 2: 0.1})
+        transport.get('http://x/y')
+        self.assertEqual(transport.get('http://x/y').n, 7)
+        self.assertEqual(len(inner.responses), 8)
+        self.assertEqual((transport.requests, transport.hedged), (7, 1))
+
+    def test_errors(self):
+        error = requests.ConnectionError()
+        transport, _ = self.transport(delays={0: 0.1}, errors={0: error})
+        self.assertEqual(transport.get('http://x/y').n, 6)
+        transport, _ = self.transport(delays={0: 0.1},
+                                      errors={0: error, 1: error})
+        with self.assertRaises(requests.ConnectionError):
+            transport.get('http://x/y')
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class TestHTTP2Transport(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+        self.status = 200
+        self.transport = HTTP2Transport(
+            transport=httpx.MockTransport(self.handler))
+        self.addCleanup(self.transport.close)
+
+        self.base_url = forecastio.api.BASE_URL
+        forecastio.api.TRANSPORT = self.transport
+
+    def tearDown(self):
+        forecastio.api.TRANSPORT = None
+
+    def handler(self, request):
+        self.requests.append(request)
+        if request.headers.get('If-None-Match') == '"1"':
+            return httpx.Response(304, headers={'ETag': '"1"'})
+        return httpx.Response(self.status, json={'latitude': 1.0},
+                              headers={'ETag': '"1"'})
+
+    def test_client_is_created_on_first_use(self):
+        transport = HTTP2Transport()
+        self.assertIsNone(transport._client)
+        self.assertIsInstance(transport.client, httpx.Client)
+        transport.close()
+
+    def test_get_returns_requests_response(self):
+        response = self.transport.get('http://x/y', params={'a': 'b'})
+        self.assertIsInstance(response, requests.Response)
+        self.assertEqual(response.json(), {'latitude': 1.0})
+        self.assertEqual(response.headers['etag'], '"1"')
+        self.assertEqual(response.url, 'http://x/y?a=b')
+
+    def test_response_can_be_closed(self):
+        for stream in (False, True):
+            response = self.transport.get('http://x/y', stream=stream)
+            response.close()
+            self.assertTrue(response.raw.response.is_closed)
+
+    def test_hedged_requests_over_transport(self):
+        slow = threading.Event()
+
+        def handler(request):
+            if slow.is_set():
+                slow.clear()
+                time.sleep(0.2)
+            return self.handler(request)
+        transport = HedgedTransport(
+            HTTP2Transport(transport=httpx.MockTransport(handler)),
+            min_samples=3)
+        for _ in range(3):
+            transport.get('http://x/y')
+        closed = threading.Event()
+        close = requests.Response.close
+
+        def close_response(response):
+            close(response)
+            closed.set()
+        with mock.patch.object(requests.Response, 'close', autospec=True,
+                               side_effect=close_response):
+            slow.set()
+            response = transport.get('http://x/y')
+            self.assertEqual(response.json(), {'latitude': 1.0})
+            # The response of the slower request is closed when it arrives.
+            self.assertTrue(closed.wait(2))
+        self.assertEqual(transport.hedged, 1)
+
+    def test_get_forecast_uses_selected_transport(self):
+        forecast = forecastio.get_forecast('key', 1, 2, units='si')
+        self.assertEqual(forecast.json, {'latitude': 1.0})
+        self.assertEqual(str(self.requests[0].url),
+                         '%s/key/1,2?units=si' % self.base_url)
+
+    def test_get_forecast_revalidates_over_transport(self):
+        cache = ResponseCache()
+        forecast = forecastio.get_forecast('key', 1, 2, cache=cache)
+        self.assertIs(forecastio.get_forecast('key', 1, 2, cache=cache),
+                      forecast)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_errors_raise_requests_exceptions(self):
+        self.status = 404
+        with self.assertRaises(requests.HTTPError):
+            forecastio.get_forecast('key', 1, 2)
+
+        def fail(request):
+            raise httpx.ConnectError('refused', request=request)
+        transport = HTTP2Transport(transport=httpx.MockTransport(fail))
+        with self.assertRaises(requests.ConnectionError):
+            transport.get('http://x/y')
+
+    def test_stream_forecast_over_transport(self):
+        items = list(forecastio.stream_forecast('key', 1, 2))
+        self.assertEqual(items, [('latitude', 1.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()